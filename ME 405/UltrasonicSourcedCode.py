@@ -22,7 +22,15 @@ class HCSR04:
     Driver to use the untrasonic sensor HC-SR04.
     The sensor range is between 2cm and 4m.
     The timeouts received listening to echo pin are converted to OSError('Out of range')
+    Distances can also be measured without blocking, with start_ping(),
+    ping_done() and ping_inch().
     """
+    # Stages of a measurement started by start_ping()
+    IDLE = 0
+    WAIT_RISE = 1
+    WAIT_FALL = 2
+    DONE = 3
+
     # echo_timeout_us is based in chip range limit (400cm)
     def __init__(self, trigger_pin, echo_pin, echo_timeout_us=500*2*30):
         """
@@ -39,6 +47,14 @@ class HCSR04:
         # Init echo pin (in)
         self.echo = Pin(echo_pin, mode=Pin.IN, pull=None)
 
+        # State of a measurement started by start_ping(): the times of the
+        # trigger and of the echo pulse's edges, and how far it has got
+        self._sent = 0
+        self._rise = 0
+        self._fall = 0
+        self._stage = self.IDLE
+        self._irq_set = False
+
     def _send_pulse_and_wait(self):
         """
         Send the pulse to trigger and listen on echo pin.
@@ -58,6 +74,77 @@ class HCSR04:
                 raise OSError('Out of range')
             raise ex
 
+    def start_ping(self):
+        """
+        Send the trigger pulse and return without waiting for the echo.
+        The edges of the echo pulse are timed by a pin interrupt; call
+        ping_done() later to find out whether the measurement has finished,
+        then ping_us() or ping_inch() to get the result. Only the 15 us of
+        the trigger pulse is spent waiting here.
+        """
+        if not self._irq_set:
+            self.echo.irq(handler=self._echo_edge,
+                          trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING, hard=True)
+            self._irq_set = True
+
+        self._stage = self.WAIT_RISE
+        self.trigger.value(0) # Stabilize the sensor
+        time.sleep_us(5)
+        self.trigger.value(1)
+        # Send a 10us pulse.
+        time.sleep_us(10)
+        self.trigger.value(0)
+        self._sent = time.ticks_us()
+
+    def _echo_edge(self, pin):
+        """
+        Interrupt handler which notes the times of the echo pulse's rising
+        and falling edges. It allocates no memory.
+        """
+        now = time.ticks_us()
+        if pin.value():
+            if self._stage == self.WAIT_RISE:
+                self._rise = now
+                self._stage = self.WAIT_FALL
+        elif self._stage == self.WAIT_FALL:
+            self._fall = now
+            self._stage = self.DONE
+
+    def ping_done(self):
+        """
+        Check whether the measurement started by start_ping() has finished,
+        either because the echo pulse has ended or because echo_timeout_us
+        has passed since the trigger pulse.
+        """
+        stage = self._stage
+        if stage == self.DONE:
+            return True
+        if stage == self.IDLE:
+            return False
+        return time.ticks_diff(time.ticks_us(), self._sent) > self.echo_timeout_us
+
+    def ping_us(self):
+        """
+        Get the length in microseconds of the echo pulse timed after
+        start_ping(), once ping_done() has returned True. As with
+        machine.time_pulse_us(), -2 means the pulse never started and -1 that
+        it didn't end before the timeout.
+        """
+        stage = self._stage
+        self._stage = self.IDLE
+        if stage == self.DONE:
+            return time.ticks_diff(self._fall, self._rise)
+        if stage == self.WAIT_FALL:
+            return -1
+        return -2
+
+    def ping_inch(self):
+        """
+        Get the distance in inches measured after start_ping(), once
+        ping_done() has returned True. It's negative if no echo was timed.
+        """
+        return (self.ping_us() / 2) / 74.1
+
     def distance_mm(self):
         """
         Get the distance in milimeters without floating point operations.
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+## @file coasync.py
+#  This file contains a scheduler which runs the tasks in a @c cotask.TaskList
+#  on the @c uasyncio event loop (or @c asyncio on a desktop computer) rather
+#  than with one of the task list's own scheduling methods. Each task is run
+#  by a coroutine of its own which sleeps until the task's next run time or
+#  until the task's @c go() method is called, so the event loop sleeps when
+#  no task needs to run and other coroutines, such as ones which await data
+#  from a UART, can share the CPU with the tasks.
+#
+#  The tasks themselves aren't changed: each is still a generator which
+#  yields its state, with the same period, priority, overrun policy and
+#  profiling as under @c TaskList.pri_sched(). When several tasks are ready
+#  at once, the coroutines of lower priority tasks give way until the higher
+#  priority tasks have run. Tasks which wait with @c Task.park(), as in
+#  @c task_share.Queue.get_wait(), are woken by @c go() or by their timeouts.
+#
+#    Example code:
+#    @code
+#    import coasync
+#    create_tasks ()
+#    coasync.AsyncRunner (cotask.task_list).run ()
+#    @endcode
+#
+#  @copyright This program is released under the GNU Public License,
+#  version 3.0.
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+import utime
+import cotask
+
+
+class _Waker:
+    """ This class wakes the coroutine which runs a task when the task's
+    @c go() method is called. On the board a @c ThreadSafeFlag is used, as it
+    may be set from an interrupt service routine; under @c asyncio an
+    @c Event is used, set through the event loop so that @c go() may be
+    called from other threads. """
+
+    def __init__ (self):
+        """ Create the flag or event. This must be done by a coroutine
+        running in the event loop. """
+
+        if hasattr (asyncio, 'ThreadSafeFlag'):
+            self._flag = asyncio.ThreadSafeFlag ()
+            self._event = False
+
+            ## The method which is called to wake the coroutine
+            self.set = self._flag.set
+        else:
+            self._flag = asyncio.Event ()
+            self._event = True
+            loop = asyncio.get_running_loop ()
+            self.set = lambda: loop.call_soon_threadsafe (self._flag.set)
+
+
+    async def wait (self, timeout_us):
+        """ Wait until the flag is set or the time runs out.
+        @param timeout_us The longest time to wait in microseconds, or
+            @c None to wait as long as it takes """
+
+        if timeout_us is None:
+            await self._flag.wait ()
+        else:
+            try:
+                await asyncio.wait_for (self._flag.wait (),
+                                        timeout_us / 1000000)
+            except asyncio.TimeoutError:
+                pass
+        if self._event:
+            self._flag.clear ()
+
+
+class AsyncRunner:
+    """ This class runs the tasks in a task list with a coroutine for each
+    task on the @c asyncio event loop. """
+
+    def __init__ (self, task_list = cotask.task_list):
+        """ Set up to run the tasks in a task list.
+        @param task_list The task list whose tasks are to be run """
+
+        self._task_list = task_list
+
+        ## The number of times a task's coroutine gave way to a higher
+        #  priority task which was ready to run at the same time
+        self.yields = 0
+
+
+    def _ready_above (self, task, now):
+        """ Check whether a task with higher priority than the given one is
+        ready to run, so that the given task should let it run first.
+        @param task The task which is about to run
+        @param now The current time in microseconds from @c utime.ticks_us()
+        @return @c True if a higher priority task is ready """
+
+        for pri in self._task_list.pri_list:
+            if pri[0] <= task.priority:
+                return False
+            for other in pri[2:]:
+                if other.go_flag:
+                    return True
+                if (other.period != None and not other._parked
+                        and utime.ticks_diff (now, other._next_run) > 0):
+                    return True
+        return False
+
+
+    async def _run_task (self, task):
+        """ The coroutine which runs one task. It sleeps until the task's
+        next run time, until its @c go() method is called or until its wait
+        in @c Task.park() times out, then runs the task once it has given
+        way to any higher priority tasks which are ready.
+        @param task The task to be run """
+
+        waker = _Waker ()
+        task._waker = waker.set
+
+        while True:
+            now = utime.ticks_us ()
+            if task.period != None:
+                task._release (now)
+            if task._parked:
+                task._wake (now)
+
+            if task.go_flag:
+                while self._ready_above (task, utime.ticks_us ()):
+                    self.yields += 1
+                    await asyncio.sleep (0)
+                task._run ()
+                await asyncio.sleep (0)
+                continue
+
+            # Sleep until this task might be ready to run
+            if task._parked:
+                timeout = None
+                if task._wake_at is not None:
+                    timeout = utime.ticks_diff (task._wake_at, now)
+            elif task.period != None:
+                timeout = utime.ticks_diff (task._next_run, now) + 1
+            else:
+                timeout = None
+            await waker.wait (timeout)
+
+
+    async def _main (self, seconds):
+        """ Start a coroutine for each task, then wait for the given time.
+        @param seconds How long to run, or @c None to run forever """
+
+        for pri in self._task_list.pri_list:
+            for task in pri[2:]:
+                asyncio.create_task (self._run_task (task))
+
+        if seconds is None:
+            await asyncio.Event ().wait ()
+        else:
+            await asyncio.sleep (seconds)
+
+
+    def run (self, seconds = None):
+        """ Run the tasks on the event loop.
+        @param seconds How long to run, or @c None to run forever """
+
+        try:
+            asyncio.run (self._main (seconds))
+        finally:
+            for pri in self._task_list.pri_list:
+                for task in pri[2:]:
+                    task._waker = None
@@ -12,11 +12,90 @@
 #  @copyright This program is copyrighted by JR Ridgely and released under the
 #  GNU Public License, version 3.0. 
 
-import gc                              # Memory allocation garbage collector
+import array                           # Preallocated transition traces
 import utime                           # Micropython version of time library
+import pyb                             # Used to wait for interrupts when idle
 import micropython                     # This shuts up incorrect warnings
 
 
+## The number of buckets in each run time and lateness histogram. Bucket 0
+#  counts times of 0 and bucket 1 times of 1 microsecond; after that there
+#  are two buckets for each power of two, so the last bucket begins at about
+#  12 seconds
+HIST_SIZE = 48
+
+
+@micropython.native
+def hist_bucket (usec):
+    """ Find the histogram bucket into which a time falls. There are two 
+    buckets per power of two, holding times from @c (2*2**b) to 
+    @c (3*2**b - 1) and from @c (3*2**b) to @c (4*2**b - 1) microseconds. 
+    @param usec The time in microseconds
+    @return The index of the bucket, from 0 to @c HIST_SIZE - 1 """
+
+    if usec < 2:
+        return usec if usec > 0 else 0
+    bits = 0
+    while usec > 3:
+        usec >>= 1
+        bits += 1
+    bucket = 2 * bits + usec
+    return bucket if bucket < HIST_SIZE else HIST_SIZE - 1
+
+
+def hist_limit (bucket):
+    """ Find the longest time which falls into a histogram bucket.
+    @param bucket The index of the bucket
+    @return The upper limit of the bucket in microseconds """
+
+    if bucket < 2:
+        return bucket
+    bits = (bucket - 2) >> 1
+    return ((bucket - 2 * bits + 1) << bits) - 1
+
+
+def hist_percentile (hist, fraction):
+    """ Estimate a percentile of the times counted in a histogram. The upper
+    limit of the bucket holding the percentile is given, so the true value
+    is no greater than the estimate and at least two thirds of it.
+    @param hist A histogram array made by a profiled @c Task
+    @param fraction The percentile as a fraction, such as 0.95 for p95
+    @return The estimated percentile in microseconds, or 0 if the histogram
+        is empty """
+
+    total = 0
+    for count in hist:
+        total += count
+    if total == 0:
+        return 0
+    target = fraction * total
+    running = 0
+    for bucket in range (len (hist)):
+        running += hist[bucket]
+        if running >= target:
+            return hist_limit (bucket)
+    return hist_limit (len (hist) - 1)
+
+
+## Overrun policy: a timed task which has fallen behind by more than one 
+#  period runs once for each period missed, back to back, until it catches up
+CATCH_UP = 0
+
+## Overrun policy: a timed task which has fallen behind runs once, and its 
+#  next run time is moved to the next time slot in its original schedule, 
+#  skipping the slots which were missed
+SKIP = 1
+
+## Overrun policy: a timed task which has fallen behind runs once, and its 
+#  schedule is moved so that its next run is one period from now
+REALIGN = 2
+
+## The task whose generator is being run by the scheduler, or the last one
+#  which ran. Code called from within a task, such as the waiting methods of
+#  @c task_share.Queue, uses it to find the task which should wait
+running_task = None
+
+
 class Task:
     """ This class implements behavior common to tasks in a cooperative 
     multitasking system which runs in MicroPython. The ability to be scheduled
@@ -48,7 +127,8 @@ class Task:
 
 
     def __init__ (self, run_fun, name = 'NoName', priority = 0, 
-                  period = None, profile = False, trace = False):
+                  period = None, profile = False, trace = False,
+                  trace_size = 100, overrun = CATCH_UP):
         """ Initializes a task object, saving copies of constructor parameters
         and preparing an empty dictionary for states. 
         @param run_fun The function which implements the task's code. It must
@@ -62,8 +142,17 @@ class Task:
             The time can be given in a @c float or @c int; it will be 
             converted to microseconds for internal use by the scheduler
         @param profile Set to @c True to enable run-time profiling 
-        @param trace Set to @c True to generate a list of transitions between
-            states. @b Note: This slows things down and allocates memory. """
+        @param trace Set to @c True to record transitions between states.
+            The most recent @c trace_size transitions are kept in a buffer 
+            which is allocated here, so tracing doesn't allocate memory 
+            while the task runs. States must be integers when tracing
+        @param trace_size The number of transitions which the trace buffer 
+            holds; when it's full, the oldest transitions are overwritten
+        @param overrun What to do when a timed task has fallen behind by a
+            period or more, as after a long stall: @c CATCH_UP (the default)
+            to run it once for each missed period, @c SKIP to skip to the 
+            next slot in its schedule, or @c REALIGN to run it now and start
+            a new schedule from this time """
 
         # The function which is run to implement this task's code. Since it 
         # is a generator, we "run" it here, which doesn't actually run it but
@@ -89,25 +178,60 @@ class Task:
             self.period = period
             self._next_run = None
 
+        # What to do when a timed task falls behind by a period or more
+        self._overrun = overrun
+
         # Flag which causes the task to be profiled, in which the execution
         #  time of the @c run() method is measured and basic statistics kept. 
         self._prof = profile
+
+        # Histograms of run durations and of lateness, counting the times in
+        # log-scale buckets so that percentiles can be estimated. They are
+        # allocated here so that profiling doesn't allocate memory later
+        self._dur_hist = array.array ('I', (HIST_SIZE if profile else 0) 
+                                      * [0])
+        self._late_hist = array.array ('I', (HIST_SIZE if profile else 0) 
+                                       * [0])
         self.reset_profile ()
 
         # The previous state in which the task last ran. It is used to watch
         # for and track state transitions.
         self._prev_state = 0
 
-        # If transition tracing has been enabled, create an empty list in 
-        # which to store transition (time, to-state) stamps
+        # If transition tracing has been enabled, create a ring buffer in 
+        # which to store (time, to-state) pairs. Each time is the number of
+        # microseconds since the previous transition
         self._trace = trace
-        self._tr_data = []
+        self._tr_data = array.array ('i', (2 * trace_size if trace else 0) 
+                                     * [0])
+        self._tr_idx = 0
+        self._tr_count = 0
         self._prev_time = utime.ticks_us ()
 
         ## Flag which is set true when the task is ready to be run by the
         #  scheduler
         self.go_flag = False
 
+        # Flag which is set true while the task is parked, waiting for some
+        # other code to call its @c go() method, and the time at which it
+        # is to be woken anyway, or @c None to wait as long as it takes
+        self._parked = False
+        self._wake_at = None
+
+        # A function which is called by @c go() to wake whatever is running
+        # this task, for schedulers which sleep until a task is ready, such 
+        # as the coroutines of @c coasync.AsyncRunner, or @c None
+        self._waker = None
+
+        # Flag which is set true while a timed task is waiting for its run
+        # time in the heap kept by the task list for @c TaskList.heap_sched()
+        self._in_heap = False
+
+        # The task list to which this task has been appended, which is told
+        # whenever this task's go flag is set so that its schedulers can 
+        # tell at a glance whether any task might be ready, or @c None
+        self._list = None
+
 
     def schedule (self) -> bool:
         """ This method is called by the scheduler; it attempts to run this 
@@ -118,50 +242,62 @@ class Task:
         """
 
         if self.ready ():
+            self._run ()
+            return True
 
-            # Reset the go flag for the next run
-            self.go_flag = False
-
-            # If profiling, save the start time
-            if self._prof:
-                stime = utime.ticks_us ()
-
-            # Run the method belonging to the state which should be run next
-            curr_state = next (self._run_gen)
+        else:
+            return False
 
-            # If profiling or tracing, save timing data
-            if self._prof or self._trace:
-                etime = utime.ticks_us ()
 
-            # If profiling, save timing data
-            if self._prof:
-                self._runs += 1
-                runt = utime.ticks_diff (etime, stime)
-                if self._runs > 2:
-                    self._run_sum += runt
-                    if runt > self._slowest:
-                        self._slowest = runt
-
-            # If transition logic tracing is on, record a transition; if not,
-            # ignore the state. If out of memory, switch tracing off and 
-            # run the memory allocation garbage collector
-            if self._trace:
-                try:
-                    if curr_state != self._prev_state:
-                        self._tr_data.append (
-                            (utime.ticks_diff (etime, self._prev_time),
-                             curr_state))
-                except MemoryError:
-                    self._trace = False
-                    gc.collect ()
-
-                self._prev_state = curr_state
-                self._prev_time = etime
+    def _run (self):
+        """ This method runs the task's generator up to its next @c yield(),
+        keeping profiling and tracing data if they have been enabled. It is 
+        called by @c schedule() once @c ready() has said the task should run, 
+        and directly by schedulers such as @c TaskList.heap_sched() which 
+        keep track of the task's run time themselves. """
 
-            return True
+        global running_task
 
-        else:
-            return False
+        # Reset the go flag for the next run
+        self.go_flag = False
+        running_task = self
+
+        # If profiling, save the start time
+        if self._prof:
+            stime = utime.ticks_us ()
+
+        # Run the method belonging to the state which should be run next
+        curr_state = next (self._run_gen)
+
+        # If profiling or tracing, save timing data
+        if self._prof or self._trace:
+            etime = utime.ticks_us ()
+
+        # If profiling, save timing data
+        if self._prof:
+            self._runs += 1
+            runt = utime.ticks_diff (etime, stime)
+            if self._runs > 2:
+                self._run_sum += runt
+                if runt > self._slowest:
+                    self._slowest = runt
+                self._dur_hist[hist_bucket (runt)] += 1
+
+        # If transition logic tracing is on, record a transition in the ring
+        # buffer, overwriting the oldest one if the buffer is full
+        if self._trace and curr_state != self._prev_state:
+            data = self._tr_data
+            idx = self._tr_idx
+            data[idx] = utime.ticks_diff (etime, self._prev_time)
+            data[idx + 1] = curr_state
+            idx += 2
+            if idx >= len (data):
+                idx = 0
+            self._tr_idx = idx
+            self._tr_count += 1
+
+            self._prev_state = curr_state
+            self._prev_time = etime
 
 
     @micropython.native
@@ -174,23 +310,70 @@ class Task:
 
         # If this task uses a timer, check if it's time to run run() again. If
         # so, set go flag and set the timer to go off at the next run time
+        now = utime.ticks_us ()
         if self.period != None:
-            late = utime.ticks_diff (utime.ticks_us (), self._next_run)
-            if late > 0:
-                self.go_flag = True
-                self._next_run = utime.ticks_diff (self.period, 
-                                                   -self._next_run)
+            self._release (now)
 
-                # If keeping a latency profile, record the data
-                if self._prof:
-                    self._late_sum += late
-                    if late > self._latest:
-                        self._latest = late
+        # A parked task runs only when woken or when its wait has timed out
+        if self._parked:
+            self._wake (now)
 
         # If the task doesn't use a timer, we rely on go_flag to signal ready
         return self.go_flag
 
 
+    @micropython.native
+    def _release (self, now):
+        """ This method checks a timed task's run time against the given time.
+        If the run time has passed, the go flag is set, the timer is set to go
+        off at the next run time, and lateness is recorded if profiling.
+        @param now The current time in microseconds from @c utime.ticks_us()
+        @return @c True if the task was released to run, @c False if not """
+
+        late = utime.ticks_diff (now, self._next_run)
+
+        # A parked task keeps its schedule but isn't released; it runs again
+        # only when it is woken up
+        if self._parked:
+            while late > 0:
+                self._next_run = utime.ticks_diff (self.period, 
+                                                   -self._next_run)
+                late -= self.period
+            return False
+
+        if late > 0:
+            self.go_flag = True
+            if self._list is not None:
+                self._list._pending = True
+
+            # If a whole period or more has been missed, count the overrun 
+            # and move the run time according to the overrun policy
+            if late >= self.period and self._overrun != CATCH_UP:
+                missed = late // self.period
+                self._overruns += 1
+                self._skipped += missed
+                if self._overrun == SKIP:
+                    self._next_run = utime.ticks_diff (
+                        (missed + 1) * self.period, -self._next_run)
+                else:
+                    self._next_run = utime.ticks_diff (self.period, -now)
+            else:
+                if late >= self.period:
+                    self._overruns += 1
+                self._next_run = utime.ticks_diff (self.period, 
+                                                   -self._next_run)
+
+            # If keeping a latency profile, record the data
+            if self._prof:
+                self._late_sum += late
+                if late > self._latest:
+                    self._latest = late
+                self._late_hist[hist_bucket (late)] += 1
+            return True
+
+        return False
+
+
     def reset_profile (self):
         """ This method resets the variables used for execution time 
         profiling. It's also used by @c __init__() to create the variables.
@@ -201,29 +384,71 @@ class Task:
         self._slowest = 0
         self._late_sum = 0
         self._latest = 0
+        self._overruns = 0
+        self._skipped = 0
+        for bucket in range (len (self._dur_hist)):
+            self._dur_hist[bucket] = 0
+            self._late_hist[bucket] = 0
 
 
     def get_trace (self):
         """ This method returns a string containing the task's transition 
-        trace. The trace is a set of tuples, each of which contains a time 
-        and the states from and to which the system transitioned. 
+        trace. Each line contains a time and the states from and to which the
+        system transitioned. If older transitions have been overwritten in 
+        the trace buffer, times are measured from the transition before the 
+        oldest one which was kept, and that one's starting state is unknown.
         @return A possibly quite large string showing state transitions """
 
         tr_str = 'Task ' + self.name + ':'
         if self._trace:
+            size = len (self._tr_data) // 2
+            lost = self._tr_count - size
+            if lost > 0:
+                tr_str += ' ({:d} earlier transitions overwritten)'.format (
+                    lost)
+                first = self._tr_idx
+                last_state = None
+            else:
+                first = 0
+                last_state = 0
             tr_str += '\n'
-            last_state = 0
             total_time = 0.0
-            for item in self._tr_data:
-                total_time += item[0] / 1000000.0
-                tr_str += '{: 12.6f}: {: 2d} -> {:d}\n'.format (total_time, 
-                    last_state, item[1])
-                last_state = item[1]
+            for num in range (min (self._tr_count, size)):
+                idx = (first + 2 * num) % len (self._tr_data)
+                total_time += self._tr_data[idx] / 1000000.0
+                state = self._tr_data[idx + 1]
+                if last_state is None:
+                    tr_str += '{: 12.6f}:  ? -> {:d}\n'.format (total_time, 
+                        state)
+                else:
+                    tr_str += '{: 12.6f}: {: 2d} -> {:d}\n'.format (
+                        total_time, last_state, state)
+                last_state = state
         else:
             tr_str += ' not traced'
         return (tr_str)
 
 
+    def dump_trace (self, stream):
+        """ This method writes the task's transition trace to a stream in 
+        binary form, oldest transition first, without allocating a copy of 
+        the trace buffer. Each transition is a pair of 32-bit signed integers
+        in the board's (little-endian) byte order: the time in microseconds 
+        since the previous transition, then the state to which the task went.
+        @param stream An object with a @c write() method, such as a file, a
+            UART or a @c pyb.USB_VCP
+        @return The number of bytes written """
+
+        view = memoryview (self._tr_data)
+        idx = self._tr_idx
+        if self._tr_count * 2 >= len (self._tr_data):
+            stream.write (view[idx:])
+            stream.write (view[:idx])
+            return len (self._tr_data) * 4
+        stream.write (view[:idx])
+        return idx * 4
+
+
     def go (self):
         """ Method to set a flag so that this task indicates that it's 
         ready to run. This method may be called from an interrupt service 
@@ -231,6 +456,45 @@ class Task:
         process soon. """
 
         self.go_flag = True
+        self._parked = False
+        if self._list is not None:
+            self._list._pending = True
+        if self._waker is not None:
+            self._waker ()
+
+
+    def park (self, timeout_us = None):
+        """ Method which is called from within this task's generator, just 
+        before it yields, to make the task wait until some other code calls
+        its @c go() method. While parked, the task is not run, even if it 
+        runs on a timer; timer run times which pass are skipped. If a go 
+        flag was set while the task was running, the task isn't held up.
+        @param timeout_us The longest time in microseconds for which to wait,
+            after which the task is run anyway, or @c None to wait as long as
+            it takes """
+
+        if timeout_us is None:
+            self._wake_at = None
+        else:
+            self._wake_at = utime.ticks_diff (int (timeout_us), 
+                                              -utime.ticks_us ())
+        self._parked = True
+
+
+    @micropython.native
+    def _wake (self, now):
+        """ Check whether a parked task should be run, either because its
+        go flag has been set or because its wait has timed out.
+        @param now The current time in microseconds from @c utime.ticks_us()
+        @return @c True if the task has been unparked, @c False if not """
+
+        if not self.go_flag:
+            if (self._wake_at is None 
+                    or utime.ticks_diff (now, self._wake_at) < 0):
+                return False
+            self.go_flag = True
+        self._parked = False
+        return True
 
 
     def __repr__ (self):
@@ -253,6 +517,16 @@ class Task:
             if self.period != None:
                 rst += '{: 10.3f}{: 10.3f}'.format (avg_late, 
                                             self._latest / 1000.0)
+            else:
+                rst += '         -         -'
+            for hist in (self._dur_hist, self._late_hist):
+                if hist is self._late_hist and self.period == None:
+                    break
+                for fraction in (0.5, 0.95, 0.99):
+                    rst += '{: 10.3f}'.format (
+                        hist_percentile (hist, fraction) / 1000.0)
+            if self.period != None:
+                rst += '{: 9d}{: 9d}'.format (self._overruns, self._skipped)
         return rst
 
 
@@ -263,7 +537,9 @@ class TaskList:
     scheduler. The task list is sorted by priority so that the scheduler can 
     efficiently look through the list to find the highest priority task which
     is ready to run at any given time. Tasks can also be scheduled in a 
-    simpler "round-robin" fashion. 
+    simpler "round-robin" fashion, or by a priority scheduler which keeps the
+    timed tasks in a heap ordered by run time so that each pass through the
+    scheduler needs to look only at the tasks which are due to run. 
 
     An example showing the use of the task list is given in the documentation
     for class @c Task. """
@@ -278,6 +554,22 @@ class TaskList:
         #  that priority. 
         self.pri_list = []
 
+        # A binary min-heap of the timed tasks which are waiting for their
+        # next run time, ordered by each task's @c _next_run. It is used by
+        # @c heap_sched() so that only tasks whose time has come are looked at
+        self._heap = []
+
+        # Flag which is set whenever some task's go flag may have been set 
+        # since a scheduler last looked through the tasks and found none set,
+        # as by a task's @c go() method or the release of a timed task, and
+        # the earliest time at which a parked task's wait runs out, or 
+        # @c None. While the flag is clear and that time hasn't come, no task
+        # can be ready, so @c heap_sched() and @c edf_sched() needn't look
+        self._pending = False
+        self._wake_due = None
+
+        self.reset_idle ()
+
 
     def append (self, task):
         """ Append a task to the task list. The list will be sorted by task 
@@ -285,6 +577,21 @@ class TaskList:
         task which is ready to run at any given time. 
         @param task The task to be appended to the list """
 
+        self._add_pri (task)
+        task._list = self
+        if task.go_flag or task._parked:
+            self._pending = True
+
+        # Timed tasks also go into the heap of tasks waiting for a run time
+        if task.period != None:
+            self._heap_push (task)
+
+
+    def _add_pri (self, task):
+        """ Add a task to the list for its priority, creating that list if
+        there isn't one yet, and keep the lists sorted by priority.
+        @param task The task to be added """
+
         # See if there's a tasklist with the given priority in the main list
         new_pri = task.priority
         for pri in self.pri_list:
@@ -305,6 +612,55 @@ class TaskList:
         self.pri_list.sort (key=lambda pri: pri[0], reverse=True)
 
 
+    @micropython.native
+    def _heap_push (self, task):
+        """ Put a timed task into the heap of waiting tasks, moving it up the
+        heap until no task above it has a later run time. Times are compared
+        with @c utime.ticks_diff() so that timer wraparound is handled.
+        @param task The task to be put into the heap """
+
+        heap = self._heap
+        heap.append (task)
+        idx = len (heap) - 1
+        while idx > 0:
+            parent = (idx - 1) >> 1
+            if utime.ticks_diff (task._next_run, heap[parent]._next_run) >= 0:
+                break
+            heap[idx] = heap[parent]
+            idx = parent
+        heap[idx] = task
+        task._in_heap = True
+
+
+    @micropython.native
+    def _heap_pop (self):
+        """ Remove the task with the earliest run time from the top of the
+        heap, moving the last task in the heap down to fill the gap.
+        @return The task which had the earliest run time """
+
+        heap = self._heap
+        top = heap[0]
+        top._in_heap = False
+        last = heap.pop ()
+        length = len (heap)
+        if length > 0:
+            idx = 0
+            while True:
+                child = 2 * idx + 1
+                if child >= length:
+                    break
+                if child + 1 < length and utime.ticks_diff (
+                        heap[child + 1]._next_run, heap[child]._next_run) < 0:
+                    child += 1
+                if utime.ticks_diff (heap[child]._next_run, 
+                                     last._next_run) >= 0:
+                    break
+                heap[idx] = heap[child]
+                idx = child
+            heap[idx] = last
+        return top
+
+
     @micropython.native
     def rr_sched (self):
         """ This scheduling method runs tasks in a round-robin fashion. Each
@@ -344,23 +700,370 @@ class TaskList:
                     return
 
 
+    @micropython.native
+    def heap_sched (self):
+        """ This scheduler runs tasks in the same priority based fashion as
+        @c pri_sched(), but it reads the clock only once per call and looks
+        only at the timed tasks whose run times have come. Waiting timed tasks
+        are kept in a heap ordered by run time; the tasks at the top of the 
+        heap whose times have passed are released (their go flags are set) 
+        and taken out of the heap until they have run. Then the highest 
+        priority task whose go flag is set is run, with tasks at the same 
+        priority taking turns in round-robin order as in @c pri_sched().
+        
+        Setting a go flag, whether by @c Task.go() or by releasing a timed 
+        task, also sets a flag in the task list, so a pass in which no task 
+        has become ready looks only at the top of the heap and that flag 
+        rather than at every task. Only when the flag is set are the tasks 
+        looked through, so the time to find that nothing is ready doesn't 
+        grow with the number of tasks.
+        
+        Because this scheduler checks go flags rather than calling each task's
+        @c ready() method, tasks which override @c ready() should be run with
+        @c pri_sched() or @c rr_sched() instead; go flags should be set only
+        through @c Task.go(). One scheduler should be used for the whole run,
+        as the heap is only kept in order by this one.
+        @return @c True if a task was run or @c False if none was ready """
+
+        # Release each waiting timed task whose run time has passed; parked
+        # tasks aren't released, so they go back to wait for their next times
+        now = utime.ticks_us ()
+        heap = self._heap
+        while heap and utime.ticks_diff (now, heap[0]._next_run) > 0:
+            task = self._heap_pop ()
+            if not task._release (now):
+                self._heap_push (task)
+
+        # If no go flag has been set since the tasks were last looked through
+        # and no parked task's wait has run out, there's nothing to run
+        if not self._pending and (self._wake_due is None or utime.ticks_diff (
+                now, self._wake_due) < 0):
+            return False
+        self._pending = False
+
+        # Go down the list of priorities, beginning with the highest, and run
+        # the first task found whose go flag is set or whose wait timed out
+        wake_due = None
+        for pri in self.pri_list:
+            tries = 2
+            length = len (pri)
+            while tries < length:
+                task = pri[pri[1]]
+                tries += 1
+                pri[1] += 1
+                if pri[1] >= length:
+                    pri[1] = 2
+                if task._parked and not task._wake (now):
+                    if task._wake_at is not None and (wake_due is None or 
+                            utime.ticks_diff (task._wake_at, wake_due) < 0):
+                        wake_due = task._wake_at
+                if task.go_flag:
+                    task._run ()
+                    self._ran (task)
+                    return True
+
+        # Every task has been looked at, so the earliest wait is known
+        self._wake_due = wake_due
+        return False
+
+
+    @micropython.native
+    def edf_sched (self):
+        """ This scheduler runs tasks in earliest-deadline-first order. Timed
+        tasks are released from the heap of waiting tasks as in 
+        @c heap_sched(). The deadline of a released task is the end of its 
+        current period, which is its next run time; of all the timed tasks 
+        whose go flags are set, the one with the earliest deadline is run, 
+        with ties going to the higher priority task. Tasks which don't run on
+        a timer have no deadline, so they are run in priority order only when
+        no timed task is ready, as background work. 
+        @return @c True if a task was run or @c False if none was ready """
+
+        # Release each waiting timed task whose run time has passed
+        now = utime.ticks_us ()
+        heap = self._heap
+        while heap and utime.ticks_diff (now, heap[0]._next_run) > 0:
+            task = self._heap_pop ()
+            if not task._release (now):
+                self._heap_push (task)
+
+        # As in heap_sched(), skip looking through the tasks if none can be
+        # ready
+        if not self._pending and (self._wake_due is None or utime.ticks_diff (
+                now, self._wake_due) < 0):
+            return False
+        self._pending = False
+
+        # Find the ready timed task with the earliest deadline, and the
+        # highest priority ready task which doesn't run on a timer
+        best = None
+        background = None
+        wake_due = None
+        for pri in self.pri_list:
+            for idx in range (2, len (pri)):
+                task = pri[idx]
+                if task._parked and not task._wake (now):
+                    if task._wake_at is not None and (wake_due is None or 
+                            utime.ticks_diff (task._wake_at, wake_due) < 0):
+                        wake_due = task._wake_at
+                if not task.go_flag:
+                    continue
+                if task.period == None:
+                    if background is None:
+                        background = task
+                elif best is None or utime.ticks_diff (task._next_run, 
+                                                       best._next_run) < 0:
+                    best = task
+
+        self._wake_due = wake_due
+        if best is None:
+            if background is None:
+                return False
+            best = background
+
+        best._run ()
+        self._ran (best)
+        return True
+
+
+    @micropython.native
+    def _ran (self, task):
+        """ Tidy up after @c heap_sched() or @c edf_sched() has run a task.
+        A timed task waits in the heap again, a wait begun by parking the task
+        is noted, and the task list is marked so that the next pass looks 
+        through the tasks, as others may still be ready.
+        @param task The task which has just been run """
+
+        if task.period != None and not task._in_heap:
+            self._heap_push (task)
+        if task._parked and task._wake_at is not None and (
+                self._wake_due is None or utime.ticks_diff (
+                    task._wake_at, self._wake_due) < 0):
+            self._wake_due = task._wake_at
+        self._pending = True
+
+
+    @micropython.native
+    def idle_sched (self, edf = False):
+        """ This scheduler works as @c heap_sched() does, or as 
+        @c edf_sched() does if @c edf is @c True, but when no task is
+        ready to run it puts the CPU to sleep rather than returning at once to
+        be called again in a busy loop. The CPU is woken by each interrupt, 
+        including the system tick; it goes back to sleep until the earliest
+        run time of a timed task has passed or until an interrupt service 
+        routine calls some task's @c go() method, in which case that task is
+        run as soon as this method is next called. If no task runs on a 
+        timer, the CPU sleeps until the next interrupt and this method returns
+        so that the calling loop can check whether it should keep running.
+        The time spent asleep and the number of wakeups are counted so that
+        the fraction of time spent idle can be reported.
+        @param edf Set to @c True to run tasks in earliest-deadline-first 
+            order rather than by priority
+        @return @c True if a task was run or @c False if the CPU slept """
+
+        if self.edf_sched () if edf else self.heap_sched ():
+            return True
+
+        # Nothing is ready, so sleep until an interrupt sets a go flag or
+        # until the earliest waiting task is due to be released or woken
+        deadline = self.next_deadline ()
+        start = utime.ticks_us ()
+        self.sleeps += 1
+        while not self._go_pending ():
+            if deadline is not None and utime.ticks_diff (
+                    deadline, utime.ticks_us ()) < 0:
+                break
+            pyb.wfi ()
+            self.wakeups += 1
+            if deadline is None:
+                break
+        self.idle_us += utime.ticks_diff (utime.ticks_us (), start)
+
+        return False
+
+
+    @micropython.native
+    def _go_pending (self):
+        """ Check whether any task in the list may have its go flag set, as
+        it will if an interrupt service routine has called its @c go(). The
+        flag kept by the task list is checked rather than each task's.
+        @return @c True if some task may be waiting to be run """
+
+        return self._pending
+
+
+    def next_deadline (self):
+        """ Find the earliest time at which a waiting timed task will become
+        ready to run or a parked task's wait will time out. Tasks which have
+        already been released but haven't run yet are not included, as their 
+        go flags are set; neither are parked timed tasks' run times, as those
+        tasks won't run until they are woken.
+        @return The time in @c utime.ticks_us() units, or @c None if no
+            task is waiting for a time """
+
+        deadline = None
+        for task in self._heap:
+            if not task._parked and (deadline is None or utime.ticks_diff (
+                    task._next_run, deadline) < 0):
+                deadline = task._next_run
+        for pri in self.pri_list:
+            for task in pri[2:]:
+                if task._parked and task._wake_at is not None and (
+                        deadline is None or utime.ticks_diff (
+                            task._wake_at, deadline) < 0):
+                    deadline = task._wake_at
+        return deadline
+
+
+    def reset_idle (self):
+        """ Reset the counters which keep track of the time spent sleeping in
+        @c idle_sched(). It's also used by @c __init__() to create them. """
+
+        ## The total time in microseconds spent asleep in @c idle_sched()
+        self.idle_us = 0
+
+        ## The number of times @c idle_sched() has put the CPU to sleep
+        self.sleeps = 0
+
+        ## The number of times the CPU has been woken by interrupts while
+        #  sleeping, including wakeups which didn't make any task ready
+        self.wakeups = 0
+
+        # The time at which the idle counters were last reset
+        self._idle_start = utime.ticks_us ()
+
+
+    def idle_fraction (self):
+        """ Compute the fraction of time which has been spent asleep in 
+        @c idle_sched() since the idle counters were last reset. 
+        @return The idle fraction, from 0.0 to 1.0 """
+
+        elapsed = utime.ticks_diff (utime.ticks_us (), self._idle_start)
+        if elapsed <= 0:
+            return 0.0
+        return self.idle_us / elapsed
+
+
+    def rate_monotonic (self, base = 1):
+        """ Give the timed tasks rate-monotonic priorities, in which tasks 
+        with shorter periods get higher priorities. Tasks with the same period
+        get the same priority and take turns. The longest period gets 
+        priority @c base, the next longest @c base + 1, and so on. Tasks which
+        don't run on a timer keep the priorities they were given, so an 
+        event-driven task which must respond quickly can be given a priority 
+        above all the timed tasks.
+        @param base The priority given to the tasks with the longest period """
+
+        tasks = []
+        for pri in self.pri_list:
+            tasks.extend (pri[2:])
+
+        periods = []
+        for task in tasks:
+            if task.period != None and task.period not in periods:
+                periods.append (task.period)
+        periods.sort (reverse = True)
+
+        self.pri_list = []
+        for task in tasks:
+            if task.period != None:
+                task.priority = base + periods.index (task.period)
+            self._add_pri (task)
+
+
+    def schedulability (self):
+        """ Make a report showing whether the timed tasks can all meet their
+        deadlines, based on the worst run times measured by profiling. The
+        CPU utilization of each task is its worst run time divided by its 
+        period. The total is compared with 100%, the limit for 
+        earliest-deadline-first scheduling, and with the Liu and Layland 
+        bound for rate-monotonic priorities. Then the worst response time of 
+        each task under the current priorities is worked out; as tasks can't 
+        be preempted, a task may have to wait for one run of a lower priority
+        task as well as for the runs of tasks at its own or higher priority. 
+        A task fits if its response time is no longer than its period. Tasks 
+        which don't run on a timer are listed but can't be checked, as their 
+        rate isn't known. Tasks should be profiled and run for long enough 
+        to see their slowest runs before this report is made.
+        @return A string containing the report """
+
+        timed = []
+        for pri in self.pri_list:
+            for task in pri[2:]:
+                if task.period != None:
+                    timed.append (task)
+
+        ret_str = 'TASK             PRI    PERIOD   MAX DUR    UTIL%  ' \
+            'RESPONSE  FITS\n'
+        total = 0.0
+        fits = True
+        for task in timed:
+            util = task._slowest / task.period
+            total += util
+
+            # The longest run of any lower priority task may delay this one
+            block = 0
+            for pri in self.pri_list:
+                if pri[0] < task.priority:
+                    for other in pri[2:]:
+                        block = max (block, other._slowest)
+
+            # Find the time waiting for runs of tasks at this priority or 
+            # higher, going around until it stops growing or is too long
+            wait = block
+            while wait + task._slowest <= task.period:
+                new_wait = block
+                for other in timed:
+                    if other is not task and other.priority >= task.priority:
+                        new_wait += (wait // other.period + 1) * other._slowest
+                if new_wait == wait:
+                    break
+                wait = new_wait
+            response = wait + task._slowest
+            task_fits = response <= task.period
+            fits = fits and task_fits
+
+            ret_str += '{:<16s}{: 4d}{: 10.1f}{: 10.3f}{: 9.1f}{: 10.3f}' \
+                '  {:s}\n'.format (task.name, task.priority, 
+                task.period / 1000.0, task._slowest / 1000.0, 100.0 * util,
+                response / 1000.0, 'yes' if task_fits else 'NO')
+            if not task._prof or task._runs <= 2:
+                ret_str += '    (not profiled; run time unknown)\n'
+
+        for pri in self.pri_list:
+            for task in pri[2:]:
+                if task.period == None:
+                    ret_str += '{:<16s}{: 4d}         -{: 10.3f}        -' \
+                        '         -  -\n'.format (task.name, task.priority,
+                        task._slowest / 1000.0)
+
+        count = len (timed)
+        bound = count * (2.0 ** (1.0 / count) - 1.0) if count > 0 else 1.0
+        ret_str += 'UTILIZATION {:.1f}%  EDF LIMIT 100.0%  RM BOUND ' \
+            '{:.1f}%\n'.format (100.0 * total, 100.0 * bound)
+        ret_str += 'TASK SET {:s}\n'.format ('FITS' if fits and total <= 1.0 
+                                             else 'DOES NOT FIT')
+        return ret_str
+
+
     def __repr__ (self):
         """ Create some diagnostic text showing the tasks in the task list.
         """
 
         ret_str = 'TASK             PRI    PERIOD    RUNS   AVG DUR   MAX ' \
-            'DUR  AVG LATE  MAX LATE\n'
+            'DUR  AVG LATE  MAX LATE   P50 DUR   P95 DUR   P99 DUR  P50 ' \
+            'LATE  P95 LATE  P99 LATE  OVERRUN  SKIPPED\n'
         for pri in self.pri_list:
             for task in pri[2:]:
                 ret_str += str (task) + '\n'
 
+        if self.sleeps > 0:
+            ret_str += 'IDLE {: 6.1f}%  SLEEPS {:d}  WAKEUPS {:d}\n'.format (
+                100.0 * self.idle_fraction (), self.sleeps, self.wakeups)
+
         return ret_str
 
 
 ## This is @b the main task list which is created for scheduling when 
 #  @c cotask.py is imported into a program. 
 task_list = TaskList ()
-
-
-
-
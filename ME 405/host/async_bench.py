@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+## @file async_bench.py
+#  This program compares running a task set with @c coasync.AsyncRunner on
+#  the @c asyncio event loop against running it with @c TaskList.pri_sched()
+#  in a busy loop and with the tickless @c TaskList.idle_sched(). It runs on
+#  the host with the stand-in @c utime, @c pyb and @c micropython modules in
+#  this directory and the host's real clock. The task set is the one used by
+#  @c idle_check.py: timed tasks with the periods of the tasks in @c main.py
+#  which keep the CPU busy for a short time each run, and an event-driven
+#  task whose @c go() method is called at random times by a thread standing
+#  in for an interrupt service routine.
+#
+#  For each scheduler, the fraction of the time the CPU was busy, the 50th
+#  and 99th percentile lateness of the timed tasks, and the time from
+#  @c go() until the event-driven task ran are printed.
+#  @code
+#  python async_bench.py --seconds 3
+#  @endcode
+#
+#  @copyright This program is released under the GNU Public License,
+#  version 3.0.
+
+import os
+import sys
+sys.path.insert (1, os.path.dirname (os.path.dirname (os.path.abspath (
+    __file__))))
+
+import argparse
+import random
+import threading
+import time
+
+import utime
+import cotask
+import coasync
+from idle_check import busy_task, PERIODS, WORK_US
+
+
+## The schedulers which are compared
+MODES = ('pri_sched', 'idle_sched', 'asyncio')
+
+
+def run_mode (mode, seconds, isr_ms):
+    """ Run the task set under one scheduler for the given time.
+    @param mode One of the names in @c MODES
+    @param seconds How long to run the scheduler
+    @param isr_ms The mean time in milliseconds between simulated interrupts
+    @return A dictionary of results """
+
+    tasks = cotask.TaskList ()
+    timed = []
+    for num, period in enumerate (PERIODS):
+        task = cotask.Task (busy_task (WORK_US), name = 'Timed_' + str (num),
+                            priority = len (PERIODS) - num, period = period,
+                            profile = True)
+        tasks.append (task)
+        timed.append (task)
+
+    # An event-driven task which records how long after its go() it ran
+    latencies = []
+    go_time = [None]
+
+    def event_fun ():
+        while True:
+            if go_time[0] is not None:
+                latencies.append (utime.ticks_diff (utime.ticks_us (),
+                                                    go_time[0]))
+                go_time[0] = None
+            yield (0)
+
+    event = cotask.Task (event_fun, name = 'Event', priority = 8)
+    tasks.append (event)
+
+    # A thread stands in for the interrupt service routine calling go()
+    stop = threading.Event ()
+    rand = random.Random (405)
+
+    def isr ():
+        while not stop.wait (rand.expovariate (1000.0 / isr_ms)):
+            go_time[0] = utime.ticks_us ()
+            event.go ()
+
+    isr_thread = threading.Thread (target = isr, daemon = True)
+    isr_thread.start ()
+
+    cpu_start = time.process_time ()
+    wall_start = time.perf_counter ()
+    if mode == 'asyncio':
+        coasync.AsyncRunner (tasks).run (seconds)
+    else:
+        sched = getattr (tasks, mode)
+        while time.perf_counter () - wall_start < seconds:
+            sched ()
+    cpu = (time.process_time () - cpu_start) / (time.perf_counter ()
+                                                - wall_start)
+    stop.set ()
+    isr_thread.join ()
+
+    # Combine the lateness histograms of the timed tasks
+    late = [0] * cotask.HIST_SIZE
+    for task in timed:
+        for bucket in range (cotask.HIST_SIZE):
+            late[bucket] += task._late_hist[bucket]
+
+    latencies.sort ()
+    return {'cpu': cpu,
+            'late_p50': cotask.hist_percentile (late, 0.5),
+            'late_p99': cotask.hist_percentile (late, 0.99),
+            'runs': sum (task._runs for task in timed),
+            'expected': sum (seconds * 1000.0 / period for period in PERIODS),
+            'go_med': latencies[len (latencies) // 2] if latencies else 0,
+            'go_max': latencies[-1] if latencies else 0}
+
+
+def main ():
+    """ Run the task set under each scheduler and print the results. """
+
+    parser = argparse.ArgumentParser (description = __doc__)
+    parser.add_argument ('--seconds', type = float, default = 2.0,
+                         help = 'time to run each scheduler')
+    parser.add_argument ('--isr-ms', type = float, default = 7.0,
+                         help = 'mean time between simulated interrupts')
+    args = parser.parse_args ()
+
+    print ('{:<11s} {:>6s} {:>8s} {:>9s} {:>9s} {:>10s} {:>10s}'.format (
+           'SCHEDULER', 'CPU%', 'RUNS%', 'LATE P50', 'LATE P99',
+           'GO MED us', 'GO MAX us'))
+    for mode in MODES:
+        res = run_mode (mode, args.seconds, args.isr_ms)
+        print ('{:<11s} {: 6.1f} {: 8.1f} {: 9d} {: 9d} {: 10d} {: 10d}'
+               .format (mode, 100.0 * res['cpu'],
+                        100.0 * res['runs'] / res['expected'],
+                        res['late_p50'], res['late_p99'], res['go_med'],
+                        res['go_max']))
+
+
+if __name__ == '__main__':
+    main ()
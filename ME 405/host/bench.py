@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+#
+## @file bench.py
+#  This program measures the cost of the hot paths in @c cotask.py and
+#  @c task_share.py on the host, using the stand-in @c utime, @c pyb and
+#  @c micropython modules in this directory, so that a change which slows
+#  them down can be found without flashing the board. It times:
+#  * one pass of @c pri_sched(), @c rr_sched() and @c heap_sched() through
+#    task lists of several sizes in which no task is due to run
+#  * @c Task.schedule() of a ready task with profiling and tracing off and on
+#  * @c Queue.put() and @c get() pairs with and without thread protection,
+#    the same through an @c SPSCQueue, and block copies with @c put_many()
+#    and @c get_many()
+#  * @c Share.put() and @c get(), and @c Flags.test()
+#
+#  A stopped @c vclock.VirtualClock stands in for the board's clock, as 
+#  reading the host's clock is a system call whose time would swamp the 
+#  code being measured. Each time is the best of several repeats, in 
+#  nanoseconds per operation.
+#  The results are written as JSON; given an earlier results file, the
+#  program compares against it and exits with status 1 if anything has
+#  become slower than the tolerance allows:
+#  @code
+#  python bench.py --out baseline.json
+#  ...change something...
+#  python bench.py --compare baseline.json --tolerance 0.25
+#  @endcode
+#  Times are taken from the process's CPU time, so time during which other
+#  programs run isn't counted, but on a busy or virtual machine they still
+#  vary by tens of percent from run to run; the default tolerance of 50% 
+#  allows for that, and a smaller one can be used on a quiet computer.
+#  Since the host is much faster than the board and runs CPython rather than
+#  MicroPython, the times are useful for comparing versions of the code on
+#  the same computer, not as estimates of times on the board. To make files
+#  from different computers somewhat comparable, and to keep changes in the
+#  computer's speed from causing false alarms, each time is also given in
+#  passes of an empty Python loop timed along with it, and comparisons use
+#  those ratios.
+#
+#  @copyright This program is released under the GNU Public License,
+#  version 3.0.
+
+import os
+import sys
+sys.path.insert (1, os.path.dirname (os.path.dirname (os.path.abspath (
+    __file__))))
+
+import argparse
+import json
+import platform
+import time
+
+import micropython
+import vclock
+import cotask
+import task_share
+
+
+## The numbers of tasks in the task lists whose scheduling passes are timed
+TASK_COUNTS = (1, 4, 8, 16, 32)
+
+## The number of items in the blocks copied by @c put_many() and @c get_many()
+BLOCK_SIZE = 32
+
+
+def idle_fun ():
+    """ A task function which does nothing but yield its state. """
+
+    while True:
+        yield (0)
+
+
+def counting_fun ():
+    """ A task function which goes through four states in turn, so that
+    tracing has transitions to record. """
+
+    state = 0
+    while True:
+        state = (state + 1) & 3
+        yield (state)
+
+
+def bench_loop (count):
+    """ An empty loop, whose time is used to scale the other results. """
+
+    for _ in range (count):
+        pass
+
+
+def best_ns (fun, count, repeat):
+    """ Time a function which performs an operation many times. Each repeat
+    is timed along with an empty loop of as many passes, run just before it,
+    so that the ratio of the fastest times of the two isn't thrown off if 
+    the computer's speed changes while the benchmarks run.
+    @param fun A function which takes the number of times to perform the
+        operation
+    @param count The number of times to perform the operation in each repeat
+    @param repeat The number of repeats, of which the fastest is used
+    @return A tuple holding the time per operation in nanoseconds and that 
+        time divided by the time of one pass of the empty loop """
+
+    best = None
+    best_loop = None
+    for _ in range (repeat):
+        start = time.process_time_ns ()
+        bench_loop (count)
+        loop = time.process_time_ns () - start
+        start = time.process_time_ns ()
+        fun (count)
+        elapsed = time.process_time_ns () - start
+        if best is None or elapsed < best:
+            best = elapsed
+        if best_loop is None or loop < best_loop:
+            best_loop = loop
+    return (best / count, best / best_loop)
+
+
+def make_list (num_tasks):
+    """ Make a task list in which no task is due to run for a long time.
+    The period must be well under half the range of the tick counter, 
+    2**29 microseconds, or the tasks' run times would look as if they had
+    already passed.
+    @param num_tasks The number of tasks in the list
+    @return The task list """
+
+    tasks = cotask.TaskList ()
+    for num in range (num_tasks):
+        tasks.append (cotask.Task (idle_fun, name = 'Task_' + str (num),
+                                   priority = num % 4, period = 100000))
+    return tasks
+
+
+def bench_sched (method):
+    """ Make a benchmark of one pass of a scheduler through a task list.
+    @param method The name of the scheduling method of @c TaskList
+    @return A function which makes the benchmark for a number of tasks """
+
+    def make (num_tasks):
+        tasks = make_list (num_tasks)
+        sched = getattr (tasks, method)
+        next_runs = [task._next_run for pri in tasks.pri_list 
+                     for task in pri[2:]]
+
+        def run (count):
+            for _ in range (count):
+                sched ()
+
+            # Make sure only idle passes were timed, not task runs
+            if any (task.go_flag for pri in tasks.pri_list 
+                    for task in pri[2:]) or next_runs != [
+                        task._next_run for pri in tasks.pri_list 
+                        for task in pri[2:]]:
+                raise RuntimeError ('a task was released during the idle '
+                                    'passes of {:s}'.format (method))
+        return run
+    return make
+
+
+def bench_schedule (profile, trace):
+    """ Make a benchmark of running a ready task through @c Task.schedule().
+    @param profile Whether the task is profiled
+    @param trace Whether the task's transitions are traced
+    @return The benchmark function """
+
+    task = cotask.Task (counting_fun, name = 'Bench', profile = profile,
+                        trace = trace)
+
+    def run (count):
+        for _ in range (count):
+            task.go_flag = True
+            task.schedule ()
+    return run
+
+
+def bench_queue (queue):
+    """ Make a benchmark of putting an item into a queue and getting it out.
+    @param queue The queue to use
+    @return The benchmark function """
+
+    def run (count):
+        for num in range (count):
+            queue.put (num & 0x7F)
+            queue.get ()
+    return run
+
+
+def bench_block (queue):
+    """ Make a benchmark of copying a block of items into a queue and out.
+    @param queue The queue to use, with room for @c BLOCK_SIZE items
+    @return The benchmark function """
+
+    src = bytearray (range (BLOCK_SIZE))
+    dst = bytearray (BLOCK_SIZE)
+
+    def run (count):
+        for _ in range (count):
+            queue.put_many (src)
+            queue.get_many (dst)
+    return run
+
+
+def bench_share (share):
+    """ Make a benchmark of writing a share and reading it back.
+    @param share The share to use
+    @return The benchmark function """
+
+    def run (count):
+        for num in range (count):
+            share.put (num & 0x7F)
+            share.get ()
+    return run
+
+
+def bench_flags (flags):
+    """ Make a benchmark of testing a flag in a flag register.
+    @param flags The flag register to use
+    @return The benchmark function """
+
+    def run (count):
+        for _ in range (count):
+            flags.test (1)
+    return run
+
+
+def run_all (count, repeat):
+    """ Run every benchmark.
+    @param count The number of operations timed in each repeat
+    @param repeat The number of repeats of each benchmark
+    @return A dictionary from benchmark name to a tuple holding the time per 
+        operation in nanoseconds and in passes of an empty loop """
+
+    results = {}
+    for method in ('pri_sched', 'rr_sched', 'heap_sched'):
+        make = bench_sched (method)
+        for num_tasks in TASK_COUNTS:
+            name = '{:s}/{:d}'.format (method, num_tasks)
+            results[name] = best_ns (make (num_tasks), count // num_tasks,
+                                     repeat)
+
+    for profile, trace in ((False, False), (True, False), (False, True),
+                           (True, True)):
+        name = 'schedule/profile={:d},trace={:d}'.format (profile, trace)
+        results[name] = best_ns (bench_schedule (profile, trace), count,
+                                 repeat)
+
+    for protect in (True, False):
+        queue = task_share.Queue ('B', 16, thread_protect = protect,
+                                  name = 'Bench')
+        name = 'queue_put_get/protect={:d}'.format (protect)
+        results[name] = best_ns (bench_queue (queue), count, repeat)
+    results['queue_put_get/spsc'] = best_ns (
+        bench_queue (task_share.SPSCQueue ('B', 16, name = 'Bench')),
+        count, repeat)
+
+    for protect in (True, False):
+        queue = task_share.Queue ('B', BLOCK_SIZE, thread_protect = protect,
+                                  name = 'Bench')
+        name = 'queue_block_{:d}/protect={:d}'.format (BLOCK_SIZE, protect)
+        results[name] = best_ns (bench_block (queue), count // 4, repeat)
+    name = 'queue_block_{:d}/spsc'.format (BLOCK_SIZE)
+    results[name] = best_ns (
+        bench_block (task_share.SPSCQueue ('B', BLOCK_SIZE, name = 'Bench')),
+        count // 4, repeat)
+
+    for protect in (True, False):
+        share = task_share.Share ('B', thread_protect = protect,
+                                  name = 'Bench')
+        name = 'share_put_get/protect={:d}'.format (protect)
+        results[name] = best_ns (bench_share (share), count, repeat)
+    results['flags_test'] = best_ns (
+        bench_flags (task_share.Flags (('A', 'B'), name = 'Bench')),
+        count, repeat)
+
+    # Don't leave the benchmark queues and shares in the global list
+    del task_share.share_list[:]
+    return results
+
+
+def compare (results, baseline, tolerance):
+    """ Compare results with a baseline, using the times in empty loop passes.
+    @param results The new results, from @c run_all()
+    @param baseline The baseline, as loaded from a results file
+    @param tolerance The fraction by which a result may be slower
+    @return A list of descriptions of results which are too slow """
+
+    slow = []
+    for name, base in sorted (baseline['results'].items ()):
+        if name not in results:
+            continue
+        ratio = results[name][1] / base['loops']
+        if ratio > 1.0 + tolerance:
+            slow.append ('{:<40s} {: 8.1f} loops, was {: 8.1f} ({:+.0f}%)'
+                         .format (name, results[name][1], base['loops'],
+                                  100.0 * (ratio - 1.0)))
+    return slow
+
+
+def main ():
+    """ Run the benchmarks, print and save the results, and compare them
+    with a baseline if one is given.
+    @return The exit status, 0 if nothing is too slow or 1 if something is """
+
+    parser = argparse.ArgumentParser (description = __doc__)
+    parser.add_argument ('--count', type = int, default = 5000,
+                         help = 'operations timed in each repeat')
+    parser.add_argument ('--repeat', type = int, default = 20,
+                         help = 'repeats of each benchmark; the best is used')
+    parser.add_argument ('--out', metavar = 'FILE',
+                         help = 'save the results as JSON')
+    parser.add_argument ('--compare', metavar = 'FILE',
+                         help = 'compare with results saved earlier')
+    parser.add_argument ('--tolerance', type = float, default = 0.5,
+                         help = 'fraction by which a result may be slower')
+    args = parser.parse_args ()
+
+    # The clock is stopped, so that reading it is as cheap as it is on the
+    # board rather than a system call with a time which varies a lot
+    vclock.use (vclock.VirtualClock (0))
+    results = run_all (args.count, args.repeat)
+
+    print ('{:<40s} {:>10s} {:>8s}'.format ('BENCHMARK', 'NS/OP', 'LOOPS'))
+    for name, (nsec, loops) in results.items ():
+        print ('{:<40s} {: 10.1f} {: 8.1f}'.format (name, nsec, loops))
+
+    if args.out:
+        with open (args.out, 'w') as outfile:
+            json.dump ({'python': platform.python_version (),
+                        'machine': platform.machine (),
+                        'results': {name: {'ns': nsec, 'loops': loops}
+                                    for name, (nsec, loops) 
+                                    in results.items ()}},
+                       outfile, indent = 2)
+
+    if args.compare:
+        with open (args.compare) as infile:
+            baseline = json.load (infile)
+        slow = compare (results, baseline, args.tolerance)
+        if slow:
+            print ('\nSlower than {:s} by more than {:.0f}%:'.format (
+                   args.compare, 100.0 * args.tolerance))
+            for line in slow:
+                print ('  ' + line)
+            return 1
+        print ('\nNo result is more than {:.0f}% slower than {:s}'.format (
+               100.0 * args.tolerance, args.compare))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit (main ())
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+## @file idle_check.py
+#  This program measures how much of the time the cooperative scheduler 
+#  spends asleep when run in tickless mode by @c TaskList.idle_sched(), 
+#  compared with the busy loop run by @c TaskList.heap_sched(). It runs on
+#  the host with the stand-in @c utime, @c pyb and @c micropython modules in
+#  this directory. A task set with the same periods as the one in @c main.py
+#  is run, and a thread standing in for the infrared capture interrupt calls 
+#  an event-driven task's @c go() method at random times so that the time 
+#  taken to wake from sleep can be measured.
+#
+#  The program exits with status 1 if the idle fraction in tickless mode is
+#  below the given minimum or if any timed task ran too few times, so it can
+#  be used as a regression check:
+#  @code
+#  python idle_check.py --seconds 2 --min-idle 0.8
+#  @endcode
+#
+#  @copyright This program is released under the GNU Public License, 
+#  version 3.0. 
+
+import os
+import sys
+sys.path.insert (1, os.path.dirname (os.path.dirname (os.path.abspath (
+    __file__))))
+
+import argparse
+import random
+import threading
+import time
+
+import utime
+import cotask
+
+
+## Periods in milliseconds of the timed tasks in @c main.py
+PERIODS = (20, 15, 10, 10, 10, 10, 10)
+
+## Time in microseconds for which each timed task keeps the CPU busy
+WORK_US = 50
+
+
+def busy_task (work_us):
+    """ Make a task function which keeps the CPU busy for a short time each
+    time it runs, as a task reading sensors or writing outputs would.
+    @param work_us The time in microseconds to stay busy each run
+    @return The generator function for the task """
+
+    def run ():
+        while True:
+            start = utime.ticks_us ()
+            while utime.ticks_diff (utime.ticks_us (), start) < work_us:
+                pass
+            yield (0)
+    return run
+
+
+def run_mode (mode, seconds, isr_ms):
+    """ Run the task set under one scheduler for the given time.
+    @param mode Either @c 'spin' for @c heap_sched() in a busy loop or
+        @c 'tickless' for @c idle_sched()
+    @param seconds How long to run the scheduler
+    @param isr_ms The mean time in milliseconds between simulated interrupts
+    @return A dictionary of results """
+
+    tasks = cotask.TaskList ()
+    timed = []
+    for num, period in enumerate (PERIODS):
+        task = cotask.Task (busy_task (WORK_US), name = 'Timed_' + str (num),
+                            priority = len (PERIODS) - num, period = period,
+                            profile = True)
+        tasks.append (task)
+        timed.append (task)
+
+    # An event-driven task which records how long after its go() it ran
+    latencies = []
+    go_time = [None]
+
+    def event_fun ():
+        while True:
+            if go_time[0] is not None:
+                latencies.append (utime.ticks_diff (utime.ticks_us (),
+                                                    go_time[0]))
+                go_time[0] = None
+            yield (0)
+
+    event = cotask.Task (event_fun, name = 'Event', priority = 8, 
+                         profile = True)
+    tasks.append (event)
+
+    # A thread stands in for the interrupt service routine calling go()
+    stop = threading.Event ()
+    rand = random.Random (405)
+
+    def isr ():
+        while not stop.wait (rand.expovariate (1000.0 / isr_ms)):
+            go_time[0] = utime.ticks_us ()
+            event.go ()
+
+    isr_thread = threading.Thread (target = isr, daemon = True)
+    isr_thread.start ()
+
+    tasks.reset_idle ()
+    sched = tasks.idle_sched if mode == 'tickless' else tasks.heap_sched
+    cpu_start = time.process_time ()
+    wall_start = time.perf_counter ()
+    while time.perf_counter () - wall_start < seconds:
+        sched ()
+    cpu = (time.process_time () - cpu_start) / (time.perf_counter () 
+                                                - wall_start)
+    stop.set ()
+    isr_thread.join ()
+
+    latencies.sort ()
+    return {'mode': mode,
+            'idle': tasks.idle_fraction (),
+            'cpu': cpu,
+            'sleeps': tasks.sleeps,
+            'wakeups': tasks.wakeups,
+            'runs': [task._runs for task in timed],
+            'expected': [seconds * 1000.0 / period for period in PERIODS],
+            'lat_med': latencies[len (latencies) // 2] if latencies else 0,
+            'lat_max': latencies[-1] if latencies else 0}
+
+
+def main ():
+    """ Run the task set in both modes, print the results, and check them
+    against the given limits.
+    @return The exit status, 0 if the checks passed or 1 if they didn't """
+
+    parser = argparse.ArgumentParser (description = __doc__)
+    parser.add_argument ('--seconds', type = float, default = 2.0,
+                         help = 'time to run each scheduler mode')
+    parser.add_argument ('--isr-ms', type = float, default = 7.0,
+                         help = 'mean time between simulated interrupts')
+    parser.add_argument ('--min-idle', type = float, default = 0.8,
+                         help = 'lowest acceptable tickless idle fraction')
+    args = parser.parse_args ()
+
+    failed = False
+    for mode in ('spin', 'tickless'):
+        res = run_mode (mode, args.seconds, args.isr_ms)
+        print ('{:<9s} idle {: 6.1f}%  cpu {: 6.1f}%  sleeps {:6d}  '
+               'wakeups {:6d}  go latency med {:5d} us max {:5d} us'.format (
+               mode, 100.0 * res['idle'], 100.0 * res['cpu'], res['sleeps'],
+               res['wakeups'], res['lat_med'], res['lat_max']))
+
+        # Each timed task should have run (nearly) once per period
+        for num, (runs, expected) in enumerate (zip (res['runs'], 
+                                                     res['expected'])):
+            if runs < 0.9 * expected:
+                print ('  Timed_{:d} ran {:d} times, expected {:.0f}'.format (
+                       num, runs, expected))
+                failed = True
+
+        if mode == 'tickless' and res['idle'] < args.min_idle:
+            print ('  idle fraction below {:.1f}%'.format (
+                   100.0 * args.min_idle))
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit (main ())
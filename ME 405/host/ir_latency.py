@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+#
+## @file ir_latency.py
+#  This program measures how long the robot takes to start after the start
+#  button on the remote control is pressed: the time from the first edge of
+#  the NEC frame at the infrared receiver until the infrared task has
+#  decoded the frame and set the @c IR_ON field of the sensor record. It runs
+#  the robot's real task set from @c main.py with @c simulate.py's functions
+#  on a @c vclock.VirtualClock, replaying synthetic edge streams from
+#  @c necgen.py through the capture interrupt.
+#
+#  Each trial presses the button at a random time, with the ultrasonic
+#  sensors seeing something at a random distance or nothing at all, so that
+#  the frame arrives while echo pulses of all lengths are being timed. As
+#  the virtual clock only moves when code waits,
+#  each run of each task is made to take a fixed time, standing in for the
+#  time the board takes to switch to the task and run it; the cost of 
+#  running the infrared task once per edge shows up this way. The time from
+#  the frame's last edge to @c IR_ON, which is what the decoding and 
+#  scheduling add to the frame itself, is printed too, along with the 
+#  deepest the edge queue got and the number of edges dropped because it 
+#  was full. When @c main.IR_DECODE_IN_ISR is set, as it is by default, the
+#  capture interrupt decodes the edges itself and there's no queue; 
+#  @c --task-decode clears it, so that the edges are queued and decoded by
+#  the infrared task. Both ways should be checked:
+#  @code
+#  python ir_latency.py
+#  python ir_latency.py --task-decode
+#  @endcode
+#
+#  The program exits with status 1 if any frame wasn't decoded, any edge was
+#  dropped or the 99th percentile of the time after the frame is above the
+#  given limit, so it can be used as a regression check:
+#  @code
+#  python ir_latency.py --trials 500 --run-us 300 --max-ms 40
+#  @endcode
+#
+#  Known failure: in versions of the robot in which the ultrasonic task 
+#  waits for each echo, that task holds up the scheduler for up to 60 ms per
+#  run, and the 99th percentile after the frame is about 120 ms whatever the
+#  infrared task does, so the default run fails. When checking such a 
+#  version, as when bisecting, use @c --short-echo, which keeps the echoes 
+#  short so that only the infrared decoding is measured; it passes with
+#  decoding finished within 2 ms of the frame's last edge.
+#
+#  @copyright This program is released under the GNU Public License,
+#  version 3.0.
+
+import os
+import sys
+sys.path.insert (1, os.path.dirname (os.path.dirname (os.path.abspath (
+    __file__))))
+
+import argparse
+import random
+
+import machine
+import utime
+import vclock
+import necgen
+import simulate
+
+
+## How long after the frame's last edge to wait for @c IR_ON, in microseconds
+WAIT_US = 500000
+
+
+def costly (gen, run_us):
+    """ Make a task's generator take a fixed time for each run.
+    @param gen The task's generator
+    @param run_us The time each run takes in microseconds
+    @return A generator which yields the same states as the task's """
+
+    while True:
+        state = next (gen)
+        utime.sleep_us (run_us)
+        yield state
+
+
+def trial (rand, repeats, run_us, max_inches = 150.0, task_decode = False):
+    """ Run the robot and press the start button once.
+    @param rand The random number generator which picks the trial's settings
+    @param repeats The number of repeat codes sent after the frame
+    @param run_us The time each run of each task takes in microseconds
+    @param max_inches The farthest the ultrasonic sensors see something;
+        if it's more than 30 inches, they sometimes see nothing
+    @param task_decode Set to @c True to have the infrared task decode the
+        edges from its queue rather than the capture interrupt decoding them
+    @return A tuple holding the times in microseconds from the frame's first
+        and last edges until @c IR_ON was set, or @c None for both if it
+        never was, the deepest the edge queue got and the number of edges
+        dropped """
+
+    clock = vclock.VirtualClock (0)
+    robot = simulate.load_robot (clock, settings = {
+        'IR_DECODE_IN_ISR': not task_decode})
+    for pri in robot.cotask.task_list.pri_list:
+        for task in pri[2:]:
+            task._run_gen = costly (task._run_gen, run_us)
+
+    # Something at a random distance, or nothing so the sensor times out
+    if rand.random () < 0.25 and max_inches > 30.0:
+        echo_us = None
+    else:
+        echo_us = rand.uniform (2.0, max_inches) * simulate.US_PER_INCH
+    machine.pulse_source = lambda pin: echo_us
+
+    press_us = int (rand.uniform (0.2, 1.2) * 1000000)
+    edges = necgen.press_edges (simulate.IR_ADDRESS, simulate.IR_START,
+                                press_us, repeats)
+    necgen.schedule_edges (clock, simulate.ir_channel (), edges)
+    frame_end = edges[67]
+
+    # Note the time at which IR_ON is set, whether by a task or an interrupt
+    started = []
+    put = robot.sensors.put
+
+    def watch_put (field, data, in_ISR = False):
+        put (field, data, in_ISR)
+        if field == robot.IR_ON and data and not started:
+            started.append (clock.now_us)
+
+    robot.sensors.put = watch_put
+    simulate.run (robot, clock, (frame_end + WAIT_US) / 1000000.0,
+                  until = lambda: len (started) > 0)
+
+    if started:
+        times = (started[0] - press_us, started[0] - frame_end)
+    else:
+        times = (None, None)
+    if robot.IR_DECODE_IN_ISR:
+        return times + (0, 0)
+    return times + (robot.q0._max_items, robot.q0._drops)
+
+
+def percentile (values, frac):
+    """ Find a percentile of a sorted list of numbers.
+    @param values The sorted numbers
+    @param frac The fraction of the numbers which are to be below the result
+    @return The percentile """
+
+    return values[min (int (frac * len (values)), len (values) - 1)]
+
+
+def main ():
+    """ Run the trials, print the results and return the exit status.
+    @return 0 if every frame was decoded in time without dropping edges, 1 if
+        not """
+
+    parser = argparse.ArgumentParser (description = __doc__)
+    parser.add_argument ('--trials', type = int, default = 200,
+                         help = 'number of button presses')
+    parser.add_argument ('--seed', type = int, default = 405,
+                         help = 'seed for the random settings of the trials')
+    parser.add_argument ('--repeats', type = int, default = 0,
+                         help = 'repeat codes sent after each frame')
+    parser.add_argument ('--run-us', type = int, default = 300,
+                         help = 'time taken by each run of each task')
+    parser.add_argument ('--short-echo', action = 'store_true',
+                         help = 'keep the echo pulses short, as the '
+                                'ultrasonic sensors always see something '
+                                'within a few inches')
+    parser.add_argument ('--task-decode', action = 'store_true',
+                         help = 'queue the edges and decode them in the '
+                                'infrared task, not the capture interrupt')
+    parser.add_argument ('--max-ms', type = float, default = 40.0,
+                         help = 'longest allowed 99th percentile time from '
+                                'the end of the frame to IR_ON')
+    args = parser.parse_args ()
+
+    rand = random.Random (args.seed)
+    press = []
+    after = []
+    missed = 0
+    depth = 0
+    drops = 0
+    for _ in range (args.trials):
+        from_press, from_end, max_items, dropped = trial (
+            rand, args.repeats, args.run_us,
+            4.0 if args.short_echo else 150.0, args.task_decode)
+        if from_press is None:
+            missed += 1
+        else:
+            press.append (from_press / 1000.0)
+            after.append (from_end / 1000.0)
+        depth = max (depth, max_items)
+        drops += dropped
+
+    print ('{:<22s} {:>8s} {:>8s} {:>8s} {:>8s}'.format (
+           'TIME TO IR_ON (ms)', 'P50', 'P90', 'P99', 'MAX'))
+    for name, values in (('from first edge', press),
+                         ('from end of frame', after)):
+        values.sort ()
+        if values:
+            print ('{:<22s} {: 8.1f} {: 8.1f} {: 8.1f} {: 8.1f}'.format (
+                   name, percentile (values, 0.5), percentile (values, 0.9),
+                   percentile (values, 0.99), values[-1]))
+    print ('\n{:s}: {:d} of {:d} frames not decoded; edge queue reached '
+           '{:d}, {:d} edges dropped'.format (
+           'Task decoding' if args.task_decode else 'Interrupt decoding', 
+           missed, args.trials, depth, drops))
+
+    if missed or drops or not after or percentile (after, 0.99) > args.max_ms:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit (main ())
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+#
+## @file ir_replay.py
+#  This program replays infrared edge times through the robot's NEC decoder,
+#  @c nec_decoder.NECDecoder, on a desktop computer, as fast as the computer
+#  can run it rather than in real time. The edges may come from either of
+#  two places:
+#  * captures recorded on the board by @c nec_decoder.EdgeRecorder when
+#    @c IR_RECORD_EDGES is set in @c main.py, and saved from the serial port.
+#    Everything the decoder reports is listed with its time, so a failure
+#    seen on the arena floor can be looked at edge by edge
+#  * button presses generated by @c necgen.py with random addresses,
+#    commands and repeat codes, spoiled by jitter, glitches and missed edges.
+#    Since what was sent is known, the fraction of frames decoded, the number
+#    of false commands decoded and the time from each frame's first edge
+#    until its command was decoded are reported
+#
+#  @code
+#  python ir_replay.py capture.bin
+#  python ir_replay.py --generate 5000 --jitter-us 60 --glitch-rate 2
+#  python ir_replay.py --generate 20 --save sample.bin
+#  @endcode
+#
+#  The function @c load_capture() can also be used by other host-side
+#  programs which need recorded edges.
+#
+#  @copyright This program is released under the GNU Public License,
+#  version 3.0.
+
+import os
+import sys
+sys.path.insert (1, os.path.dirname (os.path.dirname (os.path.abspath (
+    __file__))))
+
+import argparse
+import random
+import struct
+import time
+
+import necgen
+import nec_decoder
+
+
+## The text with which the header line of a capture begins
+HEADER = b'#IRC '
+
+
+def load_capture (data):
+    """ Get the edge times out of a capture written by
+    @c EdgeRecorder.dump(). Text before the header line, as printed by the
+    board before the capture, is skipped.
+    @param data The bytes of the capture
+    @return A tuple holding a list of the 16-bit edge times, oldest first,
+        and the number of edges recorded in all, which is more than the
+        number of times if the oldest ones were overwritten
+    @raise ValueError if there's no capture in the data or it's cut short """
+
+    start = data.find (HEADER)
+    if start < 0:
+        raise ValueError ('no infrared capture header in the data')
+    end = data.index (b'\n', start)
+    kept, total = (int (num) for num in data[start + len (HEADER):end]
+                   .split ())
+    body = data[end + 1:end + 1 + 2 * kept]
+    if len (body) < 2 * kept:
+        raise ValueError ('the capture is cut short')
+    return list (struct.unpack ('<{:d}H'.format (kept), body)), total
+
+
+def save_capture (stream, stamps):
+    """ Write edge times as a capture, using the board's own recorder so that
+    the files are just like the ones saved from the board.
+    @param stream A binary file to write to
+    @param stamps The edge times in microseconds """
+
+    recorder = nec_decoder.EdgeRecorder (max (len (stamps), 1))
+    for stamp in stamps:
+        recorder.record (stamp & 0xFFFF)
+    recorder.dump (stream)
+
+
+def replay (stamps):
+    """ Run edge times through a fresh decoder.
+    @param stamps The edge times; only their low 16 bits are used, as the
+        board's timer has only 16
+    @return A tuple holding the decoder and a list of (index, result) tuples,
+        one for each edge at which the decoder finished a frame or a repeat
+        code """
+
+    decoder = nec_decoder.NECDecoder ()
+    events = []
+    for idx, stamp in enumerate (stamps):
+        result = decoder.edge (stamp & 0xFFFF)
+        if result != nec_decoder.NOTHING:
+            events.append ((idx, result))
+    return decoder, events
+
+
+def unwrap (stamps):
+    """ Turn 16-bit edge times into times which keep increasing. Gaps of more
+    than 65.5 ms between edges can't be told from shorter ones, so times
+    after such gaps are too early by a multiple of 65.536 ms.
+    @param stamps The 16-bit edge times
+    @return A list of times in microseconds from the first edge """
+
+    times = []
+    now = 0
+    for idx, stamp in enumerate (stamps):
+        if idx > 0:
+            now += (stamp - stamps[idx - 1]) & 0xFFFF
+        times.append (now)
+    return times
+
+
+def generate (rand, presses, jitter_us, glitch_rate, drop):
+    """ Make the edges of a series of button presses with random addresses,
+    commands and numbers of repeat codes, with random gaps between them.
+    @param rand The random number generator
+    @param presses The number of button presses
+    @param jitter_us The jitter given to @c necgen.noisy_edges()
+    @param glitch_rate The glitches per second given to
+        @c necgen.noisy_edges()
+    @param drop The chance of missing each edge given to
+        @c necgen.noisy_edges()
+    @return A tuple holding the edge times in microseconds and a list of
+        (start time, command, number of repeat codes) tuples, one for each
+        press """
+
+    edges = []
+    sent = []
+    start = rand.randrange (0, 1 << 16)
+    for _ in range (presses):
+        command = rand.randrange (256)
+        repeats = rand.randrange (4)
+        edges += necgen.press_edges (rand.randrange (256), command, start,
+                                     repeats)
+        sent.append ((start, command, repeats))
+        start += (repeats + 1) * necgen.FRAME_PERIOD + rand.randrange (
+            50000, 500000)
+    return necgen.noisy_edges (edges, rand, jitter_us, glitch_rate, drop), sent
+
+
+def score (edges, sent, events):
+    """ Compare what the decoder found with the presses which were sent.
+    Each command decoded between the start of a press and the start of the
+    next one is counted as that press's if it's the same command, and as a
+    false command if not.
+    @param edges The edge times in microseconds
+    @param sent The presses, from @c generate()
+    @param events The decoder's results, from @c replay()
+    @return A tuple holding the number of frames decoded, the number of
+        false commands, the number of repeat codes decoded and a list of
+        the latencies in microseconds from the start of each decoded frame """
+
+    decoded = 0
+    false = 0
+    repeats = 0
+    latency = []
+    press = 0
+    found = False
+    for idx, result in events:
+        when = edges[idx]
+        while press + 1 < len (sent) and when >= sent[press + 1][0]:
+            press += 1
+            found = False
+        if result == nec_decoder.REPEAT:
+            repeats += 1
+        elif when >= sent[press][0] and result == sent[press][1]:
+            if not found:
+                decoded += 1
+                latency.append (when - sent[press][0])
+                found = True
+        else:
+            false += 1
+    return decoded, false, repeats, latency
+
+
+def percentile (values, frac):
+    """ Find a percentile of a sorted list of numbers.
+    @param values The sorted numbers
+    @param frac The fraction of the numbers which are to be below the result
+    @return The percentile """
+
+    return values[min (int (frac * len (values)), len (values) - 1)]
+
+
+def show_capture (name):
+    """ Replay a capture file and list what the decoder found in it.
+    @param name The name of the file """
+
+    with open (name, 'rb') as infile:
+        stamps, total = load_capture (infile.read ())
+    times = unwrap (stamps)
+    decoder, events = replay (stamps)
+
+    print ('{:s}: {:d} edges of {:d} recorded'.format (name, len (stamps),
+                                                        total))
+    for idx, result in events:
+        if result == nec_decoder.REPEAT:
+            what = 'repeat'
+        else:
+            what = 'command {:d}'.format (result)
+        print ('  {: 10.1f} ms  edge {: 6d}  {:s}'.format (
+               times[idx] / 1000.0, idx, what))
+    print ('  ' + str (decoder))
+
+
+def main ():
+    """ Replay the given captures or generated presses and print the
+    results. """
+
+    parser = argparse.ArgumentParser (description = __doc__)
+    parser.add_argument ('files', nargs = '*',
+                         help = 'captures saved from the board')
+    parser.add_argument ('--generate', type = int, default = 0,
+                         metavar = 'PRESSES',
+                         help = 'replay this many generated button presses')
+    parser.add_argument ('--seed', type = int, default = 405,
+                         help = 'seed for the generated presses')
+    parser.add_argument ('--jitter-us', type = float, default = 0.0,
+                         help = 'standard deviation of edge time jitter')
+    parser.add_argument ('--glitch-rate', type = float, default = 0.0,
+                         help = 'average number of glitches per second')
+    parser.add_argument ('--drop', type = float, default = 0.0,
+                         help = 'chance of missing each edge')
+    parser.add_argument ('--save', metavar = 'FILE',
+                         help = 'save the generated edges as a capture')
+    args = parser.parse_args ()
+
+    for name in args.files:
+        show_capture (name)
+
+    if args.generate > 0:
+        rand = random.Random (args.seed)
+        edges, sent = generate (rand, args.generate, args.jitter_us,
+                                args.glitch_rate, args.drop)
+        if args.save:
+            with open (args.save, 'wb') as outfile:
+                save_capture (outfile, edges)
+
+        wall = time.perf_counter ()
+        decoder, events = replay (edges)
+        wall = time.perf_counter () - wall
+        decoded, false, repeats, latency = score (edges, sent, events)
+        latency.sort ()
+
+        print ('{:d} frames sent, {:d} decoded ({:.2f}%), {:d} false '
+               'commands'.format (len (sent), decoded,
+                                  100.0 * decoded / len (sent), false))
+        print ('{:d} repeat codes sent, {:d} decoded; {:d} decoder '
+               'errors'.format (sum (press[2] for press in sent), repeats,
+                                decoder.errors))
+        if latency:
+            print ('Latency from first edge (ms): P50 {:.2f}  P99 {:.2f}  '
+                   'MAX {:.2f}'.format (percentile (latency, 0.5) / 1000.0,
+                                        percentile (latency, 0.99) / 1000.0,
+                                        latency[-1] / 1000.0))
+        print ('{:d} edges in {:.3f} s, {:.0f}x real time'.format (
+               len (edges), wall, (edges[-1] - edges[0]) / 1000000.0 / wall))
+
+    if not args.files and args.generate <= 0:
+        parser.print_usage ()
+
+
+if __name__ == '__main__':
+    main ()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+## @file machine.py
+#  This file is a host-side stand-in for the parts of the MicroPython 
+#  @c machine module used by the ultrasonic sensor driver. Pins are the same
+#  objects as in the @c pyb stand-in. The time taken by @c time_pulse_us() 
+#  passes on the clock chosen in @c vclock.py, so that a simulation sees the
+#  scheduler stall while a pulse is being timed. For the driver's 
+#  non-blocking measurements, @c connect_echo() makes an ultrasonic sensor's
+#  echo pin answer each trigger pulse with a pulse of its own, timed on a 
+#  @c vclock.VirtualClock.
+#
+#  @copyright This program is released under the GNU Public License, 
+#  version 3.0. 
+
+import vclock
+from pyb import Pin
+
+
+## A function which gives the length in microseconds of the next pulse on a
+#  pin, given the pin's name, or @c None if no pulse comes. It's set by a
+#  simulation; by default no pulses ever come (host only)
+pulse_source = None
+
+## The time in microseconds from the end of a trigger pulse until the echo
+#  pulse starts, while the sensor sends its burst of sound
+ECHO_DELAY_US = 450
+
+## The length in microseconds of the echo pulse when no echo comes back; the
+#  sensor gives up and ends the pulse after this long
+NO_ECHO_US = 38000
+
+
+def time_pulse_us (pin, pulse_level, timeout_us = 1000000):
+    """ Time a pulse on a pin. The time spent waiting for the pulse and 
+    timing it passes on the clock.
+    @param pin The pin on which to time the pulse
+    @param pulse_level The level of the pulse to be timed
+    @param timeout_us How long to wait for the pulse to start and to end
+    @return The pulse length in microseconds, or -2 if it never started, or
+        -1 if it didn't end before the timeout """
+
+    pulse = pulse_source (pin.name) if pulse_source is not None else None
+    if pulse is None:
+        vclock.clock.sleep_us (timeout_us)
+        return -2
+    if pulse > timeout_us:
+        vclock.clock.sleep_us (timeout_us)
+        return -1
+    vclock.clock.sleep_us (pulse)
+    return int (pulse)
+
+
+def connect_echo (trigger, echo):
+    """ Make an ultrasonic sensor's echo pin answer its trigger pin (host
+    only). At the end of each trigger pulse, the echo pin goes high after
+    @c ECHO_DELAY_US and low again after the pulse length given by
+    @c pulse_source for the echo pin, or after @c NO_ECHO_US if there's no
+    echo. As with the sensor, triggers which come while an echo pulse is 
+    under way are ignored. The pin changes are simulated interrupts on the
+    clock, which must be a @c vclock.VirtualClock.
+    @param trigger The name of the trigger pin
+    @param echo The name of the echo pin """
+
+    echo_pin = Pin (echo, Pin.IN)
+    busy = [False]
+
+    def finish ():
+        echo_pin.drive (0)
+        busy[0] = False
+
+    def watch (pin, level):
+        if level or busy[0]:
+            return
+        pulse = pulse_source (echo) if pulse_source is not None else None
+        if pulse is None:
+            pulse = NO_ECHO_US
+        busy[0] = True
+        vclock.clock.after (ECHO_DELAY_US, echo_pin.drive, 1)
+        vclock.clock.after (ECHO_DELAY_US + int (pulse), finish)
+
+    Pin.watchers[trigger] = watch
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#
+## @file micropython.py
+#  This file is a host-side stand-in for the MicroPython @c micropython 
+#  module. The code emitter decorators do nothing, and @c const() returns its
+#  argument as the MicroPython compiler would.
+#
+#  @copyright This program is released under the GNU Public License, 
+#  version 3.0. 
+
+import builtins
+
+
+def native (fun):
+    """ Stand-in for the native code emitter decorator.
+    @param fun The function to be decorated
+    @return The same function """
+
+    return fun
+
+
+def viper (fun):
+    """ Stand-in for the viper code emitter decorator.
+    @param fun The function to be decorated
+    @return The same function """
+
+    return fun
+
+
+def const (value):
+    """ Stand-in for the compile-time constant declaration.
+    @param value The value of the constant
+    @return The same value """
+
+    return value
+
+
+def alloc_emergency_exception_buf (size):
+    """ Stand-in which would allocate a buffer for exceptions raised in ISR's.
+    @param size The size of the buffer in bytes """
+
+    pass
+
+
+# MicroPython's compiler accepts const() without its being imported, as in
+# print_task.py, so it's made a built-in here
+builtins.const = const
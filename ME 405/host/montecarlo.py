@@ -0,0 +1,514 @@
+# -*- coding: utf-8 -*-
+#
+## @file montecarlo.py
+#  This program runs many simulated sumo matches with the robot's real task
+#  set from @c main.py, so that a change to the strategy in @c Mastermind()
+#  or @c Motors_Task() can be judged on thousands of matches rather than on
+#  a few on the table. Each match is run by @c simulate.py's functions on a
+#  @c vclock.VirtualClock, with a simple model of the ring standing in for
+#  the outside world:
+#  * both robots are discs which drive like differential-drive robots; our
+#    robot's wheel speeds come from the PWM duty cycles which the motor task
+#    sets, and its front encoder counts the left wheel's travel
+#  * the line sensors read low over the white border of the ring and high
+#    over the black surface, with noise
+#  * the ultrasonic sensors see the opponent when it's within their beams,
+#    with noise and dropped echoes, and otherwise see the walls of the room
+#  * the opponent sits still, charges at our robot or wanders around the
+#    ring, turning back from the edge unless it's pushing
+#  * a robot which is pushed, or drives, out of the ring loses
+#
+#  The starting places and headings, the opponent's behavior, speed and
+#  strength, the noise levels and the time of the start button press are
+#  drawn at random for each match from a generator seeded with the match's
+#  number, so a set of matches gives the same results however many processes
+#  run it, and two versions of the code can be compared on the same matches.
+#  The matches are shared out among the computer's cores with a process pool.
+#  @code
+#  python montecarlo.py --matches 2000 --seed 1 --csv matches.csv
+#  @endcode
+#
+#  The model is rough, and its numbers (speeds, sizes, sensor readings) are
+#  estimates rather than measurements, so results are useful for comparing
+#  strategies, not for predicting the outcome of a real match.
+#
+#  @copyright This program is released under the GNU Public License,
+#  version 3.0.
+
+import os
+import sys
+sys.path.insert (1, os.path.dirname (os.path.dirname (os.path.abspath (
+    __file__))))
+
+import argparse
+import csv
+import functools
+import math
+import multiprocessing
+import random
+import time
+
+import machine
+import pyb
+import vclock
+import necgen
+import simulate
+
+
+## The radius of the ring in inches; a mini sumo ring is 77 cm across
+RING_RADIUS = 15.2
+
+## The width in inches of the white border at the edge of the ring
+BORDER = 1.0
+
+## The radius in inches of the disc which stands in for each robot
+BODY_RADIUS = 2.8
+
+## The distance in inches between our robot's wheels
+TRACK = 3.5
+
+## Our robot's speed in inches per second at 100% duty cycle
+TOP_SPEED = 20.0
+
+## Counts of the front encoder per inch of travel; @c main.py turns the
+#  distance to the opponent in inches into an encoder setpoint with this
+COUNTS_PER_INCH = 750
+
+## The places of the line sensors, as (forward, left) in inches from the
+#  center of the robot, keyed by the pins of their ADCs
+LINE_SENSORS = {'PB0': (2.0, 1.5), 'PA4': (2.0, -1.5)}
+
+## ADC readings over the white border, the black ring and the floor
+LINE_WHITE = 300
+LINE_BLACK = 2200
+LINE_OFF = 3600
+
+## The places of the ultrasonic sensors, as (forward, left) in inches from
+#  the center of the robot, keyed by their echo pins
+ECHO_PINS = {'PA6': (2.0, 1.0), 'PB9': (2.0, -1.0)}
+
+## Half the width of an ultrasonic sensor's beam in radians
+BEAM_HALF_ANGLE = math.radians (15.0)
+
+## The timers which drive our robot's left and right wheels
+MOTOR_TIMERS = (3, 5)
+
+## The timer which counts the front encoder's pulses
+ENCODER_TIMER = 4
+
+## The time step of the model in microseconds
+STEP_US = 5000
+
+## The behaviors the opponent may have
+OPPONENTS = ('still', 'charge', 'wander')
+
+## A loss or win in which the robots touched within this many microseconds
+#  of the ring-out is counted as a push rather than as driving out alone
+PUSH_WINDOW_US = 500000
+
+
+class Body:
+    """ A robot in the model: a disc with a place, a heading and a speed. """
+
+    def __init__ (self, x, y, heading):
+        """ Put a robot in the ring.
+        @param x The distance in inches to the right of the ring's center
+        @param y The distance in inches forward of the ring's center
+        @param heading The direction the robot faces, in radians
+            counterclockwise from the x axis """
+
+        self.x = x
+        self.y = y
+        self.heading = heading
+
+        ## The forward speed in inches per second
+        self.speed = 0.0
+
+        ## The turning rate in radians per second, counterclockwise
+        self.turn = 0.0
+
+
+    def point (self, forward, left):
+        """ Find where a point on the robot is in the ring.
+        @param forward The distance of the point forward of the center
+        @param left The distance of the point left of the center
+        @return The point's (x, y) in the ring """
+
+        cos = math.cos (self.heading)
+        sin = math.sin (self.heading)
+        return (self.x + forward * cos - left * sin,
+                self.y + forward * sin + left * cos)
+
+
+    def radius (self):
+        """ Find the distance of the robot's center from the ring's center.
+        @return The distance in inches """
+
+        return math.hypot (self.x, self.y)
+
+
+    def move (self, dt):
+        """ Drive the robot for a short time at its speed and turning rate.
+        @param dt The time in seconds """
+
+        self.heading += self.turn * dt
+        self.x += self.speed * math.cos (self.heading) * dt
+        self.y += self.speed * math.sin (self.heading) * dt
+
+
+class Match:
+    """ One simulated match between the robot's task set and an opponent. """
+
+    def __init__ (self, seed, seconds):
+        """ Draw the settings of a match at random.
+        @param seed The seed of the random number generator for the match
+        @param seconds The longest time the match may last after the start
+            button is pressed """
+
+        rand = random.Random (seed)
+        self.rand = rand
+        self.seed = seed
+        self.seconds = seconds
+
+        # The robots start facing in any direction at least a little apart,
+        # away from the border
+        spot = RING_RADIUS - BORDER - BODY_RADIUS
+        while True:
+            places = [self._place (spot) for _ in range (2)]
+            if math.hypot (places[0][0] - places[1][0],
+                           places[0][1] - places[1][1]) > 4 * BODY_RADIUS:
+                break
+        self.robot = Body (*places[0])
+        self.opp = Body (*places[1])
+
+        self.behavior = rand.choice (OPPONENTS)
+        self.opp_speed = rand.uniform (4.0, 16.0)
+        self.opp_strength = rand.uniform (0.5, 1.5)
+        self.line_noise = rand.uniform (0.0, 400.0)
+        self.echo_noise = rand.uniform (0.0, 1.0)
+        self.dropout = rand.uniform (0.0, 0.2)
+
+        # The walls of the room, or nothing within the sensors' range
+        self.background = rand.uniform (40.0, 200.0)
+        if self.background > 157.0:
+            self.background = None
+
+        self.press_us = int (rand.uniform (0.1, 0.5) * 1000000)
+
+        self.result = None
+        self.cause = None
+        self.end_us = None
+        self.contact_us = None
+        self.last_contact_us = None
+
+
+    def _place (self, spot):
+        """ Pick a place and heading at random within a circle.
+        @param spot The radius of the circle
+        @return A tuple of x, y and heading """
+
+        rad = spot * math.sqrt (self.rand.random ())
+        ang = self.rand.uniform (0.0, 2 * math.pi)
+        return (rad * math.cos (ang), rad * math.sin (ang),
+                self.rand.uniform (0.0, 2 * math.pi))
+
+
+    def line_reading (self, pin):
+        """ Make the ADC reading of a line sensor.
+        @param pin The name of the sensor's ADC pin
+        @return The reading """
+
+        rad = math.hypot (*self.robot.point (*LINE_SENSORS[pin]))
+        if rad > RING_RADIUS:
+            level = LINE_OFF
+        elif rad > RING_RADIUS - BORDER:
+            level = LINE_WHITE
+        else:
+            level = LINE_BLACK
+        level += self.rand.gauss (0.0, self.line_noise)
+        return min (max (int (level), 0), 4095)
+
+
+    def echo_time (self, pin):
+        """ Make the length of an ultrasonic sensor's echo pulse.
+        @param pin The name of the sensor's echo pin
+        @return The pulse length in microseconds, or @c None if no echo """
+
+        sx, sy = self.robot.point (*ECHO_PINS[pin])
+        dist = math.hypot (self.opp.x - sx, self.opp.y - sy)
+        off = math.atan2 (self.opp.y - sy, self.opp.x - sx) - self.robot.heading
+        off = (off + math.pi) % (2 * math.pi) - math.pi
+        width = BEAM_HALF_ANGLE + math.asin (min (1.0, BODY_RADIUS / dist))
+        if abs (off) <= width and self.rand.random () >= self.dropout:
+            dist = max (dist - BODY_RADIUS, 0.8)
+        elif self.background is None:
+            return None
+        else:
+            dist = self.background
+        dist += self.rand.gauss (0.0, self.echo_noise)
+        return max (dist, 0.8) * simulate.US_PER_INCH
+
+
+    def drive_robot (self):
+        """ Set our robot's speed and turning rate from the duty cycles of
+        its motor drivers. Each driver runs its motor forward on channel 2
+        and backward on channel 1; the right motor is mounted the other way
+        around, so its duty cycle is negative when driving forward. """
+
+        wheels = []
+        for num in MOTOR_TIMERS:
+            timer = pyb.Timer (num)
+            fwd = timer.channel (2)
+            back = timer.channel (1)
+            level = ((fwd.percent if fwd else 0)
+                     - (back.percent if back else 0))
+            wheels.append (min (max (level, -100), 100) * TOP_SPEED / 100.0)
+        left, right = wheels[0], -wheels[1]
+        self.robot.speed = (left + right) / 2.0
+        self.robot.turn = (right - left) / TRACK
+
+
+    def drive_opponent (self, now_us):
+        """ Set the opponent's speed and turning rate from its behavior.
+        @param now_us The simulated time in microseconds """
+
+        opp = self.opp
+        if self.behavior == 'still' or now_us < self.press_us:
+            opp.speed = 0.0
+            opp.turn = 0.0
+            return
+
+        # Head back toward the center when the edge is seen, unless pushing
+        touching = (self.last_contact_us is not None and
+                    now_us - self.last_contact_us <= STEP_US)
+        if math.hypot (*opp.point (BODY_RADIUS, 0.0)) > RING_RADIUS - BORDER \
+                and not touching:
+            target = math.atan2 (-opp.y, -opp.x)
+        elif self.behavior == 'charge':
+            target = math.atan2 (self.robot.y - opp.y, self.robot.x - opp.x)
+        else:
+            target = opp.heading + self.rand.gauss (0.0, 0.3)
+        error = (target - opp.heading + math.pi) % (2 * math.pi) - math.pi
+        opp.turn = max (min (error * 10.0, 8.0), -8.0)
+        opp.speed = self.opp_speed if abs (error) < 1.0 else 0.0
+
+
+    def collide (self, now_us):
+        """ Push the robots apart if they overlap. Each gives way in
+        proportion to how hard the other drives into it.
+        @param now_us The simulated time in microseconds """
+
+        dx = self.opp.x - self.robot.x
+        dy = self.opp.y - self.robot.y
+        dist = math.hypot (dx, dy)
+        overlap = 2 * BODY_RADIUS - dist
+        if overlap <= 0.0 or dist == 0.0:
+            return
+        if self.contact_us is None:
+            self.contact_us = now_us
+        self.last_contact_us = now_us
+
+        nx, ny = dx / dist, dy / dist
+        ours = max (self.robot.speed * (math.cos (self.robot.heading) * nx
+                    + math.sin (self.robot.heading) * ny), 0.0) + 1.0
+        theirs = max (-self.opp.speed * (math.cos (self.opp.heading) * nx
+                      + math.sin (self.opp.heading) * ny), 0.0) + 1.0
+        theirs *= self.opp_strength
+        share = theirs / (ours + theirs)
+        self.robot.x -= nx * overlap * share
+        self.robot.y -= ny * overlap * share
+        self.opp.x += nx * overlap * (1.0 - share)
+        self.opp.y += ny * overlap * (1.0 - share)
+
+
+    def step (self, clock):
+        """ Move the model on by one time step, then schedule the next step
+        unless the match is over. Run as a simulated interrupt.
+        @param clock The simulation's @c vclock.VirtualClock """
+
+        now_us = clock.now_us
+        dt = STEP_US / 1000000.0
+        self.drive_robot ()
+        self.drive_opponent (now_us)
+        self.robot.move (dt)
+        self.opp.move (dt)
+        self.collide (now_us)
+
+        # The front encoder follows the left wheel
+        left = self.robot.speed - self.robot.turn * TRACK / 2.0
+        enc = pyb.Timer (ENCODER_TIMER)
+        self.travel += left * dt * COUNTS_PER_INCH
+        counts = int (self.travel)
+        self.travel -= counts
+        enc.counter ((enc.counter () + counts) & 0xFFFF)
+
+        ours = self.robot.radius () > RING_RADIUS
+        theirs = self.opp.radius () > RING_RADIUS
+        if ours or theirs:
+            pushed = (self.last_contact_us is not None and
+                      now_us - self.last_contact_us <= PUSH_WINDOW_US)
+            self.result = ('draw' if ours and theirs
+                           else 'loss' if ours else 'win')
+            self.cause = 'pushed' if pushed else 'alone'
+            self.end_us = now_us
+        else:
+            clock.after (STEP_US, self.step, clock)
+
+
+    def run (self):
+        """ Run the match until a robot leaves the ring or time runs out.
+        @return A dictionary describing the match """
+
+        clock = vclock.VirtualClock (0)
+        robot = simulate.load_robot (clock)
+        for pin in LINE_SENSORS:
+            pyb.ADC.sources[pin] = functools.partial (self.line_reading, pin)
+        machine.pulse_source = self.echo_time
+        pyb.Timer (ENCODER_TIMER).counter (0)
+        self.travel = 0.0
+
+        edges = necgen.press_edges (simulate.IR_ADDRESS, simulate.IR_START,
+                                    self.press_us)
+        necgen.schedule_edges (clock, simulate.ir_channel (), edges)
+        clock.at (STEP_US, self.step, clock)
+
+        limit = self.press_us / 1000000.0 + self.seconds
+        simulate.run (robot, clock, limit,
+                      until = lambda: self.result is not None)
+        if self.result is None:
+            self.result = 'draw'
+            self.cause = 'time'
+            self.end_us = clock.now_us
+
+        return {'seed': self.seed,
+                'opponent': self.behavior,
+                'result': self.result,
+                'cause': self.cause,
+                'end_s': (self.end_us - self.press_us) / 1000000.0,
+                'contact_s': (None if self.contact_us is None else
+                              (self.contact_us - self.press_us) / 1000000.0),
+                'opp_speed': self.opp_speed,
+                'opp_strength': self.opp_strength,
+                'line_noise': self.line_noise,
+                'echo_noise': self.echo_noise,
+                'dropout': self.dropout,
+                'background': self.background}
+
+
+def play (seed, seconds):
+    """ Run one match; this is the function run by the processes of the pool.
+    @param seed The seed for the match
+    @param seconds The longest time the match may last
+    @return A dictionary describing the match """
+
+    return Match (seed, seconds).run ()
+
+
+def percentile (values, frac):
+    """ Find a percentile of a list of numbers.
+    @param values The numbers, which needn't be sorted
+    @param frac The fraction of the numbers which are to be below the result
+    @return The percentile, or @c None if the list is empty """
+
+    if not values:
+        return None
+    values = sorted (values)
+    return values[min (int (frac * len (values)), len (values) - 1)]
+
+
+def summarize (matches):
+    """ Work out the win rate, time to contact and ring-out counts of a set
+    of matches.
+    @param matches A list of dictionaries from @c play()
+    @return A string holding a table of the results """
+
+    lines = []
+    groups = [('all', matches)]
+    for behavior in OPPONENTS:
+        groups.append ((behavior, [match for match in matches
+                                   if match['opponent'] == behavior]))
+
+    lines.append ('{:<8s} {:>6s} {:>7s} {:>6s} {:>6s} {:>6s} {:>9s} {:>9s}'
+                  .format ('OPPONENT', 'GAMES', 'WIN%', '+/-', 'LOSS%',
+                           'DRAW%', 'TTC P50', 'TTC P90'))
+    for name, group in groups:
+        count = len (group)
+        if count == 0:
+            continue
+        wins = sum (1 for match in group if match['result'] == 'win')
+        losses = sum (1 for match in group if match['result'] == 'loss')
+        rate = wins / count
+        contact = [match['contact_s'] for match in group
+                   if match['contact_s'] is not None]
+        p50 = percentile (contact, 0.5)
+        p90 = percentile (contact, 0.9)
+        lines.append ('{:<8s} {: 6d} {: 7.1f} {: 6.1f} {: 6.1f} {: 6.1f} '
+                      '{:>9s} {:>9s}'.format (
+                      name, count, 100.0 * rate,
+                      196.0 * math.sqrt (rate * (1.0 - rate) / count),
+                      100.0 * losses / count,
+                      100.0 * (count - wins - losses) / count,
+                      '-' if p50 is None else '{:.2f} s'.format (p50),
+                      '-' if p90 is None else '{:.2f} s'.format (p90)))
+
+    lines.append ('')
+    lines.append ('Ring-outs: ours {:d} pushed, {:d} alone; theirs {:d} '
+                  'pushed, {:d} alone; {:d} both; {:d} timed out'.format (
+                  *[sum (1 for match in matches if match['result'] == result
+                         and match['cause'] == cause)
+                    for result, cause in (('loss', 'pushed'),
+                                          ('loss', 'alone'),
+                                          ('win', 'pushed'),
+                                          ('win', 'alone'))],
+                  sum (1 for match in matches if match['result'] == 'draw'
+                       and match['cause'] != 'time'),
+                  sum (1 for match in matches if match['cause'] == 'time')))
+    lines.append ('No contact in {:d} of {:d} matches'.format (
+                  sum (1 for match in matches if match['contact_s'] is None),
+                  len (matches)))
+    return '\n'.join (lines)
+
+
+def main ():
+    """ Run a batch of matches with settings from the command line and print
+    a summary of the results. """
+
+    parser = argparse.ArgumentParser (description = __doc__)
+    parser.add_argument ('--matches', type = int, default = 1000,
+                         help = 'number of matches to run')
+    parser.add_argument ('--seed', type = int, default = 0,
+                         help = 'seed of the first match; match n uses '
+                                'seed + n')
+    parser.add_argument ('--seconds', type = float, default = 30.0,
+                         help = 'longest simulated time of a match')
+    parser.add_argument ('--jobs', type = int, default = os.cpu_count (),
+                         help = 'number of processes to run matches in')
+    parser.add_argument ('--csv', metavar = 'FILE',
+                         help = 'write a row for each match to a file')
+    args = parser.parse_args ()
+
+    seeds = range (args.seed, args.seed + args.matches)
+    fun = functools.partial (play, seconds = args.seconds)
+    wall = time.perf_counter ()
+    if args.jobs > 1:
+        with multiprocessing.Pool (args.jobs) as pool:
+            matches = pool.map (fun, seeds,
+                                chunksize = max (1, args.matches
+                                                 // (8 * args.jobs)))
+    else:
+        matches = [fun (seed) for seed in seeds]
+    wall = time.perf_counter () - wall
+
+    if args.csv:
+        with open (args.csv, 'w', newline = '') as outfile:
+            writer = csv.DictWriter (outfile, fieldnames = list (matches[0]))
+            writer.writeheader ()
+            writer.writerows (matches)
+
+    print (summarize (matches))
+    print ('\n{:d} matches in {:.1f} s with {:d} processes'.format (
+           len (matches), wall, max (args.jobs, 1)))
+
+
+if __name__ == '__main__':
+    main ()
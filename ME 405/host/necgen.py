@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+## @file necgen.py
+#  This file generates the edge times seen by the infrared receiver when an
+#  NEC remote control button is pressed, so that the infrared capture 
+#  interrupt and decoder can be driven by simulations on the host. The
+#  receiver's output is active low, so each mark begins with a falling edge
+#  and ends with a rising edge; the capture channel is set to see both.
+#
+#  @copyright This program is released under the GNU Public License, 
+#  version 3.0. 
+
+
+## Length of the leader mark in microseconds
+LEADER_MARK = 9000
+
+## Length of the space after the leader mark of a data frame
+LEADER_SPACE = 4500
+
+## Length of the space after the leader mark of a repeat code
+REPEAT_SPACE = 2250
+
+## Length of the mark which starts each bit and ends each frame
+BIT_MARK = 562
+
+## Length of the space which follows the mark of a 0 bit
+ZERO_SPACE = 562
+
+## Length of the space which follows the mark of a 1 bit
+ONE_SPACE = 1687
+
+## Time from the start of one frame or repeat code to the start of the next
+FRAME_PERIOD = 108000
+
+
+def frame_edges (address, command, start_us = 0):
+    """ Compute the edge times of a data frame. The address, its inverse,
+    the command and its inverse are sent in that order, least significant
+    bit first.
+    @param address The 8-bit address
+    @param command The 8-bit command
+    @param start_us The time of the first edge in microseconds
+    @return A list of 68 edge times in microseconds """
+
+    word = ((address & 0xFF) | ((~address & 0xFF) << 8)
+            | ((command & 0xFF) << 16) | ((~command & 0xFF) << 24))
+    edges = [start_us, start_us + LEADER_MARK]
+    time = start_us + LEADER_MARK + LEADER_SPACE
+    for bit in range (32):
+        edges.append (time)
+        edges.append (time + BIT_MARK)
+        time += BIT_MARK + (ONE_SPACE if (word >> bit) & 1 else ZERO_SPACE)
+    edges.append (time)
+    edges.append (time + BIT_MARK)
+    return edges
+
+
+def repeat_edges (start_us = 0):
+    """ Compute the edge times of a repeat code, which is sent while a button
+    is held down.
+    @param start_us The time of the first edge in microseconds
+    @return A list of 4 edge times in microseconds """
+
+    time = start_us + LEADER_MARK + REPEAT_SPACE
+    return [start_us, start_us + LEADER_MARK, time, time + BIT_MARK]
+
+
+def press_edges (address, command, start_us = 0, repeats = 0):
+    """ Compute the edge times for a button press: a data frame followed by
+    repeat codes at the standard interval.
+    @param address The 8-bit address
+    @param command The 8-bit command
+    @param start_us The time of the first edge in microseconds
+    @param repeats The number of repeat codes which follow the frame
+    @return A list of edge times in microseconds """
+
+    edges = frame_edges (address, command, start_us)
+    for num in range (1, repeats + 1):
+        edges += repeat_edges (start_us + num * FRAME_PERIOD)
+    return edges
+
+
+def noisy_edges (edges, rand, jitter_us = 0.0, glitch_rate = 0.0,
+                 drop = 0.0):
+    """ Spoil a list of edges as a real receiver's output would be spoiled.
+    @param edges A list of edge times in microseconds, in order
+    @param rand A @c random.Random which decides how the edges are spoiled
+    @param jitter_us The standard deviation in microseconds of a random
+        shift added to each edge's time
+    @param glitch_rate The average number of glitches per second, each a
+        spurious pulse 20 to 200 us long, between the first and last edges
+    @param drop The chance that each edge is missed altogether
+    @return A new list of edge times, in order """
+
+    spoiled = [int (round (edge + rand.gauss (0.0, jitter_us)))
+               for edge in edges if rand.random () >= drop]
+    if edges and glitch_rate > 0.0:
+        time = edges[0]
+        while True:
+            time += rand.expovariate (glitch_rate) * 1000000
+            if time >= edges[-1]:
+                break
+            spoiled.append (int (time))
+            spoiled.append (int (time + rand.uniform (20.0, 200.0)))
+    spoiled.sort ()
+    return spoiled
+
+
+def schedule_edges (clock, channel, edges, wrap = 0xFFFF):
+    """ Schedule simulated capture interrupts for a list of edges on a 
+    virtual clock. At each edge's time the timer's count, which runs at 
+    1 MHz and wraps at @c wrap, is captured and the channel's callback run.
+    @param clock A @c vclock.VirtualClock
+    @param channel The @c pyb.TimerChannel stand-in which captures edges
+    @param edges A list of edge times in the clock's microseconds
+    @param wrap The timer's period, as a mask """
+
+    for edge in edges:
+        clock.at (edge, channel.trigger, edge & wrap)
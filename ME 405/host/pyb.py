@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+#
+## @file pyb.py
+#  This file is a host-side stand-in for the parts of the MicroPython @c pyb
+#  module used by the scheduler, the shared data classes and the robot's 
+#  tasks. Time and interrupts are handled by the clock chosen in 
+#  @c vclock.py; with a @c RealClock, @c wfi() sleeps for one system tick 
+#  as the CPU on the board would when woken by the 1 ms SysTick interrupt,
+#  and with a @c VirtualClock it jumps straight to the next event.
+#
+#  The hardware classes keep just enough state for a simulation to drive
+#  them: pin levels, ADC readings, timer counters, capture values and PWM 
+#  duty cycles. Methods marked "host only" don't exist on the board; they 
+#  are used by simulations to play the part of the outside world.
+#
+#  @copyright This program is released under the GNU Public License, 
+#  version 3.0. 
+
+import sys
+
+import vclock
+
+
+def disable_irq ():
+    """ Disable interrupts. 
+    @return The interrupt state, to be given to @c enable_irq() """
+
+    return vclock.clock.disable_irq ()
+
+
+def enable_irq (state = True):
+    """ Re-enable interrupts.
+    @param state The state returned by @c disable_irq() """
+
+    vclock.clock.enable_irq (state)
+
+
+def wfi ():
+    """ Wait for an interrupt. """
+
+    vclock.clock.wfi ()
+
+
+def delay (ms):
+    """ Wait for the given number of milliseconds.
+    @param ms The time to wait in milliseconds """
+
+    vclock.clock.sleep_us (ms * 1000)
+
+
+def udelay (us):
+    """ Wait for the given number of microseconds.
+    @param us The time to wait in microseconds """
+
+    vclock.clock.sleep_us (us)
+
+
+def millis ():
+    """ Get the number of milliseconds since the clock started.
+    @return The time in milliseconds """
+
+    return vclock.clock.ticks_ms ()
+
+
+def micros ():
+    """ Get the number of microseconds since the clock started.
+    @return The time in microseconds """
+
+    return vclock.clock.ticks_us ()
+
+
+class _Board:
+    """ Stand-in for @c Pin.board, whose attributes are named pins. Here each
+    pin is represented by its name. """
+
+    def __getattr__ (self, name):
+        return name
+
+
+class Pin:
+    """ Stand-in for a GPIO pin. The level of every pin is kept in a class
+    dictionary, keyed by pin name, so that outputs can be read and inputs
+    set by a simulation. """
+
+    IN = 0
+    OUT = 1
+    OUT_PP = 1
+    OUT_OD = 17
+    ALT = 2
+    AF_PP = 2
+    ANALOG = 3
+    PULL_NONE = None
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 1
+    IRQ_RISING = 2
+
+    board = _Board ()
+
+    # Pin levels and interrupt handlers, keyed by pin name
+    _levels = {}
+    _irqs = {}
+
+    ## Functions called with the pin and its new level whenever a pin's 
+    #  level changes, keyed by pin name; a simulation uses them to respond to
+    #  the robot's outputs (host only)
+    watchers = {}
+
+    def __init__ (self, name, mode = IN, pull = None, **kwargs):
+        """ Set up a pin.
+        @param name The name of the pin, such as @c 'PA5'
+        @param mode The pin's mode """
+
+        self.name = str (name)
+        self.mode = mode
+        Pin._levels.setdefault (self.name, 0)
+
+
+    def value (self, level = None):
+        """ Get or set the pin's level.
+        @param level The new level, or @c None to read the level
+        @return The pin's level if reading """
+
+        if level is None:
+            return Pin._levels[self.name]
+        self.drive (level)
+
+
+    def low (self):
+        """ Set the pin's level low. """
+
+        self.drive (0)
+
+
+    def high (self):
+        """ Set the pin's level high. """
+
+        self.drive (1)
+
+
+    def irq (self, handler = None, trigger = IRQ_FALLING | IRQ_RISING, 
+             **kwargs):
+        """ Set a function to be called when the pin's level changes.
+        @param handler The function, which is given this pin, or @c None
+        @param trigger Which edges, @c IRQ_RISING and/or @c IRQ_FALLING """
+
+        Pin._irqs[self.name] = (handler, trigger, self) if handler else None
+
+
+    def drive (self, level):
+        """ Set the pin's level, calling its interrupt handler if the change 
+        matches its trigger (host only).
+        @param level The new level """
+
+        level = 1 if level else 0
+        old = Pin._levels.get (self.name, 0)
+        Pin._levels[self.name] = level
+        watcher = Pin.watchers.get (self.name)
+        if watcher is not None and level != old:
+            watcher (self, level)
+        irq = Pin._irqs.get (self.name)
+        if irq and level != old:
+            handler, trigger, pin = irq
+            if trigger & (Pin.IRQ_RISING if level else Pin.IRQ_FALLING):
+                handler (pin)
+
+
+class ADC:
+    """ Stand-in for an analog to digital converter. Readings come from the
+    class dictionary @c sources, keyed by pin name, in which each entry is
+    either a number or a function which returns one. """
+
+    ## Readings for each pin, set by a simulation (host only)
+    sources = {}
+
+    ## The reading given for pins which have no source
+    DEFAULT = 2048
+
+    def __init__ (self, pin):
+        """ Set up an ADC on a pin.
+        @param pin The name of the pin """
+
+        self.name = str (pin)
+
+
+    def read (self):
+        """ Read the ADC.
+        @return The reading from @c sources, or @c DEFAULT """
+
+        source = ADC.sources.get (self.name, ADC.DEFAULT)
+        return int (source () if callable (source) else source)
+
+
+class TimerChannel:
+    """ Stand-in for a timer channel used for PWM, input capture or encoder
+    counting. """
+
+    def __init__ (self, timer, number, mode, **kwargs):
+        self.timer = timer
+        self.number = number
+        self.mode = mode
+        self._capture = 0
+        self._callback = None
+
+        ## The last duty cycle set in percent (host only)
+        self.percent = 0
+
+
+    def pulse_width_percent (self, percent = None):
+        """ Get or set the PWM duty cycle in percent.
+        @param percent The new duty cycle or @c None to read it
+        @return The duty cycle if reading """
+
+        if percent is None:
+            return self.percent
+        self.percent = percent
+
+
+    def capture (self, value = None):
+        """ Get or set the channel's capture value.
+        @param value The new capture value or @c None to read it
+        @return The capture value if reading """
+
+        if value is None:
+            return self._capture
+        self._capture = value & self.timer.period
+
+
+    def callback (self, fun):
+        """ Set the function to be called when the channel captures an edge.
+        @param fun The function, which is given the timer, or @c None """
+
+        self._callback = fun
+
+
+    def trigger (self, value):
+        """ Capture a timer value as if an edge had been seen and call the 
+        callback function (host only).
+        @param value The timer count at the edge """
+
+        self.capture (value)
+        if self._callback is not None:
+            self._callback (self.timer)
+
+
+class Timer:
+    """ Stand-in for a hardware timer. As on the board, creating a timer 
+    with the number of an existing timer gives the same timer. """
+
+    PWM = 0
+    PWM_INVERTED = 1
+    OC_TIMING = 2
+    IC = 8
+    ENC_A = 9
+    ENC_B = 10
+    ENC_AB = 11
+    RISING = 0
+    FALLING = 2
+    BOTH = 10
+
+    # The timers which have been created, keyed by number
+    _timers = {}
+
+    def __new__ (cls, number, **kwargs):
+        timer = Timer._timers.get (number)
+        if timer is None:
+            timer = super ().__new__ (cls)
+            timer.number = number
+            timer.period = 0xFFFF
+            timer._counter = 0
+            timer._channels = {}
+            Timer._timers[number] = timer
+        return timer
+
+
+    def __init__ (self, number, prescaler = None, period = None, 
+                  freq = None, **kwargs):
+        """ Set up the timer.
+        @param number The timer's number
+        @param period The value at which the counter wraps around """
+
+        if period is not None:
+            self.period = period
+
+
+    def channel (self, number, mode = None, **kwargs):
+        """ Set up a channel or get an existing one.
+        @param number The channel number
+        @param mode The channel's mode, or @c None to get an existing channel
+        @return The channel """
+
+        if mode is None:
+            return self._channels.get (number)
+        chan = self._channels.get (number)
+        if chan is None or chan.mode != mode:
+            chan = TimerChannel (self, number, mode, **kwargs)
+            self._channels[number] = chan
+        return chan
+
+
+    def counter (self, value = None):
+        """ Get or set the timer's counter.
+        @param value The new counter value or @c None to read it
+        @return The counter value if reading """
+
+        if value is None:
+            return self._counter & self.period
+        self._counter = value
+
+
+    @classmethod
+    def reset_all (cls):
+        """ Forget all timers, pin levels, pin watchers and ADC sources, as
+        when the board is reset (host only). """
+
+        cls._timers.clear ()
+        Pin._levels.clear ()
+        Pin._irqs.clear ()
+        Pin.watchers.clear ()
+        ADC.sources.clear ()
+
+
+class USB_VCP:
+    """ Stand-in for the USB virtual serial port. Nothing is ever received, 
+    and written data goes to standard output. """
+
+    def any (self):
+        """ Check for received characters; there never are any.
+        @return @c False """
+
+        return False
+
+
+    def read (self, nbytes = None):
+        """ Read received characters; there never are any.
+        @param nbytes The maximum number of bytes to read
+        @return @c None """
+
+        return None
+
+
+    def write (self, buf):
+        """ Write bytes to standard output.
+        @param buf The bytes to be written
+        @return The number of bytes written """
+
+        sys.stdout.buffer.write (bytes (buf))
+        return len (buf)
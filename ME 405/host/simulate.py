@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+#
+## @file simulate.py
+#  This program runs the robot's real task set from @c main.py on the host
+#  as a discrete-event simulation. The tasks, the scheduler and the shared
+#  data classes are the ones which run on the board; the stand-ins for 
+#  @c utime, @c pyb and @c machine in this directory take the place of the 
+#  hardware, and a @c vclock.VirtualClock keeps simulated time. When the
+#  scheduler has nothing to do the clock jumps straight to the next task run
+#  time or simulated interrupt, so a minute-long match takes well under a 
+#  second or so of real time, depending on how busy the tasks are.
+#
+#  The start button is pressed on the simulated remote control at the given 
+#  time, sending NEC frames through the infrared capture interrupt; the
+#  opponent is seen by the ultrasonic sensors at a fixed distance, each
+#  trigger pulse being answered by an echo pulse as long as the sound takes
+#  to get there and back. 
+#  @code
+#  python simulate.py --seconds 60 --press 0.5
+#  @endcode
+#
+#  The functions @c load_robot() and @c run() can also be used by other
+#  host-side programs which need to run the robot's tasks.
+#
+#  @copyright This program is released under the GNU Public License, 
+#  version 3.0. 
+
+import os
+import sys
+sys.path.insert (1, os.path.dirname (os.path.dirname (os.path.abspath (
+    __file__))))
+
+import argparse
+import contextlib
+import importlib
+import io
+import time
+
+import machine
+import pyb
+import utime
+import vclock
+import necgen
+
+
+## The modules which hold the robot's state and must be loaded afresh for
+#  each simulation
+ROBOT_MODULES = ('main', 'cotask', 'task_share', 'print_task', 'telemetry',
+                 'MotorClass', 'UltrasonicSourcedCode')
+
+## The address sent by the remote control
+IR_ADDRESS = 0
+
+## The command from the remote control which starts the robot
+IR_START = 12
+
+## Microseconds of echo pulse per inch of distance to the opponent
+US_PER_INCH = 2 * 74.1
+
+## The trigger and echo pins of the ultrasonic sensors
+SONAR_PINS = (('PA5', 'PA6'), ('PB8', 'PB9'))
+
+
+def load_robot (clock, stream = None, settings = None):
+    """ Load fresh copies of @c main.py and the modules it uses, with the 
+    given clock in place and the hardware stand-ins reset, and create the
+    robot's tasks in the system task list.
+    @param clock The @c vclock.VirtualClock for the simulation
+    @param stream A binary file to which the print task's output, including
+        the telemetry stream, is written, or @c None to throw it away
+    @param settings A dictionary of settings in @c main.py, such as
+        @c IR_DECODE_IN_ISR, to be changed before the tasks are created, or
+        @c None to use the settings as they are
+    @return The freshly loaded @c main module """
+
+    vclock.use (clock)
+    pyb.Timer.reset_all ()
+    machine.pulse_source = None
+    for trigger, echo in SONAR_PINS:
+        machine.connect_echo (trigger, echo)
+    for name in ROBOT_MODULES:
+        sys.modules.pop (name, None)
+
+    with contextlib.redirect_stdout (io.StringIO ()):
+        main = importlib.import_module ('main')
+
+    # The ultrasonic driver uses MicroPython's time.sleep_us()
+    sys.modules['UltrasonicSourcedCode'].time = utime
+
+    # The print task writes to the given file rather than to standard output
+    sys.modules['print_task'].set_stream (stream if stream else io.BytesIO ())
+
+    if settings:
+        for name, value in settings.items ():
+            setattr (main, name, value)
+    main.create_tasks (main.cotask.task_list)
+    clock.watch (main.cotask.task_list)
+    return main
+
+
+def ir_channel ():
+    """ Get the timer channel which captures infrared edges.
+    @return The @c pyb.TimerChannel stand-in for timer 1, channel 1 """
+
+    return pyb.Timer (1).channel (1)
+
+
+def run (main, clock, seconds, out = None, edf = False, until = None):
+    """ Run the robot's scheduler until the given simulated time.
+    @param main The @c main module from @c load_robot()
+    @param clock The simulation's @c vclock.VirtualClock
+    @param seconds The simulated time at which to stop, in seconds
+    @param out A file to which the tasks' printed output is written, or 
+        @c None to throw it away 
+    @param edf Set to @c True to schedule tasks earliest-deadline-first 
+    @param until A function which is called after each pass of the 
+        scheduler and returns @c True to stop early, or @c None """
+
+    end_us = int (seconds * 1000000)
+    sched = main.cotask.task_list.idle_sched
+    with contextlib.redirect_stdout (out if out else io.StringIO ()):
+        while clock.now_us < end_us:
+            sched (edf)
+            if until is not None and until ():
+                break
+
+
+def main ():
+    """ Run a simulation with settings from the command line and print the
+    task and share tables. """
+
+    parser = argparse.ArgumentParser (description = __doc__)
+    parser.add_argument ('--seconds', type = float, default = 60.0,
+                         help = 'simulated time to run')
+    parser.add_argument ('--press', type = float, default = 0.5,
+                         help = 'time at which the start button is pressed')
+    parser.add_argument ('--opponent', type = float, default = 20.0,
+                         help = 'distance to the opponent in inches')
+    parser.add_argument ('--start-us', type = int, default = 0,
+                         help = 'simulated time at which the clock starts')
+    parser.add_argument ('--edf', action = 'store_true',
+                         help = 'use earliest-deadline-first scheduling')
+    parser.add_argument ('--rm', action = 'store_true',
+                         help = 'give the tasks rate-monotonic priorities')
+    parser.add_argument ('--verbose', action = 'store_true',
+                         help = "show the tasks' printed output")
+    parser.add_argument ('--telemetry', metavar = 'FILE',
+                         help = 'save the telemetry stream to a file')
+    args = parser.parse_args ()
+
+    clock = vclock.VirtualClock (args.start_us)
+    stream = open (args.telemetry, 'wb') if args.telemetry else None
+    robot = load_robot (clock, stream)
+    if args.rm:
+        robot.cotask.task_list.rate_monotonic ()
+
+    echo_us = args.opponent * US_PER_INCH
+    machine.pulse_source = lambda pin: echo_us
+
+    # The infrared task sets up the capture callback when it first runs, 
+    # so the button is pressed a little after the simulation starts
+    edges = necgen.press_edges (IR_ADDRESS, IR_START, 
+                                args.start_us + int (args.press * 1000000))
+    necgen.schedule_edges (clock, ir_channel (), edges)
+
+    wall = time.perf_counter ()
+    run (robot, clock, (args.start_us / 1000000.0) + args.seconds,
+         sys.stdout if args.verbose else None, args.edf)
+    wall = time.perf_counter () - wall
+    if stream:
+        stream.close ()
+
+    print (str (robot.cotask.task_list))
+    print (robot.cotask.task_list.schedulability ())
+    print (robot.task_share.show_all ())
+    print (robot.telem)
+    print ('\nSimulated {:.1f} s in {:.3f} s of real time ({:.0f}x)'.format (
+           args.seconds, wall, args.seconds / wall))
+    print ('Motor state {:d}, IR {:d}, wfi calls {:d}'.format (
+           robot.motor_state.get (), robot.sensors.get (robot.IR_ON),
+           clock.wfi_count))
+
+
+if __name__ == '__main__':
+    main ()
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+#
+## @file spsc_stress.py
+#  This program checks that a queue shared between an interrupt service
+#  routine and a task can't lose or corrupt data when the ISR interrupts 
+#  the task. It runs on the host, where Python's tracing hooks are used to 
+#  stop the task's queue operation before each bytecode instruction in turn
+#  and run the ISR's queue operation there, as an interrupt could on the 
+#  board. After each trial the queue's contents and count are checked 
+#  against the items which were really put in and taken out.
+#
+#  Both directions are checked: an ISR putting items in while the task takes
+#  one out, and an ISR taking items out while the task puts one in. The 
+#  trials are repeated with the queue empty, partly full, nearly full and 
+#  with its indices about to wrap around. Queues made by the given factories
+#  are checked; by default these are a @c task_share.SPSCQueue and, for
+#  comparison, a @c task_share.Queue made with @c thread_protect=False as
+#  @c q0 in @c main.py used to be. The program exits with status 1 if the
+#  SPSC queue fails any trial.
+#  @code
+#  python spsc_stress.py
+#  @endcode
+#
+#  @copyright This program is released under the GNU Public License, 
+#  version 3.0. 
+
+import os
+import sys
+sys.path.insert (1, os.path.dirname (os.path.dirname (os.path.abspath (
+    __file__))))
+
+import task_share
+
+
+## The number of items which the queues under test can hold
+SIZE = 8
+
+## Numbers of items in the queue at the start of each trial
+FILLS = (0, 1, SIZE // 2, SIZE - 1, SIZE)
+
+## Starting positions of the queue's indices, to test wraparound
+OFFSETS = (0, SIZE - 1, SIZE)
+
+
+class Preempter:
+    """ This class runs a task-side function under Python's tracer and calls
+    an ISR-side function just before the task-side code runs its n-th 
+    bytecode instruction. Only code in the given code objects is counted, so
+    that the instructions counted are those of the queue's methods. """
+
+    def __init__ (self, codes):
+        """ Set up the preempter.
+        @param codes A set of code objects whose instructions are counted """
+
+        self._codes = codes
+        self._count = 0
+        self._fire_at = 0
+        self._isr = None
+        self._in_isr = False
+
+        ## Whether the ISR was run during the last call to @c run()
+        self.fired = False
+
+
+    def _global (self, frame, event, arg):
+        if self._in_isr or frame.f_code not in self._codes:
+            return None
+        frame.f_trace_opcodes = True
+        frame.f_trace_lines = False
+        return self._local
+
+
+    def _local (self, frame, event, arg):
+        if event == 'opcode' and not self._in_isr:
+            self._count += 1
+            if self._count == self._fire_at:
+                self._in_isr = True
+                try:
+                    self._isr ()
+                finally:
+                    self._in_isr = False
+                self.fired = True
+        return self._local
+
+
+    def run (self, task_fun, isr_fun, fire_at):
+        """ Run the task-side function, interrupting it with the ISR-side
+        function just before its @c fire_at -th instruction.
+        @param task_fun The function run by the task
+        @param isr_fun The function run by the ISR
+        @param fire_at Which instruction to interrupt, counting from 1
+        @return The task-side function's return value """
+
+        self._count = 0
+        self._fire_at = fire_at
+        self._isr = isr_fun
+        self.fired = False
+        sys.settrace (self._global)
+        try:
+            return task_fun ()
+        finally:
+            sys.settrace (None)
+
+
+def queue_codes (queue):
+    """ Gather the code objects of all the methods of a queue's class.
+    @param queue The queue
+    @return A set of code objects """
+
+    codes = set ()
+    for cls in type (queue).__mro__:
+        for value in vars (cls).values ():
+            code = getattr (value, '__code__', None)
+            if code is not None:
+                codes.add (code)
+    return codes
+
+
+def prepare (factory, fill, offset):
+    """ Make a queue and put it into a known state.
+    @param factory A function which makes an empty queue
+    @param fill The number of items to leave in the queue
+    @param offset How many items to pass through first, to move the indices
+    @return The queue and a list of the items in it """
+
+    queue = factory ()
+    for item in range (offset):
+        queue.put (1000 + item)
+        queue.get ()
+    items = []
+    for item in range (fill):
+        queue.put (item)
+        items.append (item)
+    return queue, items
+
+
+def check (queue, expected):
+    """ Check that a queue's count and contents match what should be there,
+    emptying the queue.
+    @param queue The queue
+    @param expected A list of the items which should be in the queue
+    @return A description of the problem, or @c None if there isn't one """
+
+    count = queue.num_in ()
+    if count != len (expected):
+        return 'count {:d}, expected {:d}'.format (count, len (expected))
+    got = []
+    for num in range (count):
+        got.append (queue.get ())
+    if got != expected:
+        return 'contents {:s}, expected {:s}'.format (str (got), 
+                                                      str (expected))
+    return None
+
+
+def trials (factory):
+    """ Run every trial on queues made by a factory.
+    @param factory A function which makes an empty queue
+    @return A tuple holding the number of trials and a list of failures """
+
+    count = 0
+    failures = []
+    for direction in ('isr-put', 'isr-get'):
+        for fill in FILLS:
+            for offset in OFFSETS:
+                fire_at = 1
+                while True:
+                    queue, items = prepare (factory, fill, offset)
+                    pre = Preempter (queue_codes (queue))
+                    result = {}
+
+                    if direction == 'isr-put':
+                        # The ISR puts an item in unless the queue is full, 
+                        # while the task takes one out if there is one
+                        def isr ():
+                            if not queue.full ():
+                                queue.put (500, in_ISR = True)
+                                result['put'] = True
+
+                        def task ():
+                            if queue.any ():
+                                result['got'] = queue.get ()
+                    else:
+                        # The ISR takes an item out if there is one, while 
+                        # the task puts one in if there's room
+                        def isr ():
+                            if queue.any ():
+                                result['got'] = queue.get (in_ISR = True)
+
+                        def task ():
+                            if not queue.full ():
+                                queue.put (500)
+                                result['put'] = True
+
+                    pre.run (task, isr, fire_at)
+                    if not pre.fired:
+                        break
+
+                    # Items leave the queue in the order they went in, so
+                    # whichever side took an item out should have taken the
+                    # first one, and the rest should still be there
+                    expected = items + ([500] if 'put' in result else [])
+                    if 'got' in result:
+                        if not expected or result['got'] != expected[0]:
+                            failures.append ((direction, fill, offset, 
+                                fire_at, 'got {:d}'.format (result['got'])))
+                        expected = expected[1:]
+
+                    problem = check (queue, expected)
+                    if problem:
+                        failures.append ((direction, fill, offset, fire_at,
+                                          problem))
+                    count += 1
+                    fire_at += 1
+    return count, failures
+
+
+def main ():
+    """ Run the trials on the SPSC queue and on an unprotected queue, and 
+    print the results.
+    @return The exit status, 0 if the SPSC queue passed or 1 if not """
+
+    factories = (
+        ('SPSCQueue', lambda: task_share.SPSCQueue ('I', SIZE)),
+        ('Queue (thread_protect=False)', 
+         lambda: task_share.Queue ('I', SIZE, thread_protect = False)))
+
+    status = 0
+    for name, factory in factories:
+        count, failures = trials (factory)
+        print ('{:<30s} {:5d} preemption points  {:5d} failures'.format (
+               name, count, len (failures)))
+        for failure in failures[:5]:
+            print ('    {:s} fill {:d} offset {:d} at instruction {:d}: '
+                   '{:s}'.format (*failure))
+        if failures and factory is factories[0][1]:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit (main ())
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+## @file telemetry_check.py
+#  This program checks that @c telemetry.Telemetry can send the values of
+#  shares of every type code which arrays have, and that
+#  @c telemetry_decode.py gets the same values back. It makes a share of
+#  each type holding a value near the end of its range, or a fraction for
+#  the floating point types, builds a @c Telemetry over every share in
+#  @c task_share.share_list as @c items=None does, and sends a frame
+#  through the print task into a buffer. Then it checks records, flag
+#  registers, records sent as bits and shares sent in fewer bytes than they
+#  hold, whose values should come back modulo the smaller size, and that a
+#  floating point share can't be sent with an integer code. The program
+#  exits with status 1 if any check fails.
+#  @code
+#  python telemetry_check.py
+#  @endcode
+#
+#  @copyright This program is released under the GNU Public License,
+#  version 3.0.
+
+import os
+import sys
+sys.path.insert (1, os.path.dirname (os.path.dirname (os.path.abspath (
+    __file__))))
+
+import io
+import struct
+
+import vclock
+import task_share
+import print_task
+import telemetry
+import telemetry_decode
+
+
+## A value to send for each type code, and the value expected back
+VALUES = {'b': -128, 'B': 255, 'h': -32768, 'H': 65535, 'i': -2 ** 31,
+          'I': 2 ** 32 - 1, 'l': -2 ** 31, 'L': 2 ** 32 - 1,
+          'q': -2 ** 63, 'Q': 2 ** 64 - 1, 'f': -2.25, 'd': 1.0 / 3.0}
+
+
+def send_frame (telem):
+    """ Send one telemetry frame, with its header, and decode it.
+    @param telem The @c Telemetry object which sends the frame
+    @return The @c telemetry_decode.Stream holding the decoded frame """
+
+    out = io.BytesIO ()
+    print_task.set_stream (out)
+    telem.start ()
+    telem.send ()
+    while print_task.print_queue.any ():
+        next (print_task.print_task._run_gen)
+    return telemetry_decode.decode (out.getvalue ())
+
+
+def expect (failed, what, stream, wanted):
+    """ Check the values in the one frame of a decoded stream.
+    @param failed The list to which a description of a failure is added
+    @param what A description of what's being checked
+    @param stream The decoded stream
+    @param wanted A dictionary from column name to the expected value """
+
+    if len (stream.rows) != 1:
+        failed.append ('{:s}: {:d} frames decoded, expected 1'.format (
+                       what, len (stream.rows)))
+        return
+    for name, value in wanted.items ():
+        got = stream.column (name)[0]
+        if got != value:
+            failed.append ('{:s}: {:s} is {!r}, expected {!r}'.format (
+                           what, name, got, value))
+
+
+def single (value):
+    """ Round a number to single precision, as it is when sent as @c 'f'.
+    @param value The number
+    @return The number as it comes back from a 4-byte float """
+
+    return struct.unpack ('<f', struct.pack ('<f', value))[0]
+
+
+def main ():
+    """ Run the checks and print the results.
+    @return 0 if every check passed, 1 if not """
+
+    vclock.use (vclock.VirtualClock (0))
+    failed = []
+
+    # A share of every type, sent with items=None as the share list holds
+    del task_share.share_list[:]
+    for code, value in VALUES.items ():
+        share = task_share.Share (code, name = 'Share_' + code)
+        share.put (value)
+    values = dict (('Share_' + code, value) 
+                   for code, value in VALUES.items ())
+    try:
+        expect (failed, 'every type', send_frame (telemetry.Telemetry ()),
+                values)
+    except Exception as err:
+        failed.append ('every type: {:s}: {!s}'.format (
+                       type (err).__name__, err))
+
+    # Records, a flag register, a record of bits and narrowed shares
+    del task_share.share_list[:]
+    floats = task_share.Record ('d', ('X', 'Y'), name = 'Position')
+    floats.put (0, -0.5)
+    floats.put (1, 1e100)
+    counts = task_share.Record ('h', ('Low', 'High'), name = 'Counts')
+    counts.put (0, -7)
+    counts.put (1, 7)
+    seen = task_share.Record ('B', ('Left', 'Right', 'Ahead'), name = 'Seen')
+    seen.put (0, 1)
+    seen.put (2, 5)
+    flags = task_share.Flags (('Done', 'Busy'), name = 'Flags')
+    flags.set (flags.mask ('Busy'))
+    small = task_share.Share ('I', name = 'Small')
+    small.put (300)
+    signed = task_share.Share ('i', name = 'Signed')
+    signed.put (-1234)
+    speed = task_share.Share ('d', name = 'Speed')
+    speed.put (0.1)
+    try:
+        telem = telemetry.Telemetry ((floats, counts, seen, flags, small, 
+                                      signed, speed),
+                                     codes = {small: 'B', signed: 'h',
+                                              speed: 'f'},
+                                     bits = (seen, ))
+        expect (failed, 'records and narrowing', send_frame (telem),
+                {'X': -0.5, 'Y': 1e100, 'Low': -7, 'High': 7, 'Left': 1,
+                 'Right': 0, 'Ahead': 1, 'Done': 0, 'Busy': 1,
+                 'Small': 300 & 0xFF, 'Signed': -1234,
+                 'Speed': single (0.1)})
+    except Exception as err:
+        failed.append ('records and narrowing: {:s}: {!s}'.format (
+                       type (err).__name__, err))
+
+    # Floating point values can't be packed as integers
+    try:
+        telemetry.Telemetry ((speed, ), codes = {speed: 'h'})
+        failed.append ('a float share was accepted with an integer code')
+    except ValueError:
+        pass
+
+    del task_share.share_list[:]
+    for line in failed:
+        print ('FAILED ' + line)
+    print ('{:d} checks failed'.format (len (failed)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit (main ())
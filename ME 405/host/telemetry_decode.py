@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+#
+## @file telemetry_decode.py
+#  This program turns a telemetry stream saved from the robot's serial port,
+#  or from @c simulate.py @c --telemetry, into columns of numbers. The stream
+#  begins with the @c "#TLM " header line written by
+#  @c telemetry.Telemetry.start(), which gives the format of the frames and
+#  the names of the values; after that, frames are found by their sync word
+#  and checked with their checksums, so text which was printed between them
+#  is skipped. Lost frames are found from gaps in the sequence numbers, and
+#  the 16-bit millisecond times are unwrapped so that they keep increasing;
+#  a gap of more than 255 frames or 65.5 seconds in the stream is taken as a
+#  shorter one. Words of bits are split into a column for each bit.
+#  @code
+#  python simulate.py --seconds 10 --telemetry run.bin
+#  python telemetry_decode.py run.bin --csv run.csv
+#  @endcode
+#
+#  The function @c decode() can also be used by other host-side programs.
+#
+#  @copyright This program is released under the GNU Public License,
+#  version 3.0.
+
+import argparse
+import csv
+import struct
+import sys
+
+
+## The byte with which each frame begins
+SYNC = b'\xaa'
+
+## The text with which the header line begins
+HEADER = b'#TLM '
+
+## The period of the millisecond times in the frames, which wrap around
+TICKS_PERIOD = 1 << 16
+
+## The period of the sequence numbers in the frames
+SEQ_PERIOD = 1 << 8
+
+
+class Stream:
+    """ The decoded contents of a telemetry stream. """
+
+    def __init__ (self, names):
+        """ Make an empty set of columns.
+        @param names The names of the values in each frame; a word of bits 
+            is named by the word's name followed by the names of its bits,
+            separated by @c '|', in brackets """
+
+        ## The names of the columns: sequence number, time, then the values,
+        #  with a column for each bit of a word of bits
+        self.names = ['seq', 'time_ms']
+
+        # For each value in a frame, the number of bits into which it's 
+        # split, or 0 if it isn't
+        self._splits = []
+        for name in names:
+            if name.endswith (']') and '[' in name:
+                bits = name[name.index ('[') + 1:-1].split ('|')
+                self.names += bits
+                self._splits.append (len (bits))
+            else:
+                self.names.append (name)
+                self._splits.append (0)
+
+        ## The rows, each a list of numbers in the order of @c names
+        self.rows = []
+
+        ## The number of frames which were missing from the stream
+        self.lost = 0
+
+        ## The number of places where a sync word was found but the checksum
+        #  was wrong, as happens for damaged frames and for text which looks
+        #  like a sync word
+        self.bad = 0
+
+
+    def column (self, name):
+        """ Get one column of the decoded values.
+        @param name The name of the column
+        @return A list of the values in the column """
+
+        idx = self.names.index (name)
+        return [row[idx] for row in self.rows]
+
+
+    def add (self, seq, time_ms, values):
+        """ Add a row for a frame, splitting words of bits into their bits.
+        @param seq The frame's sequence number
+        @param time_ms The frame's unwrapped time
+        @param values The values in the frame """
+
+        row = [seq, time_ms]
+        for value, bits in zip (values, self._splits):
+            if bits:
+                row += [(value >> bit) & 1 for bit in range (bits)]
+            else:
+                row.append (value)
+        self.rows.append (row)
+
+
+def decode (data):
+    """ Decode a telemetry stream.
+    @param data The bytes of the stream, including the header line
+    @return A @c Stream holding the decoded frames
+    @raise ValueError if the stream has no header line """
+
+    start = data.find (HEADER)
+    if start < 0:
+        raise ValueError ('no telemetry header in the stream')
+    end = data.index (b'\n', start)
+    fmt, names = data[start + len (HEADER):end].decode ().split (' ', 1)
+    names = names.split (',')
+    frame = struct.Struct (fmt)
+    result = Stream (names)
+
+    prev_seq = None
+    base_ms = 0
+    prev_ms = None
+    pos = end + 1
+    while True:
+        pos = data.find (SYNC, pos)
+        if pos < 0 or pos + frame.size > len (data):
+            break
+        chunk = data[pos:pos + frame.size]
+        if sum (chunk[1:-1]) & 0xFF != chunk[-1]:
+            result.bad += 1
+            pos += 1
+            continue
+        values = frame.unpack (chunk)
+        seq, ms = values[1], values[2]
+
+        if prev_seq is not None:
+            result.lost += (seq - prev_seq - 1) % SEQ_PERIOD
+        prev_seq = seq
+
+        # Unwrap the millisecond time so that it keeps increasing
+        if prev_ms is not None and ms < prev_ms:
+            base_ms += TICKS_PERIOD
+        prev_ms = ms
+
+        result.add (seq, ms + base_ms, values[3:-1])
+        pos += frame.size
+
+    return result
+
+
+def main ():
+    """ Decode a telemetry file and write its columns as CSV. """
+
+    parser = argparse.ArgumentParser (description = __doc__)
+    parser.add_argument ('file', help = 'the saved telemetry stream')
+    parser.add_argument ('--csv', metavar = 'FILE',
+                         help = 'write the columns here, not to stdout')
+    args = parser.parse_args ()
+
+    with open (args.file, 'rb') as infile:
+        stream = decode (infile.read ())
+
+    out = open (args.csv, 'w', newline = '') if args.csv else sys.stdout
+    writer = csv.writer (out)
+    writer.writerow (stream.names)
+    writer.writerows (stream.rows)
+    if args.csv:
+        out.close ()
+
+    print ('{:d} frames, {:d} lost, {:d} bad checksums'.format (
+           len (stream.rows), stream.lost, stream.bad), file = sys.stderr)
+
+
+if __name__ == '__main__':
+    main ()
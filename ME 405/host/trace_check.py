@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+## @file trace_check.py
+#  This program checks the transition traces kept by @c cotask.Task in its
+#  ring buffer. A traced task which changes state on every run is run on a
+#  @c vclock.VirtualClock, a known time apart, for every number of
+#  transitions from none to more than twice what the buffer holds,
+#  including the number which exactly fills it. After each, the binary trace
+#  written by @c Task.dump_trace() and the text made by @c Task.get_trace()
+#  are checked against the most recent transitions, oldest first. The
+#  program exits with status 1 if any check fails.
+#  @code
+#  python trace_check.py --size 3
+#  @endcode
+#
+#  @copyright This program is released under the GNU Public License,
+#  version 3.0.
+
+import os
+import sys
+sys.path.insert (1, os.path.dirname (os.path.dirname (os.path.abspath (
+    __file__))))
+
+import argparse
+import io
+import struct
+
+import vclock
+import cotask
+
+
+## The simulated time in microseconds between runs of the traced task
+STEP_US = 1000
+
+
+def stepping_fun ():
+    """ A task function which goes to a new state, 1, 2, 3 and so on, each
+    time it runs. """
+
+    state = 0
+    while True:
+        state += 1
+        yield (state)
+
+
+def check (size, count):
+    """ Run a traced task through a number of transitions and check its
+    trace.
+    @param size The number of transitions the trace buffer holds
+    @param count The number of transitions to make
+    @return A list of descriptions of the checks which failed """
+
+    vclock.use (vclock.VirtualClock (0))
+    task = cotask.Task (stepping_fun, name = 'Traced', trace = True,
+                        trace_size = size)
+    for _ in range (count):
+        vclock.clock.sleep_us (STEP_US)
+        task._run ()
+
+    # The transitions which should have been kept, oldest first: the time
+    # since the previous transition and the state gone to
+    kept = [(STEP_US, state) for state in range (max (count - size, 0) + 1,
+                                                   count + 1)]
+    failed = []
+
+    stream = io.BytesIO ()
+    written = task.dump_trace (stream)
+    data = stream.getvalue ()
+    dumped = list (struct.iter_unpack ('<ii', data))
+    if written != len (data):
+        failed.append ('dump_trace() returned {:d} but wrote {:d} '
+                       'bytes'.format (written, len (data)))
+    if dumped != kept:
+        failed.append ('dump_trace() wrote {!r}, expected {!r}'.format (
+                       dumped, kept))
+
+    lines = task.get_trace ().splitlines ()[1:]
+    states = [int (line.split ('->')[1]) for line in lines]
+    if states != [state for _, state in kept]:
+        failed.append ('get_trace() listed states {!r}, expected {!r}'
+                       .format (states, [state for _, state in kept]))
+    return failed
+
+
+def main ():
+    """ Check traces of every length up to a bit more than twice the size of
+    the buffer and print the results.
+    @return 0 if every check passed, 1 if not """
+
+    parser = argparse.ArgumentParser (description = __doc__)
+    parser.add_argument ('--size', type = int, default = 3,
+                         help = 'transitions held by the trace buffer')
+    args = parser.parse_args ()
+
+    failures = 0
+    for count in range (2 * args.size + 2):
+        failed = check (args.size, count)
+        note = '  (exactly full)' if count == args.size else ''
+        print ('{: 4d} transitions: {:s}{:s}'.format (
+               count, 'FAILED' if failed else 'ok', note))
+        for line in failed:
+            print ('    ' + line)
+        failures += len (failed)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit (main ())
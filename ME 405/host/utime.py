@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+## @file utime.py
+#  This file is a host-side stand-in for the MicroPython @c utime module. It
+#  lets @c cotask.py, @c task_share.py and the tasks which use them be run 
+#  and measured under CPython on a desktop computer. Put the @c host 
+#  directory at the front of @c sys.path before importing those modules. 
+#  The tick counters wrap around at 2**30, as they do on the board, so that
+#  code which doesn't use @c ticks_diff() properly will be caught. Time is
+#  kept by the clock chosen in @c vclock.py, which may be a virtual one.
+#
+#  @copyright This program is released under the GNU Public License, 
+#  version 3.0. 
+
+import vclock
+
+
+## The tick counters wrap around at this value, as on the STM32 port
+TICKS_PERIOD = vclock.TICKS_PERIOD
+
+# Half the tick period, used to turn tick differences into signed numbers
+_TICKS_HALF = TICKS_PERIOD >> 1
+
+
+def ticks_us ():
+    """ Return a microsecond counter which wraps around at @c TICKS_PERIOD.
+    @return The current time in microseconds """
+
+    return vclock.clock.ticks_us ()
+
+
+def ticks_ms ():
+    """ Return a millisecond counter which wraps around at @c TICKS_PERIOD.
+    @return The current time in milliseconds """
+
+    return vclock.clock.ticks_ms ()
+
+
+def ticks_add (ticks, delta):
+    """ Add a signed number of ticks to a tick count, wrapping around.
+    @param ticks A value from @c ticks_us() or @c ticks_ms()
+    @param delta The number of ticks to be added, positive or negative
+    @return The wrapped sum """
+
+    return (ticks + delta) % TICKS_PERIOD
+
+
+def ticks_diff (ticks1, ticks2):
+    """ Compute the signed difference @c ticks1 - @c ticks2 between two tick
+    counts, allowing for wraparound.
+    @param ticks1 The later tick count
+    @param ticks2 The earlier tick count
+    @return The signed difference in ticks """
+
+    return ((ticks1 - ticks2 + _TICKS_HALF) % TICKS_PERIOD) - _TICKS_HALF
+
+
+def sleep_us (us):
+    """ Wait for the given number of microseconds.
+    @param us The time to wait in microseconds """
+
+    vclock.clock.sleep_us (us)
+
+
+def sleep_ms (ms):
+    """ Wait for the given number of milliseconds.
+    @param ms The time to wait in milliseconds """
+
+    vclock.clock.sleep_us (ms * 1000)
+
+
+def sleep (seconds):
+    """ Wait for the given number of seconds.
+    @param seconds The time to wait in seconds """
+
+    vclock.clock.sleep_us (int (seconds * 1000000))
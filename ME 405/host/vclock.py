@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#
+## @file vclock.py
+#  This file contains the time and interrupt backends used by the host-side
+#  stand-ins for @c utime, @c pyb and @c machine. The stand-ins don't keep 
+#  time themselves; they call the methods of whichever clock has been put in
+#  place with @c use(). By default this is a @c RealClock, which follows the
+#  host's own clock. A @c VirtualClock instead keeps simulated time which 
+#  moves only when code waits, so that tasks run as a discrete-event 
+#  simulation: when the scheduler goes to sleep the clock jumps straight to
+#  the next task run time or simulated interrupt, and minutes of simulated
+#  running take milliseconds of real time.
+#
+#  Example:
+#  @code
+#  import vclock
+#  clock = vclock.use (vclock.VirtualClock ())
+#  clock.watch (cotask.task_list)
+#  clock.after (500000, some_isr, arg)      # Runs 0.5 s into the simulation
+#  while clock.now_us < 60000000:
+#      cotask.task_list.idle_sched ()
+#  @endcode
+#
+#  @copyright This program is released under the GNU Public License, 
+#  version 3.0. 
+
+import heapq
+import time
+
+
+## The tick counters wrap around at this value, as on the STM32 port
+TICKS_PERIOD = 1 << 30
+
+## The period of the system tick interrupt which wakes the CPU from @c wfi()
+SYSTICK_US = 1000
+
+
+class RealClock:
+    """ This class is a backend which follows the host computer's clock. 
+    Interrupts are simulated, if at all, by other threads, so disabling 
+    interrupts does nothing. """
+
+    def ticks_us (self):
+        """ Get the time from a wrapping microsecond counter.
+        @return The current time in microseconds """
+
+        return (time.perf_counter_ns () // 1000) % TICKS_PERIOD
+
+
+    def ticks_ms (self):
+        """ Get the time from a wrapping millisecond counter.
+        @return The current time in milliseconds """
+
+        return (time.perf_counter_ns () // 1000000) % TICKS_PERIOD
+
+
+    def sleep_us (self, us):
+        """ Wait for the given number of microseconds.
+        @param us The time to wait in microseconds """
+
+        if us > 0:
+            time.sleep (us / 1000000.0)
+
+
+    def wfi (self):
+        """ Wait for an interrupt, which is at the latest the next system
+        tick. """
+
+        time.sleep (SYSTICK_US / 1000000.0)
+
+
+    def disable_irq (self):
+        """ Disable interrupts, which does nothing on the host.
+        @return The previous interrupt state """
+
+        return True
+
+
+    def enable_irq (self, state = True):
+        """ Re-enable interrupts, which does nothing on the host.
+        @param state The state returned by @c disable_irq() """
+
+        pass
+
+
+class VirtualClock:
+    """ This class is a backend which keeps simulated time. Time only moves
+    forward when code waits, by sleeping or by calling @c wfi() or by a 
+    blocking call in a hardware stand-in. Simulated interrupts are callbacks
+    scheduled with @c at() or @c after(); each one is run, with the clock 
+    set to its time, when the clock moves past that time while interrupts
+    are enabled. """
+
+    def __init__ (self, start_us = 0):
+        """ Create a virtual clock.
+        @param start_us The simulated time at which the clock starts, in 
+            microseconds. Starting near the tick counter's wraparound point
+            is a good way to check code which uses the tick counters """
+
+        ## The simulated time in microseconds, which does not wrap around
+        self.now_us = start_us
+
+        ## The number of times @c wfi() has been called
+        self.wfi_count = 0
+
+        # The heap of pending simulated interrupts, each a tuple holding the
+        # time, a serial number to keep ordering stable, a function and its
+        # arguments
+        self._events = []
+        self._serial = 0
+
+        # Task lists whose run times are deadlines for wfi() to wake at
+        self._lists = []
+
+        self._irq_on = True
+
+
+    def ticks_us (self):
+        """ Get the simulated time from a wrapping microsecond counter.
+        @return The simulated time in microseconds """
+
+        return self.now_us % TICKS_PERIOD
+
+
+    def ticks_ms (self):
+        """ Get the simulated time from a wrapping millisecond counter.
+        @return The simulated time in milliseconds """
+
+        return (self.now_us // 1000) % TICKS_PERIOD
+
+
+    def at (self, time_us, fun, *args):
+        """ Schedule a simulated interrupt at the given simulated time.
+        @param time_us The simulated time in microseconds, as in @c now_us
+        @param fun The function to be called at that time
+        @param args Arguments to be given to the function """
+
+        self._serial += 1
+        heapq.heappush (self._events, (int (time_us), self._serial, fun, 
+                                       args))
+
+
+    def after (self, delay_us, fun, *args):
+        """ Schedule a simulated interrupt a given time from now.
+        @param delay_us The time from now in microseconds
+        @param fun The function to be called at that time
+        @param args Arguments to be given to the function """
+
+        self.at (self.now_us + delay_us, fun, *args)
+
+
+    def watch (self, task_list):
+        """ Make @c wfi() wake up when a timed task in the given task list is
+        due to run, so the clock can jump straight to that time.
+        @param task_list A @c cotask.TaskList """
+
+        self._lists.append (task_list)
+
+
+    def advance_to (self, time_us):
+        """ Move the simulated time forward, running the simulated interrupts
+        which come due on the way. If interrupts are disabled, they are held
+        until they're enabled again.
+        @param time_us The simulated time to move to in microseconds """
+
+        events = self._events
+        while events and events[0][0] <= time_us and self._irq_on:
+            when, serial, fun, args = heapq.heappop (events)
+            if when > self.now_us:
+                self.now_us = when
+            fun (*args)
+        if time_us > self.now_us:
+            self.now_us = time_us
+
+
+    def sleep_us (self, us):
+        """ Wait for the given number of microseconds of simulated time.
+        @param us The time to wait in microseconds """
+
+        self.advance_to (self.now_us + max (int (us), 0))
+
+
+    def next_wake (self):
+        """ Find the simulated time at which the CPU would next be woken from
+        sleep: the next simulated interrupt or the first time after which a
+        watched timed task will be ready, whichever is sooner. 
+        @return The time in microseconds, or @c None if nothing is pending """
+
+        wake = self._events[0][0] if self._events else None
+        ticks = self.ticks_us ()
+        for task_list in self._lists:
+            deadline = task_list.next_deadline ()
+            if deadline is not None:
+                diff = ((deadline - ticks + TICKS_PERIOD // 2) % TICKS_PERIOD
+                        - TICKS_PERIOD // 2)
+                due = self.now_us + max (diff + 1, 0)
+                if wake is None or due < wake:
+                    wake = due
+        return wake
+
+
+    def wfi (self):
+        """ Wait for an interrupt. The clock jumps straight to the time given
+        by @c next_wake(), or by one system tick if nothing is pending. """
+
+        self.wfi_count += 1
+        wake = self.next_wake ()
+        if wake is None or wake <= self.now_us:
+            wake = self.now_us + (SYSTICK_US if wake is None else 0)
+        self.advance_to (wake)
+
+
+    def disable_irq (self):
+        """ Disable simulated interrupts. 
+        @return The previous interrupt state """
+
+        state = self._irq_on
+        self._irq_on = False
+        return state
+
+
+    def enable_irq (self, state = True):
+        """ Restore the simulated interrupt state. Interrupts which came due 
+        while they were disabled are run now.
+        @param state The state returned by @c disable_irq() """
+
+        self._irq_on = state
+        if state:
+            self.advance_to (self.now_us)
+
+
+## The clock used by the stand-in modules
+clock = RealClock ()
+
+
+def use (new_clock):
+    """ Put a clock in place for the stand-in modules to use.
+    @param new_clock A @c RealClock or @c VirtualClock
+    @return The clock, for convenience """
+
+    global clock
+    clock = new_clock
+    return new_clock
@@ -9,14 +9,17 @@ Created on Fri Mar  6 14:33:41 2020
 import pyb
 from micropython import alloc_emergency_exception_buf
 import gc
+import array
 
 import cotask
 import task_share
+import telemetry
 
 from MotorClass import MotorEncoder
 from MotorClass import MotorCtl
 from MotorClass import MotorDriver
 from UltrasonicSourcedCode import HCSR04
+from nec_decoder import NECDecoder, EdgeRecorder, NOTHING, REPEAT
 
 alloc_emergency_exception_buf (1000)
 
@@ -29,41 +32,83 @@ ch1 = tim1.channel (1, pyb.Timer.IC, polarity = pyb.Timer.BOTH, pin = pinPA8)
 #
 #
 # ============================ QUEUES AND SHARES ==============================
-q0 = task_share.Queue ('I', 68, thread_protect = False, overwrite = False,
-                           name = "Queue_0")
-IR_share = task_share.Share('B', thread_protect = True, name = 'IR_ON_OFF')
-
-
-front_sensor_L = task_share.Share('B', thread_protect = True, 
-                                  name = 'Left Front Sensor')
-front_sensor_R = task_share.Share('B', thread_protect = True, 
-                                  name = 'Right Front Sensor')
+# The command of the remote control button which starts the robot; any other
+# button stops it
+IR_START = 12
+
+# If True, the capture interrupt decodes the infrared edges itself and only 
+# a finished, checked command changes the IR_ON field, so the robot reacts 
+# as soon as a packet ends. If False, the interrupt puts the edge times into
+# q0 and the infrared task decodes them
+IR_DECODE_IN_ISR = True
+
+# The decoder which the infrared edges are fed to, by the capture interrupt
+# or by the infrared task
+ir_decoder = NECDecoder()
+
+# The number of the most recent infrared edge times which the capture 
+# interrupt records, so they can be written out the serial port when the 
+# program is stopped and replayed on a PC with host/ir_replay.py. Set to 0 to
+# record nothing
+IR_RECORD_EDGES = 0
+if IR_RECORD_EDGES > 0:
+    ir_recorder = EdgeRecorder(IR_RECORD_EDGES)
+else:
+    ir_recorder = None
+
+# The capture interrupt puts edge times into q0 and the infrared task takes
+# them out, so a single-producer, single-consumer queue is used; it needs no
+# interrupt masking and can't lose track of its count. It isn't needed when
+# the interrupt does the decoding, so it's made by create_tasks() only when
+# IR_DECODE_IN_ISR is False
+q0 = None
+
+# The most edge times the infrared task takes out of q0 and decodes in one
+# run. All the waiting edges are decoded at once unless more than this many
+# have piled up during a long stall, in which case the rest are left for the
+# next run so that this run doesn't hold up the other tasks for long
+IR_EDGES_PER_RUN = 16
+
+# The sensor readings which Mastermind bases its decisions on are kept in one
+# record, so it can read all of them at once with a single interrupt lock and
+# get a consistent set. These are the indices of the record's fields
+IR_ON = 0                  # remote control has started the robot
+LINE_L = 1                 # left front line sensor sees the edge
+LINE_R = 2                 # right front line sensor sees the edge
+OPP_1 = 3                  # left ultrasonic sensor sees the opponent
+OPP_2 = 4                  # right ultrasonic sensor sees the opponent
+PROX_1 = 5                 # opponent very close to left ultrasonic sensor
+PROX_2 = 6                 # opponent very close to right ultrasonic sensor
+sensors = task_share.Record('B', ('IR_ON_OFF', 'Left Front Sensor', 
+                                  'Right Front Sensor', 'Opponent There 1',
+                                  'Opponent There 2', 'Opponent Very Close 1',
+                                  'Opponent Very Close 2'),
+                            thread_protect = True, name = 'Sensors')
 
 motor_state = task_share.Share('I', thread_protect = True, 
                                name = 'States of Motors')
 
-front_pos_share = task_share.Share('I', thread_protect = True, 
+# The encoder may have run backward since it was last zeroed, so its 
+# position is signed
+front_pos_share = task_share.Share('i', thread_protect = True, 
                                    name = 'Front_Position')
 
-
-opponent_found_1 = task_share.Share('B', thread_protect = True,
-                                  name = 'Opponent There 1')
-opponent_found_2 = task_share.Share('B', thread_protect = True,
-                                  name = 'Opponent There 2')
-proximity_alert_1 = task_share.Share('B', thread_protect = True,
-                                   name = 'Opponent Very Close 1')
-proximity_alert_2 = task_share.Share('B', thread_protect = True,
-                                   name = 'Opponent Very Close 2')
 opponent_set = task_share.Share('I', thread_protect = True, 
                                 name = 'Opponent Setpoint')
-last_motor_turn= task_share.Share('B', thread_protect = True,
-                                  name = 'Last Motor Turn Direction')
 
 left_turn_counter = task_share.Share('I', thread_protect = True,  name = 'LTurn_Timing')
 right_turn_counter = task_share.Share('I', thread_protect = True,  name = 'RTurn_Timing')
-left_turn_done = task_share.Share('B', thread_protect = True, name = 'LTurn_Bool')
-right_turn_done = task_share.Share('B', thread_protect = True, name = 'RTurn_Bool')
-backed_away = task_share.Share('B', thread_protect = True, name = 'Backup_Bool')
+
+# The robot's yes-or-no states are kept as bits in one flag register rather
+# than in a share each. These are the masks of the flags
+LTURN_DONE = 0x01          # the left turn away from the edge is finished
+RTURN_DONE = 0x02          # the right turn away from the edge is finished
+BACKED_AWAY = 0x04         # the backup away from the edge is finished
+LAST_TURN_LEFT = 0x08      # the last turn was to the left, so scan that way
+flags = task_share.Flags(('LTurn_Done', 'RTurn_Done', 'Backed_Away', 
+                          'Last_Turn_Left'), thread_protect = True, 
+                         name = 'Motion_Flags')
+
 backup_counter = task_share.Share('B', thread_protect = True, name = 'Backup_Timer')
 
 # =============================================================================
@@ -85,51 +130,54 @@ def Mastermind():
     PUSHING = 5
     SCANNING = 6
     motor_state.put(STOPPED)
-    IR_share.put(False)
-    opponent_found_1.put(False)
-    opponent_found_2.put(False)
-    left_turn_done.put(True)
-    right_turn_done.put(True)
-    backed_away.put(True)
-    last_motor_turn.put(1)
+    sensors.put(IR_ON, False)
+    sensors.put(OPP_1, False)
+    sensors.put(OPP_2, False)
+    flags.put(LTURN_DONE | RTURN_DONE | BACKED_AWAY | LAST_TURN_LEFT)
+    
+    # Buffer into which all the sensor readings are copied on each run
+    snap = sensors.make_buffer()
 
     while True:
+        sensors.snapshot(snap)
         
-        if IR_share.get() == False:
+        if snap[IR_ON] == False:
             motor_state.put(STOPPED)
     
         else:     
-            if left_turn_done.get() == False:
+            done = flags.read()
+            if not done & LTURN_DONE:
                 motor_state.put(LEFT_TURN)
                 
-            elif right_turn_done.get() == False:
+            elif not done & RTURN_DONE:
                 motor_state.put(RIGHT_TURN)
                 
-            elif backed_away.get() == False:
+            elif not done & BACKED_AWAY:
                 motor_state.put(BACKWARD)
                 
-            elif front_sensor_L.get() == True and front_sensor_R.get() == True:
+            elif snap[LINE_L] == True and snap[LINE_R] == True:
                 motor_state.put(BACKWARD)
-                backed_away.put(False)
+                flags.clear(BACKED_AWAY)
             
-            elif front_sensor_L.get() == True:
+            elif snap[LINE_L] == True:
                 motor_state.put(RIGHT_TURN)
-                right_turn_done.put(False)
+                flags.clear(RTURN_DONE)
                 
-            elif front_sensor_R.get() == True:
+            elif snap[LINE_R] == True:
                 motor_state.put(LEFT_TURN)
-                left_turn_done.put(False)
+                flags.clear(LTURN_DONE)
                
-            elif opponent_found_1.get() == False and opponent_found_2.get() == False:
+            elif snap[OPP_1] == False and snap[OPP_2] == False:
                 motor_state.put(SCANNING)
                 
-            elif opponent_found_1.get() == True or opponent_found_2.get() == True:
-                if proximity_alert_1.get() == True and proximity_alert_2.get() == True:
+            elif snap[OPP_1] == True or snap[OPP_2] == True:
+                if snap[PROX_1] == True and snap[PROX_2] == True:
                         motor_state.put(PUSHING)
                 else:
                     motor_state.put(FORWARD)
                     
-        print(motor_state.get())     
+        # Log the robot's state as a binary frame rather than printing it
+        telem.send()
             
         yield(1)
 # =============================================================================
@@ -147,10 +195,10 @@ def Left_Line():
     while True:
         line_pin_val_L = FL_line_sensor.read()
         if line_pin_val_L < 600:
-            front_sensor_L.put(True)
+            sensors.put(LINE_L, True)
             
         elif line_pin_val_L > 1000:
-            front_sensor_L.put(False)
+            sensors.put(LINE_L, False)
 
         yield(0)
 
@@ -165,10 +213,10 @@ def Right_Line():
     while True:
         line_pin_val_R = FR_line_sensor.read()
         if line_pin_val_R < 600:
-            front_sensor_R.put(True)
+            sensors.put(LINE_R, True)
     
         elif line_pin_val_R > 1000:
-            front_sensor_R.put(False)
+            sensors.put(LINE_R, False)
         
         yield(0)
 # =============================================================================
@@ -177,19 +225,22 @@ def Right_Line():
 # ======================= INFRARED SENSOR TASK ================================
 
 def Infrared_Task():
-    '''@brief This function deciphers a packet of information sent by an infrared
-    remote and decodes repeat signals. 
+    '''@brief This function decodes the packets of information sent by an 
+    infrared remote. 
     
-    @details This function stores time stamps from a timer interrupt triggering
-    on rising and falling edges. It calculates the difference between time
-    stamps to determine the logic high or low of the signal. Once a full packet
-    has been processed, the value of the signal corresponding to the button
-    pressed is calculated. '''
-
-    full_packet = False        # flag for if a full packet has been received
-    my_int = 0                 # decimal value of infrared packet logic
-    time_pulse = []            # list for time stamp values from interrupt
-    logicals = []              # list for logical values of infrared packet
+    @details This function takes the time stamps which a timer interrupt 
+    triggering on rising and falling edges puts into a queue and feeds them 
+    to an NEC decoder, which works out the logic high or low of each bit from
+    the time between edges. Once a full packet has been decoded and checked,
+    the value of the signal corresponding to the button pressed is used to 
+    start or stop the robot; repeat signals sent while the button is held are
+    ignored. Each run decodes every edge waiting in the queue, up to 
+    IR_EDGES_PER_RUN of them. When IR_DECODE_IN_ISR is set, the capture 
+    interrupt decodes the edges instead and this task only sets up the 
+    interrupt. '''
+
+    # Buffer into which the waiting edge times are copied on each run
+    edges = array.array('I', [0] * IR_EDGES_PER_RUN)
     
     pinPA8 = pyb.Pin (pyb.Pin.board.PA8, pyb.Pin.ALT)
     tim1 = pyb.Timer(1, prescaler = 79, period = 0xFFFF)
@@ -198,66 +249,30 @@ def Infrared_Task():
     while True: 
         
         # The channel 1 callback generates the interrupt and stores timestamp
-        # values of rising and falling edges in the queue q0. The values in
-        # q0 are appended to a list 
+        # values of rising and falling edges in the queue q0. The waiting 
+        # values are copied out of q0 at once, then given to the decoder one 
+        # at a time. If some are left in q0, it runs this task again
         ch1.callback(interrupt)
         
-        if q0.empty() == True:
-            pass
-        
+        if IR_DECODE_IN_ISR:
+            num_edges = 0
         else:
+            num_edges = q0.get_many(edges, IR_EDGES_PER_RUN)
+        
+        for n_edge in range(num_edges):
             
-            time_pulse.append(q0.get())
+            # The decoder returns the command byte when an edge finishes a 
+            # packet whose address and command bytes match their inverses
+            command_byte = ir_decoder.edge(edges[n_edge])
             
-            # The function logic_process processes the time_pulse data and
-            # determines the logic value of the time difference
+            if command_byte == NOTHING or command_byte == REPEAT:
+                pass
             
-            logic_process(time_pulse, logicals)
+            elif command_byte == IR_START:
+                sensors.put(IR_ON, True)
             
-            # When the length of logicals reaches 32, then a full packet of 
-            # data has been processed and a valid button has been pressed (not 
-            # repeat code). The full_packet flag is set to True, and the data 
-            # can be parsed and converted into binary. If not 32, the program 
-            # loops back to the interrupt and waits for more time stamps to 
-            # fill logicals.
-           
-            if len(logicals) == 32:       	
-                full_packet = True
             else:
-            	full_packet = False	
-    
-            # If the length of logicals is 32, then the data can be parsed. 
-            # Each value of logicals is sorted through and converted into an 
-            # integer using the bitwise ior (|=) operator. 
-            # Then, the address byte, its inverse, the command byte, and its 
-            # inverse are converted from the main integer (32-bit) into their 
-            # own integers (8-bit).
-            
-            if full_packet == True:
-                for n in range(len(logicals)):
-                    my_int |= logicals[n] << n
-                
-                address_byte = my_int & 0xFF
-                address_byte_inverse = (my_int >> 8) & 0xFF
-                command_byte = (my_int >> 16) & 0xFF
-                command_byte_inverse = (my_int >> 24) & 0xFF
-
-                if command_byte == 12:
-                    IR_share.put(True)
-                
-                else:
-                    IR_share.put(False)
-                    
-                # The time pulse list is cleared, and then a 1 is appended to 
-                # the first spot to have the next value appended be a rising 
-                # edge. The logicals list is cleared, my_int is set back to 0, 
-                # and the full_packet flag is set back to False.
-                
-                time_pulse = []
-                time_pulse.append(1)
-                logicals = []
-                my_int = 0
-                full_packet = False
+                sensors.put(IR_ON, False)
         
         yield(0)
 
@@ -265,56 +280,21 @@ def Infrared_Task():
 # ======================= INFRARED SENSOR FUNCTIONS ===========================
 def interrupt (timer):
     ''' This function (in an interrupt) stores rising/falling edge time stamps 
-    in a queue. '''
-
-    q0.put(ch1.capture(), in_ISR = True)
-
-def logic_process(time_pulse, logicals):
-    ''' This function deciphers the pulses received from the infrared
-	interrupt and decodes if it is logic high or low or if it should be 
-    ignored.
-    
-    @param time_pulse List of time stamp values from the interrupt and timer
-           trigger.
-    @param logicals List of logical high or low values from infrared signal.
-    
-    '''	   
-    
-    # First, check if the length of the list containing the time stamps is 3.
-    # if not, then pass. If so, then take the difference between the 2nd and 
-    # 3rd time stamps in order to find the duration of the pulse. If the
-    # duration between the time stamps is negative (overflow occurred) it
-    # must be offset by 65535. The time difference between each pulse is tested
-    # between certain ranges to determine if it is logic high (1), logic low (0)
-    # or should be ignored (oustide of both ranges). The logic value is
-    # appended to a list containing all of the logical values for the data
-    # packet. 
-    
-    if len(time_pulse) < 3:
-        pass
+    in a queue, or decodes them if IR_DECODE_IN_ISR is set. The decoder 
+    allocates no memory, so it can run here; only a packet whose address and
+    command bytes match their inverses changes the IR_ON field. If there is
+    an edge recorder, each time stamp is recorded first. '''
+
+    stamp = ch1.capture()
+    if ir_recorder is not None:
+        ir_recorder.record(stamp)
     
+    if IR_DECODE_IN_ISR:
+        command_byte = ir_decoder.edge(stamp)
+        if command_byte != NOTHING and command_byte != REPEAT:
+            sensors.put(IR_ON, command_byte == IR_START, in_ISR = True)
     else:
-        time_diff = time_pulse[2] - time_pulse[1]
-        
-        if time_diff < 0 :
-        	time_diff += 65535
-        
-        if 475 <= time_diff <= 700:
-        	logicals.append(0)
-        
-        elif 1550 <= time_diff <= 1800:
-        	logicals.append(1)
-
-        else:
-        	pass
-        
-        # The 2nd and 3rd time stamp values are deleted after finding the 
-        # difference in order to make new space for the upcoming values. The
-        # function call returns the list of logical values (but isn't used).
-        
-        del time_pulse[1]
-        del time_pulse[1]
-        return(logicals)
+        q0.put(stamp, in_ISR = True)
 # =============================================================================
 #
 #
@@ -325,52 +305,58 @@ def Ultrasonic_Task():
     
     @details The signal read back by the sensor is converted into a distance in 
     inches and processed in order to determine if the opponent is in front or 
-    at a very close proximity. '''
+    at a very close proximity. The task never waits for an echo: it starts a
+    ping from one sensor, and on later runs checks whether the echo pulse, 
+    which is timed by a pin interrupt, has ended. Once it has, the distance
+    is used and a ping is started from the other sensor. '''
     
     Ultra_1 = 1
     Ultra_2 = 2
     L_Ultra = HCSR04('PA5', 'PA6')
     R_Ultra = HCSR04('PB8', 'PB9')
     state = Ultra_2
+    R_Ultra.start_ping()
     
     while True:
         if state == Ultra_1:
-            L_Ultra._send_pulse_and_wait()
-            distance_1 = L_Ultra.distance_inch()
+            if L_Ultra.ping_done():
+                distance_1 = L_Ultra.ping_inch()
 
-            if distance_1 < 6:
-                opponent_found_1.put(True)
-                proximity_alert_1.put(True)
-            
-            elif 6 < distance_1 < 30:
-                opponent_found_1.put(True)
-                ticks_L = 750*int(distance_1)
-                opponent_set.put(ticks_L)
-            
-            else:
-                opponent_found_1.put(False)
-                proximity_alert_1.put(False)
-            
-            state = Ultra_2
+                if 0 < distance_1 < 6:
+                    sensors.put(OPP_1, True)
+                    sensors.put(PROX_1, True)
                 
-        if state == Ultra_2:
-            R_Ultra._send_pulse_and_wait()
-            distance_2 = R_Ultra.distance_inch()
-
-            if 0 < distance_2 < 6:
-                proximity_alert_2.put(True)
-                opponent_found_2.put(True)
+                elif 6 < distance_1 < 30:
+                    sensors.put(OPP_1, True)
+                    ticks_L = 750*int(distance_1)
+                    opponent_set.put(ticks_L)
+                
+                else:
+                    sensors.put(OPP_1, False)
+                    sensors.put(PROX_1, False)
                 
-            elif 6 < distance_2 < 30:
-                opponent_found_2.put(True)
-                ticks_R = 750*int(distance_2)
-                opponent_set.put(ticks_R)
+                R_Ultra.start_ping()
+                state = Ultra_2
+                
+        elif state == Ultra_2:
+            if R_Ultra.ping_done():
+                distance_2 = R_Ultra.ping_inch()
 
-            else:
-                opponent_found_2.put(False)
-                proximity_alert_2.put(False)
-            
-            state = Ultra_1
+                if 0 < distance_2 < 6:
+                    sensors.put(PROX_2, True)
+                    sensors.put(OPP_2, True)
+                    
+                elif 6 < distance_2 < 30:
+                    sensors.put(OPP_2, True)
+                    ticks_R = 750*int(distance_2)
+                    opponent_set.put(ticks_R)
+
+                else:
+                    sensors.put(OPP_2, False)
+                    sensors.put(PROX_2, False)
+                
+                L_Ultra.start_ping()
+                state = Ultra_1
         
         yield(state)
 # =============================================================================
@@ -389,7 +375,7 @@ def Encoder_Task():
    enc.zero()
    
    while True:
-       if IR_share.get() == False:
+       if sensors.get(IR_ON) == False:
            enc.zero()
            
        else:
@@ -418,7 +404,19 @@ def Motors_Task():
     driver_1.set_duty_cycle(0)
     driver_2.set_duty_cycle(0)
     
+    # In the stopped, forward, pushing and scanning states the duty cycles
+    # depend only on these shares, so they're only recomputed and written to
+    # the motor drivers when one of them has changed. The backward and turning
+    # states count runs, so they run every time
+    inputs = task_share.Watch((motor_state, front_pos_share, opponent_set,
+                               flags), name = 'Motor Inputs')
+    
     while True:
+        state = motor_state.get()
+        if (state < 2 or state > 4) and not inputs.changed():
+            yield(0)
+            continue
+        
         # state for stopped
         if motor_state.get() == 0:
             driver_1.set_duty_cycle(0)
@@ -445,7 +443,7 @@ def Motors_Task():
             
             if count == 80:
                 backup_counter.put(0)
-                backed_away.put(True)
+                flags.set(BACKED_AWAY)
 
         # state for left turn movement           
         elif motor_state.get() == 3:
@@ -466,9 +464,8 @@ def Motors_Task():
             left_turn_counter.put(count)
             
             if count == 250:
-                left_turn_done.put(True)
                 left_turn_counter.put(0)
-                last_motor_turn.put(1)
+                flags.set(LTURN_DONE | LAST_TURN_LEFT)
 
         # state for right turn movement            
         elif motor_state.get() == 4:
@@ -489,9 +486,8 @@ def Motors_Task():
             right_turn_counter.put(count)
             
             if count == 250:
-                right_turn_done.put(True)
                 right_turn_counter.put(0)
-                last_motor_turn.put(0)
+                flags.change(RTURN_DONE, LAST_TURN_LEFT)
 
         # state for pushing movement           
         elif motor_state.get() == 5:
@@ -500,11 +496,11 @@ def Motors_Task():
 
         # state for scanning movement     
         elif motor_state.get() == 6:
-                if last_motor_turn.get() == 1:
+                if flags.test(LAST_TURN_LEFT):
                     driver_1.set_duty_cycle(-60)
                     driver_2.set_duty_cycle(-60)
                 
-                elif last_motor_turn.get() == 0:
+                else:
                     driver_1.set_duty_cycle(60)
                     driver_2.set_duty_cycle(60)
                 
@@ -513,51 +509,99 @@ def Motors_Task():
 # =============================================================================            
 
            
-# =============================================================================
-
-if __name__ == "__main__":
-
-    print ('\033[2JTesting scheduler in cotask.py\n')
-
-    # Create a share and some queues to test diagnostic printouts
-    q0 = task_share.Queue ('I', 68, thread_protect = False, overwrite = False,
-                           name = "Queue_0")
-    front_sensor_L = task_share.Share('B', thread_protect = True, name = 'Left Front Sensor')
-    front_sensor_R = task_share.Share('B', thread_protect = True, name = 'Right Front Sensor')
-    motor_state = task_share.Share('I', thread_protect = True, name = 'States of Motors')
-    IR_share = task_share.Share('B', thread_protect = True, name = 'IR_ON_OFF')
+# ============================= TASK CREATION =================================
+def create_tasks (task_list = cotask.task_list):
+    ''' @brief This function creates the robot's tasks and appends them to a 
+    task list.
     
-    front_pos_share = task_share.Share('I', thread_protect = True, name = 'Front_Position')
-    back_pos_share = task_share.Share('I', thread_protect = True, name = 'Back_Position')
-
-
-    # Create the tasks. If trace is enabled for any task, memory will be
-    # allocated for state transition tracing, and the application will run out
-    # of memory after a while and quit. Therefore, use tracing only for 
-    # debugging and set trace to False when it's not needed
+    @details It is used by the main program below and by host-side 
+    simulations, which run the same tasks on a desktop computer.
+    The infrared edge queue q0 is made here if IR_DECODE_IN_ISR is False, 
+    so a simulation can choose how the edges are decoded by changing 
+    IR_DECODE_IN_ISR before calling this function.
+    @param task_list The task list to which the tasks are appended.
+    @return A tuple holding the tasks which were created. '''
+
+    global q0
+    if not IR_DECODE_IN_ISR and q0 is None:
+        q0 = task_share.SPSCQueue ('I', 68, name = "Queue_0")
+
+    # Create the tasks. If trace is enabled for any task, a fixed-size buffer
+    # is allocated for its most recent state transitions, so tracing can be
+    # left on while the robot runs. Tasks which act on the latest sensor data
+    # skip the runs they missed after a stall rather than running stale ones
+    # back to back. The infrared task isn't run by a timer; it is bound to the
+    # queue of edge times, so it runs whenever the capture interrupt queues
+    # an edge
     
     task1 = cotask.Task (Mastermind, name = 'Mastermind_Task', priority = 7,
-                         period = 20, profile = True, trace =  False)
+                         period = 20, profile = True, trace =  False,
+                         overrun = cotask.SKIP)
     task2 = cotask.Task (Motors_Task, name = 'Motors_Task', priority = 6, 
-                         period = 15, profile = True, trace = False)
+                         period = 15, profile = True, trace = False,
+                         overrun = cotask.SKIP)
     task3 = cotask.Task (Encoder_Task, name = 'Front_Encoder_Task', 
-                         priority = 3, period = 10, profile = True, trace = False)
+                         priority = 3, period = 10, profile = True, trace = False,
+                         overrun = cotask.SKIP)
     task4 = cotask.Task (Infrared_Task, name = 'Infrared_Sensor_Task', 
-                         priority = 5, period = 10, profile = True, trace = False)
+                         priority = 5, period = None, profile = True, trace = False)
     task5 = cotask.Task (Left_Line, name = 'Left_Line_Sensor_Task', priority = 4,
-                         period = 10, profile = True, trace = False)
+                         period = 10, profile = True, trace = False,
+                         overrun = cotask.SKIP)
     task6 = cotask.Task (Right_Line, name = 'Right_Line_Sensor_Task', priority = 4,
-                         period = 10, profile = True, trace = False)
+                         period = 10, profile = True, trace = False,
+                         overrun = cotask.SKIP)
     task7 = cotask.Task (Ultrasonic_Task, name = 'Ultrasonic_Sensor_Task', 
-                         priority = 4, period =  10, profile = True, trace = False)
+                         priority = 4, period =  10, profile = True, trace = False,
+                         overrun = cotask.SKIP)
    
-    cotask.task_list.append (task1)
-    cotask.task_list.append (task2)
-    cotask.task_list.append (task3)
-    cotask.task_list.append (task4)
-    cotask.task_list.append (task5)
-    cotask.task_list.append (task6)
-    cotask.task_list.append (task7)
+    task_list.append (task1)
+    task_list.append (task2)
+    task_list.append (task3)
+    task_list.append (task4)
+    task_list.append (task5)
+    task_list.append (task6)
+    task_list.append (task7)
+
+    # Run the infrared task once so it can set up the capture callback; after
+    # that it runs when there are edges in the queue, if the edges are queued
+    if not IR_DECODE_IN_ISR:
+        q0.bind (task4)
+    task4.go ()
+
+    # The Mastermind task sends a telemetry frame of the shared data on every
+    # run. The sensor readings and flags are sent a bit each and the small
+    # values in fewer bytes, so each frame is 12 bytes and logging at 50 Hz
+    # costs about 600 bytes per second. The turn and backup timers aren't 
+    # sent; they count Motors_Task runs while the robot backs up or turns,
+    # so their progress shows in how long the motor state has been backing
+    # up or turning, and the done flags show when each one finished
+    global telem
+    telem = telemetry.Telemetry ((sensors, motor_state, front_pos_share, 
+                                  opponent_set, flags),
+                                 codes = {motor_state: 'B', 
+                                          front_pos_share: 'h',
+                                          opponent_set: 'H'},
+                                 bits = (sensors, ))
+    telem.start ()
+
+    return (task1, task2, task3, task4, task5, task6, task7)
+# =============================================================================
+
+if __name__ == "__main__":
+
+    print ('\033[2JTesting scheduler in cotask.py\n')
+
+    # Create some shares to test diagnostic printouts. The infrared edge 
+    # queue q0 is made by create_tasks(), and only if the edges are decoded
+    # by a task rather than in the capture interrupt
+    motor_state = task_share.Share('I', thread_protect = True, name = 'States of Motors')
+    
+    front_pos_share = task_share.Share('i', thread_protect = True, name = 'Front_Position')
+    back_pos_share = task_share.Share('I', thread_protect = True, name = 'Back_Position')
+
+    # Create the tasks and put them into the system task list
+    create_tasks ()
 
 
     # Run the memory garbage collector to ensure memory is as defragmented as
@@ -565,17 +609,30 @@ if __name__ == "__main__":
     gc.collect ()
 
     # Run the scheduler with the chosen scheduling algorithm. Quit if any 
-    # character is sent through the serial port
+    # character is sent through the serial port. The tickless scheduler
+    # sleeps between task runs rather than spinning
     vcp = pyb.USB_VCP ()
     while not vcp.any ():
-        cotask.task_list.pri_sched ()
+        cotask.task_list.idle_sched ()
 
     # Empty the comm port buffer of the character(s) just pressed
     vcp.read ()
 
-    # Print a table of task data and a table of shared information data
+    # Write out the recorded infrared edges, if any, with the capture 
+    # interrupt turned off so the recording doesn't change while it's written
+    if ir_recorder is not None:
+        ch1.callback (None)
+        ir_recorder.dump (vcp)
+
+    # Print a table of task data, a report on whether the timed tasks can 
+    # meet their deadlines, and a table of shared information data
     print ('\n' + str (cotask.task_list) + '\n')
+    print (cotask.task_list.schedulability () + '\n')
     print (task_share.show_all ())
+    print (telem)
+    print (ir_decoder)
+    if ir_recorder is not None:
+        print (ir_recorder)
     print ('\r\n')          
     
     
\ No newline at end of file
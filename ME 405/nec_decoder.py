@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+## @file nec_decoder.py
+#  This file contains a decoder for the NEC infrared remote control protocol
+#  which is fed one edge time at a time, as captured by a timer running at
+#  1 MHz on both edges of the receiver's output. The decoder is a state
+#  machine which keeps everything it needs in a few integers: the time of the
+#  last edge, its state, the number of bits received and the bits themselves.
+#  Each bit is shifted straight into place as it's measured, and nothing is
+#  allocated as edges are decoded, so @c edge() may be called from a task or
+#  from the capture interrupt itself.
+#
+#  An NEC frame is a 9 ms leader mark and a 4.5 ms space, then 32 bits sent
+#  least significant bit first, each a 562 us mark followed by a 562 us space
+#  for a 0 or a 1687 us space for a 1, then a final 562 us mark. The bits are
+#  the address, its inverse, the command and its inverse; a frame is only
+#  accepted if both inverses match. While the button is held down, a repeat
+#  code, a leader mark with a 2.25 ms space and a final mark, is sent every
+#  108 ms. Since the decoder only looks at the times between edges, it
+#  doesn't need to know which edges are rising and which falling; after a
+#  time which doesn't fit where it is in a frame, it waits for the next
+#  leader mark.
+#
+#  The 32 bits are kept as two 16-bit halves, as a 32-bit number doesn't fit
+#  in one of MicroPython's small integers and would be allocated on the heap.
+#  Times between edges are found modulo 2**16, so a 16-bit capture timer's
+#  wraparound doesn't matter; a gap of more than 65.5 ms between frames may
+#  happen to look like a leader mark, which costs at most the frame after it.
+#
+#    Example code:
+#    @code
+#    decoder = nec_decoder.NECDecoder ()
+#
+#    # For each captured edge time:
+#    result = decoder.edge (ch1.capture ())
+#    if result == nec_decoder.REPEAT:
+#        ...the last button is still being held down...
+#    elif result != nec_decoder.NOTHING:
+#        ...the button with command result was pressed...
+#    @endcode
+#
+#  The file also contains a recorder which keeps the most recent edge times
+#  in a buffer allocated ahead of time, so that the edges which led to a
+#  decoding failure on the arena floor can be saved and replayed on a
+#  desktop computer with @c host/ir_replay.py.
+#
+#  @copyright This program is released under the GNU Public License,
+#  version 3.0.
+
+import array
+import micropython
+
+
+## Returned by @c NECDecoder.edge() when no frame or repeat code was finished
+NOTHING = const (-1)
+
+## Returned by @c NECDecoder.edge() when a repeat code was finished
+REPEAT = const (256)
+
+# Ranges of the times between edges, in microseconds. They're wide, as
+# receivers stretch marks and shrink spaces by 100 us or more and the times
+# of both edges of each mark or space may be off; a bit's space is taken as
+# a 0 or a 1 by whether it's shorter or longer than halfway between the two
+_LEADER_MIN = const (7500)
+_LEADER_MAX = const (10500)
+_SPACE_MIN = const (3800)
+_SPACE_MAX = const (5200)
+_REPEAT_MIN = const (1800)
+_REPEAT_MAX = const (2700)
+_SHORT_MIN = const (150)
+_SHORT_MAX = const (1100)
+_LONG_MIN = const (1150)
+_LONG_MAX = const (2300)
+
+# States of the decoder: what the next edge is expected to end
+_IDLE = const (0)               # Nothing yet; the next edge may start a mark
+_LEADER = const (1)             # The leader mark
+_LEADER_SPACE = const (2)       # The space after the leader mark
+_BIT_MARK = const (3)           # The mark at the start of a bit
+_BIT_SPACE = const (4)          # The space which gives a bit's value
+_REPEAT_MARK = const (5)        # The final mark of a repeat code
+
+
+class NECDecoder:
+    """ This class decodes NEC frames and repeat codes from the times of the
+    edges of an infrared receiver's output. """
+
+    def __init__ (self):
+        """ Set up a decoder which is waiting for a frame. """
+
+        self._state = _IDLE
+        self._last = 0
+        self._bits = 0
+        self._low = 0
+        self._high = 0
+        self._valid = False
+
+        ## The address of the last frame which was accepted
+        self.address = 0
+
+        ## The command of the last frame which was accepted
+        self.command = 0
+
+        ## The number of frames which have been accepted
+        self.frames = 0
+
+        ## The number of repeat codes which followed an accepted frame
+        self.repeats = 0
+
+        ## The number of frames which were rejected because an inverse byte
+        #  didn't match or which were cut short by a time which didn't fit
+        self.errors = 0
+
+
+    @micropython.native
+    def edge (self, stamp):
+        """ Decode one edge.
+        @param stamp The time of the edge in microseconds from a 16-bit timer
+        @return The command, from 0 to 255, if the edge finished a frame
+            which was accepted; @c REPEAT if it finished a repeat code after
+            an accepted frame; otherwise @c NOTHING """
+
+        width = (stamp - self._last) & 0xFFFF
+        self._last = stamp
+        state = self._state
+
+        # A leader mark may end at any point, as when edges have been missed
+        # or the gap before a frame happened to look like something else
+        if _LEADER_MIN <= width <= _LEADER_MAX:
+            if state == _BIT_MARK or state == _BIT_SPACE:
+                self.errors += 1
+            self._state = _LEADER_SPACE
+            return NOTHING
+
+        if state == _BIT_SPACE:
+            if _SHORT_MIN <= width <= _SHORT_MAX:
+                bit = 0
+            elif _LONG_MIN <= width <= _LONG_MAX:
+                bit = 1
+            else:
+                self.errors += 1
+                self._state = _LEADER
+                return NOTHING
+
+            bits = self._bits
+            if bits < 16:
+                self._low |= bit << bits
+            else:
+                self._high |= bit << (bits - 16)
+            bits += 1
+            if bits < 32:
+                self._bits = bits
+                self._state = _BIT_MARK
+                return NOTHING
+
+            # All 32 bits are in; the final mark isn't needed to finish
+            self._state = _IDLE
+            low = self._low
+            high = self._high
+            if ((low ^ (low >> 8)) & 0xFF) != 0xFF or \
+                    ((high ^ (high >> 8)) & 0xFF) != 0xFF:
+                self.errors += 1
+                self._valid = False
+                return NOTHING
+            self.address = low & 0xFF
+            self.command = high & 0xFF
+            self.frames += 1
+            self._valid = True
+            return high & 0xFF
+
+        if state == _BIT_MARK:
+            if _SHORT_MIN <= width <= _SHORT_MAX:
+                self._state = _BIT_SPACE
+            else:
+                self.errors += 1
+                self._state = _LEADER
+            return NOTHING
+
+        if state == _LEADER_SPACE:
+            if _SPACE_MIN <= width <= _SPACE_MAX:
+                self._bits = 0
+                self._low = 0
+                self._high = 0
+                self._state = _BIT_MARK
+            elif _REPEAT_MIN <= width <= _REPEAT_MAX:
+                self._state = _REPEAT_MARK
+            else:
+                self._state = _LEADER
+            return NOTHING
+
+        if state == _REPEAT_MARK:
+            self._state = _IDLE
+            if _SHORT_MIN <= width <= _SHORT_MAX and self._valid:
+                self.repeats += 1
+                return REPEAT
+            return NOTHING
+
+        # Idle, or waiting for the end of a leader mark: this edge may be the
+        # start of one
+        self._state = _LEADER
+        return NOTHING
+
+
+    def __repr__ (self):
+        """ This method puts diagnostic information about the decoder into a
+        string. """
+
+        return ('NEC decoder {:d} frames, {:d} repeats, {:d} errors, last '
+                'address {:d} command {:d}'.format (self.frames, self.repeats,
+                self.errors, self.address, self.command))
+
+
+class EdgeRecorder:
+    """ This class keeps the most recent edge times captured by the infrared
+    receiver's timer in a ring buffer, so they can be written out later in a
+    compact binary form. Recording an edge allocates no memory, so
+    @c record() may be called from the capture interrupt. """
+
+    def __init__ (self, size):
+        """ Allocate the buffer.
+        @param size The number of edge times which are kept """
+
+        self._buffer = array.array ('H', [0] * size)
+        self._size = size
+        self._next = 0
+
+        ## The number of edges recorded, including ones which have since been
+        #  overwritten; it wraps around at 2**30
+        self.count = 0
+
+
+    @micropython.native
+    def record (self, stamp):
+        """ Record the time of an edge.
+        @param stamp The time of the edge from a 16-bit timer """
+
+        idx = self._next
+        self._buffer[idx] = stamp
+        idx += 1
+        if idx >= self._size:
+            idx = 0
+        self._next = idx
+        if self.count < 0x3FFFFFFF:
+            self.count += 1
+        else:
+            self.count = 0
+
+
+    def dump (self, stream):
+        """ Write the recorded edge times, oldest first. A text line
+        @c "#IRC n total" giving the number of times which follow and the
+        number of edges recorded in all is written first, then each time as
+        a 16-bit little-endian number. Nothing should record edges while the
+        times are being written.
+        @param stream The stream, such as a serial port, to write to """
+
+        size = self._size
+        kept = self.count if self.count < size else size
+        stream.write ('#IRC {:d} {:d}\n'.format (kept, self.count).encode ())
+        view = memoryview (self._buffer)
+        if kept == size:
+            stream.write (view[self._next:])
+        stream.write (view[:self._next])
+
+
+    def __repr__ (self):
+        """ This method puts diagnostic information about the recorder into
+        a string. """
+
+        return 'Edge recorder {:d} of {:d} edges kept'.format (
+               min (self.count, self._size), self.count)
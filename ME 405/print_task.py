@@ -2,11 +2,14 @@
 ## @file print_task.py
 #  This file contains code for a task which prints things from a queue. It
 #  helps to reduce latency in a system having tasks which print because it
-#  sends things to be printed out the serial port one character at a time,
-#  even when other tasks put whole strings into the queue at once. When run
-#  as a low-priority task, this allows higher priority tasks to interrupt
-#  the printing between characters, even when all the tasks are being 
-#  cooperatively scheduled with a priority-based scheduler. 
+#  sends things to be printed out the serial port a limited amount at a time,
+#  even when other tasks put long strings into the queue at once. Each time 
+#  the task runs, it writes chunks of up to @c CHUNK_SIZE bytes straight from
+#  the queue to the serial port until it has written @c BYTE_BUDGET bytes or
+#  spent @c TIME_BUDGET_US microseconds. When run as a low-priority task, 
+#  this allows higher priority tasks to interrupt the printing between 
+#  chunks, even when all the tasks are being cooperatively scheduled with a 
+#  priority-based scheduler. 
 #
 #    Example code:
 #    @code
@@ -21,12 +24,16 @@
 #    # In a task which needs to print something:
 #    shares.print_task.put ('This is a string')
 #    shares.print_task.put_bytes (bytearray ('A bytearray'))
+#
+#    # To print to a UART rather than the USB serial port:
+#    print_task.set_stream (pyb.UART (2, 115200))
 #    @endcode
 #
 #  @copyright This program is copyrighted by JR Ridgely and released under the
 #  GNU Public License, version 3.0. 
 
 import pyb
+import utime
 import cotask
 import task_share
 
@@ -41,6 +48,24 @@ THREAD_PROTECT = True
 ## A flag which controls if the printing task is to be profiled
 PROFILE = True
 
+## The largest number of bytes which are copied out of the queue and written
+#  to the serial port at once
+CHUNK_SIZE = const (32)
+
+## The most bytes which the print task writes each time it runs
+BYTE_BUDGET = const (64)
+
+## The most time in microseconds which the print task spends writing each
+#  time it runs; a chunk which has been started is always finished, so one
+#  run can take as long as this plus the time to write one chunk
+TIME_BUDGET_US = const (500)
+
+## The time in microseconds after which the print task tries again when the
+#  stream wouldn't take any bytes, as a USB serial port with a full transmit
+#  buffer or no computer attached won't; more bytes being put into the queue
+#  also wake the task
+RETRY_US = const (10000)
+
 
 #@micropython.native
 def put (a_string):
@@ -48,15 +73,12 @@ def put (a_string):
     printing task whenever that task gets a chance. If the print queue is
     full, characters are lost; this is better than blocking to wait for
     space in the queue, as we'd block the printing task and space would
-    never open up. When a character has been put into the queue, the @c go()
+    never open up. When characters have been put into the queue, the @c go()
     method of the print task is called so that the run method will be called
     as soon as the print task is run by the task scheduler. 
     @param a_string A string to be put into the queue """
 
-    for a_ch in a_string:
-        if not print_queue.full ():
-            print_queue.put (ord (a_ch))
-            print_task.go ()
+    put_bytes (a_string.encode ())
 
 
 #@micropython.native
@@ -64,33 +86,73 @@ def put_bytes (b_arr):
     """ Put bytes from a @c bytearray or @c bytes into the print queue. When 
     characters have been put into the queue, the @c go() method of the print
     task is called so that the run method will be called as soon as the print 
-    task is run by the task scheduler. 
+    task is run by the task scheduler. The bytes are copied into the queue as
+    one block; if the queue is full, the bytes which don't fit are lost.
     @param b_arr The bytearray whose contents go into the queue """
 
-    for byte in b_arr:
-        if not print_queue.full ():
-            print_queue.put (byte)
-            print_task.go ()
+    if print_queue.put_many (b_arr) > 0:
+        print_task.go ()
+
+
+def set_stream (stream):
+    """ Choose where the print task sends its output. 
+    @param stream An object with a @c write() method which takes a buffer and
+        returns the number of bytes written, such as a @c pyb.USB_VCP (the
+        default) or a @c pyb.UART """
+
+    global out_stream
+    out_stream = stream
 
 
 def run ():
     """ Run function for the task which prints stuff. This function checks for
     any characters to be printed in the queue; if any characters are found 
-    then one character is printed, after which the print task yields so other 
-    tasks can run. This functino must be called periodically; the normal way 
-    is to make it the run function of a low priority task in a cooperatively 
-    multitasked system so that the task scheduler calls this function when 
-    the higher priority tasks don't need to run. 
+    then they are copied out in chunks of up to @c CHUNK_SIZE bytes and 
+    written to the output stream until the queue is empty or the byte or time
+    budget for this run has been used up, after which the print task yields 
+    so other tasks can run. If the stream takes only part of a chunk, as a
+    serial port with a full transmit buffer may, the rest is kept and written
+    first the next time. If the stream takes nothing at all, the task parks
+    until more is put into the queue or @c RETRY_US have passed, rather than
+    asking to be run again at once and keeping the CPU from sleeping. This
+    function must be called periodically; the normal way is to make it the
+    run function of a low priority task in a cooperatively multitasked 
+    system so that the task scheduler calls this function when the higher
+    priority tasks don't need to run. 
     """
 
-    while True:
-        # If there's a character in the queue, print it
-        if print_queue.any ():
-            print (chr (print_queue.get ()), end = '')
+    chunk = bytearray (CHUNK_SIZE)
+    view = memoryview (chunk)
+    start = 0                        # Index of the first unwritten byte
+    end = 0                          # Index just past the last one
 
-        # If there's another character, tell this task to run again ASAP
-        if print_queue.any ():
-            print_task.go ()
+    while True:
+        began = utime.ticks_us ()
+        sent = 0
+        while sent < BYTE_BUDGET:
+            # When the chunk has all been written, get another from the queue
+            if start >= end:
+                start = 0
+                end = print_queue.get_many (chunk)
+                if end == 0:
+                    break
+
+            written = out_stream.write (view[start:end])
+            if not written:
+                break
+            start += written
+            sent += written
+
+            if utime.ticks_diff (utime.ticks_us (), began) >= TIME_BUDGET_US:
+                break
+
+        # If there's more to print, tell this task to run again ASAP if the
+        # stream is taking bytes, or to wait a while if it isn't
+        if start < end or print_queue.any ():
+            if sent > 0:
+                print_task.go ()
+            else:
+                print_task.park (RETRY_US)
 
         yield (0)
 
@@ -101,6 +163,10 @@ global print_queue
 print_queue = task_share.Queue ('B', BUF_SIZE, name = "Print_Queue", 
                         thread_protect = THREAD_PROTECT, overwrite = False)
 
+## The stream to which printed characters are written
+global out_stream
+out_stream = pyb.USB_VCP ()
+
 ## This is the task which schedules printing. 
 global print_task
 print_task = cotask.Task (run, name = 'Printing', priority = 0, 
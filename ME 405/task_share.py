@@ -10,13 +10,19 @@
 import array
 import gc
 import pyb
+import utime
 import micropython
+import cotask
 
 
 ## This is a system-wide list of all the queues and shared variables. It is
 #  used to create diagnostic printouts. 
 share_list = []
 
+## The mask which keeps the version numbers of shares and records within 
+#  MicroPython's small integers, so that changing a version doesn't allocate
+VERSION_MASK = const (0x3FFFFFFF)
+
 
 def show_all ():
     """ Create a string holding a diagnostic printout showing the status of
@@ -38,7 +44,7 @@ class Queue:
     ser_num = 0
 
     def __init__ (self, type_code, size, thread_protect = True, 
-                  overwrite = False, name = None):
+                  overwrite = False, name = None, consumer = None):
         """ Initialize a queue by allocating memory for the contents and 
         setting up the components in an empty configuration. The data type 
         code is given as for the Python 'array' type, which can be any of
@@ -54,7 +60,9 @@ class Queue:
         @param overwrite If @c True, oldest data will be overwritten with new
             data if the queue becomes full 
         @param name A short name for the queue, default @c QueueN where @c N
-            is a serial number for the queue """
+            is a serial number for the queue 
+        @param consumer A task which reads from the queue and should be run
+            whenever data is put into it, or @c None; see @c bind() """
 
         self._size = size
         self._thread_protect = thread_protect
@@ -74,6 +82,9 @@ class Queue:
             self._buffer = None
             raise
 
+        # A view of the buffer through which blocks of data are copied
+        self._view = memoryview (self._buffer)
+
         # Add this queue to the global share and queue list
         share_list.append (self)
 
@@ -86,6 +97,27 @@ class Queue:
         self._wr_idx = 0
         self._num_items = 0
 
+        # The task, if any, which is to be run when data is put in the queue
+        self._consumer = consumer
+
+        # The task, if any, which is parked in @c get_wait() or @c put_wait()
+        self._waiter = None
+
+        self.reset_stats ()
+
+
+    def bind (self, task):
+        """ Bind a consumer task to this queue. Each time an item is put into
+        the queue, even from an ISR, the task's @c go() method is called so 
+        that the task is run as soon as the scheduler can run it. Each time 
+        an item is taken out and more remain, @c go() is called again, so the
+        task keeps being run until it has emptied the queue. This lets a task
+        which reads the queue be run only when there is data for it rather 
+        than polling the queue periodically.
+        @param task The consumer task, or @c None to unbind the queue """
+
+        self._consumer = task
+
 
     @micropython.native
     def put (self, item, in_ISR = False):
@@ -94,7 +126,8 @@ class Queue:
         unless the @c overwrite constructor parameter was set to @c True to 
         allow old data to be clobbered. If non-blocking behavior without
         overwriting is needed, one should call @c full() to ensure that the 
-        queue is not full before putting data into it.
+        queue is not full before putting data into it; a task which must wait
+        for room should use @c put_wait() so that other tasks can run.
         @param item The item to be placed into the queue
         @param in_ISR Set this to @c True if calling from within an ISR """
 
@@ -102,12 +135,15 @@ class Queue:
         # overwrite data, we have to give up and exit
         if self.full ():
             if in_ISR:
+                self._drops += 1
                 return
 
             # Wait (if needed) until there's room in the buffer for the data
             if not self._overwrite:
                 while self.full ():
-                    pass
+                    self._spins += 1
+            else:
+                self._overwrites += 1
 
         # Prevent data corruption by blocking interrupts during data transfer
         if self._thread_protect and not in_ISR:
@@ -121,23 +157,36 @@ class Queue:
         self._num_items += 1
         if self._num_items >= self._size:
             self._num_items = self._size
+        self._puts += 1
+        if self._num_items > self._max_items:
+            self._max_items = self._num_items
 
         # Re-enable interrupts
         if self._thread_protect and not in_ISR:
             pyb.enable_irq (irq_state)
 
+        # Tell the consumer task, if any, that it has data to read
+        if self._consumer is not None:
+            self._consumer.go ()
+
+        # Wake the task, if any, which is waiting for data or for room
+        if self._waiter is not None:
+            self._waiter.go ()
+
 
     @micropython.native
     def get (self, in_ISR = False):
         """ Read an item from the queue. If there isn't anything in there,
         wait (blocking the calling process) until something becomes
         available. If non-blocking reads are needed, one should call @c any()
-        to check for items before attempting to read any items.
+        to check for items before attempting to read any items; a task which
+        must wait for an item should use @c get_wait() so that other tasks 
+        can run.
         @param in_ISR Set this to @c True if calling from within an ISR """
 
         # Wait until there's something in the queue to be returned
         while self.empty ():
-            pass
+            self._spins += 1
 
         # Prevent data corruption by blocking interrupts during data transfer
         if self._thread_protect and not in_ISR:
@@ -153,14 +202,218 @@ class Queue:
         self._num_items -= 1
         if self._num_items < 0:
             self._num_items = 0
+        self._gets += 1
 
         # Re-enable interrupts
         if self._thread_protect and not in_ISR:
             pyb.enable_irq (irq_state)
 
+        # If more data remains, have the consumer task run again
+        if self._consumer is not None and self._num_items > 0:
+            self._consumer.go ()
+
+        # Wake the task, if any, which is waiting for data or for room
+        if self._waiter is not None:
+            self._waiter.go ()
+
         return (to_return)
 
 
+    @micropython.native
+    def put_many (self, buf, in_ISR = False):
+        """ Put a block of items into the queue. As many items as there is
+        room for are copied from the start of the given buffer, in at most 
+        two slices (as the queue's buffer wraps around), while interrupts are
+        disabled just once. This method never blocks or overwrites data; any
+        items for which there is no room are left out, and the number copied 
+        is returned so the caller can deal with them.
+        @param buf An @c array, @c bytearray, @c bytes or @c memoryview 
+            holding items of the same type as the queue's items
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return The number of items put into the queue """
+
+        src = memoryview (buf)
+        dst = self._view
+        size = self._size
+
+        # Prevent data corruption by blocking interrupts during data transfer
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        count = size - self._num_items
+        if count > len (src):
+            count = len (src)
+
+        # Copy up to the end of the buffer, then the rest to its beginning
+        if count > 0:
+            wr_idx = self._wr_idx
+            first = size - wr_idx
+            if first > count:
+                first = count
+            dst[wr_idx:wr_idx + first] = src[:first]
+            if count > first:
+                dst[:count - first] = src[first:count]
+            wr_idx += count
+            if wr_idx >= size:
+                wr_idx -= size
+            self._wr_idx = wr_idx
+            self._num_items += count
+            self._puts += count
+            if self._num_items > self._max_items:
+                self._max_items = self._num_items
+        self._drops += len (src) - count
+
+        # Re-enable interrupts
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        # Tell the consumer task, if any, that it has data to read
+        if count > 0 and self._consumer is not None:
+            self._consumer.go ()
+
+        # Wake the task, if any, which is waiting for data or for room
+        if count > 0 and self._waiter is not None:
+            self._waiter.go ()
+
+        return count
+
+
+    @micropython.native
+    def get_many (self, buf, max_items = None, in_ISR = False):
+        """ Take a block of items out of the queue. As many items as are in
+        the queue, up to the size of the given buffer or @c max_items, are 
+        copied into the start of the buffer, in at most two slices, while 
+        interrupts are disabled just once. This method never blocks; if the 
+        queue is empty, nothing is copied.
+        @param buf An @c array, @c bytearray or @c memoryview into which 
+            items are copied; its items must be of the queue's item type
+        @param max_items The largest number of items to copy, or @c None to
+            fill the buffer if there are enough items
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return The number of items taken out of the queue """
+
+        dst = memoryview (buf)
+        src = self._view
+        size = self._size
+        limit = len (dst)
+        if max_items is not None and max_items < limit:
+            limit = max_items
+
+        # Prevent data corruption by blocking interrupts during data transfer
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        count = self._num_items
+        if count > limit:
+            count = limit
+
+        # Copy up to the end of the buffer, then the rest from its beginning
+        if count > 0:
+            rd_idx = self._rd_idx
+            first = size - rd_idx
+            if first > count:
+                first = count
+            dst[:first] = src[rd_idx:rd_idx + first]
+            if count > first:
+                dst[first:count] = src[:count - first]
+            rd_idx += count
+            if rd_idx >= size:
+                rd_idx -= size
+            self._rd_idx = rd_idx
+            self._num_items -= count
+            self._gets += count
+
+        # Re-enable interrupts
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        # If more data remains, have the consumer task run again
+        if self._consumer is not None and self._num_items > 0:
+            self._consumer.go ()
+
+        # Wake the task, if any, which is waiting for data or for room
+        if count > 0 and self._waiter is not None:
+            self._waiter.go ()
+
+        return count
+
+
+    def get_wait (self, timeout = None, state = 0):
+        """ Read an item from the queue from within a task, letting other 
+        tasks run while waiting for one to arrive rather than blocking them
+        as @c get() would. This method is a generator which is used by the
+        task's generator with @c yield @c from, as in
+        @code
+        item = yield from my_queue.get_wait (50, state)
+        @endcode
+        While the queue is empty, the task is parked and yields @c state; it
+        isn't run again until something is put into the queue or the time 
+        runs out. Only one task at a time may wait on a queue.
+        @param timeout The longest time in milliseconds to wait, or @c None
+            to wait as long as it takes
+        @param state The state which the task yields while it waits
+        @return The item, or @c None if the time ran out first """
+
+        if self.empty ():
+            task = cotask.running_task
+            if timeout is not None:
+                end = utime.ticks_add (utime.ticks_us (), int (timeout * 1000))
+
+            # Become the waiter before checking again, so that an item put in
+            # or taken out by an ISR just before the task parks still wakes it
+            self._waiter = task
+            while self.empty ():
+                if timeout is None:
+                    task.park ()
+                else:
+                    left = utime.ticks_diff (end, utime.ticks_us ())
+                    if left <= 0:
+                        self._waiter = None
+                        return None
+                    task.park (left)
+                yield state
+            self._waiter = None
+
+        return self.get ()
+
+
+    def put_wait (self, item, timeout = None, state = 0):
+        """ Put an item into the queue from within a task, letting other 
+        tasks run while waiting for room rather than blocking them as 
+        @c put() would. Like @c get_wait(), this is a generator to be used 
+        with @c yield @c from; the task is parked until something is taken
+        out of the queue or the time runs out.
+        @param item The item to be placed into the queue
+        @param timeout The longest time in milliseconds to wait, or @c None
+            to wait as long as it takes
+        @param state The state which the task yields while it waits
+        @return @c True if the item was put in, @c False if the time ran out
+            first """
+
+        if self.full () and not self._overwrite:
+            task = cotask.running_task
+            if timeout is not None:
+                end = utime.ticks_add (utime.ticks_us (), int (timeout * 1000))
+
+            # Become the waiter before checking again, so that an item put in
+            # or taken out by an ISR just before the task parks still wakes it
+            self._waiter = task
+            while self.full ():
+                if timeout is None:
+                    task.park ()
+                else:
+                    left = utime.ticks_diff (end, utime.ticks_us ())
+                    if left <= 0:
+                        self._waiter = None
+                        return False
+                    task.park (left)
+                yield state
+            self._waiter = None
+
+        self.put (item)
+        return True
+
+
     @micropython.native
     def any (self):
         """ Returns @c True if there are any items in the queue and @c False
@@ -197,12 +450,302 @@ class Queue:
         return (self._num_items)
 
 
+    @micropython.native
+    def room (self):
+        """ This method returns the number of items for which there is room
+        in the queue, so a caller can tell whether a block of items will fit
+        before calling @c put_many().
+        @return The number of free places in the queue """
+
+        return (self._size - self._num_items)
+
+
+    def reset_stats (self):
+        """ This method resets the counters which keep track of how the 
+        queue has been used. It's also used by @c __init__() to create them.
+        The counters are plain integers which are updated in place, so 
+        keeping them doesn't allocate memory, even in an ISR. """
+
+        # The numbers of items put into and taken out of the queue
+        self._puts = 0
+        self._gets = 0
+
+        # The most items which have been in the queue at once
+        self._max_items = 0
+
+        # The numbers of items which were lost because the queue was full 
+        # and of items which overwrote old data in an overwriting queue
+        self._drops = 0
+        self._overwrites = 0
+
+        # The number of times around the loops in which @c put() and 
+        # @c get() wait for room or for data, blocking the caller
+        self._spins = 0
+
+
     def __repr__ (self):
         """ This method puts diagnostic information about the queue into a 
-        string. """
+        string: its size, read and write indices, the numbers of items put
+        and gotten, the most items it has held, the items dropped because it
+        was full or overwritten, and the times around blocking wait loops. """
+
+        return ('{:<12s} Queue {: 8d} R:{:d} W:{:d} PUT:{:d} GET:{:d} MAX:{:d}'
+                ' DROP:{:d} OVWR:{:d} SPIN:{:d}'.format (self._name, 
+                self._size, self._rd_idx, self._wr_idx, self._puts, 
+                self._gets, self._max_items, self._drops, self._overwrites,
+                self._spins))
+
+
+# ============================================================================
+
+class SPSCQueue (Queue):
+    """ This class implements a queue for exactly one producer and one 
+    consumer, such as an interrupt service routine which puts data in and a
+    task which takes it out, which is safe without disabling interrupts. The
+    producer only ever writes the write index and the consumer only ever 
+    writes the read index, and each side moves its index only after the data
+    has been copied, so neither side can corrupt the other's view of the 
+    queue whichever one interrupts the other. The number of items is worked
+    out from the two indices rather than kept in a separate count which both
+    sides would have to change. One slot of the buffer is always left empty
+    so that a full queue can be told apart from an empty one. """
+
+    def __init__ (self, type_code, size, name = None, consumer = None):
+        """ Initialize a single-producer, single-consumer queue. The data 
+        type code is given as for class @c Queue.
+        @param type_code The type of data items which the queue can hold
+        @param size The maximum number of items which the queue can hold
+        @param name A short name for the queue, default @c QueueN where @c N
+            is a serial number for the queue 
+        @param consumer A task which reads from the queue and should be run
+            whenever data is put into it, or @c None """
+
+        Queue.__init__ (self, type_code, size + 1, thread_protect = False,
+                        overwrite = False, name = name, consumer = consumer)
+
+
+    @micropython.native
+    def put (self, item, in_ISR = False):
+        """ Put an item into the queue. If there isn't room for the item, a
+        caller in an ISR gives up and the item is lost; any other caller waits
+        (blocking the calling process) until room becomes available. 
+        @param item The item to be placed into the queue
+        @param in_ISR Set this to @c True if calling from within an ISR """
+
+        wr_idx = self._wr_idx
+        next_idx = wr_idx + 1
+        if next_idx >= self._size:
+            next_idx = 0
+
+        # If the queue is full, give up in an ISR or wait for room otherwise
+        if next_idx == self._rd_idx:
+            if in_ISR:
+                self._drops += 1
+                return
+            while next_idx == self._rd_idx:
+                self._spins += 1
+
+        # Write the data, then publish it by moving the write index
+        self._buffer[wr_idx] = item
+        self._wr_idx = next_idx
+
+        # Only the producer writes these counters, so they're safe too
+        self._puts += 1
+        used = next_idx - self._rd_idx
+        if used < 0:
+            used += self._size
+        if used > self._max_items:
+            self._max_items = used
+
+        # Tell the consumer task, if any, that it has data to read
+        if self._consumer is not None:
+            self._consumer.go ()
+
+        # Wake the task, if any, which is waiting for data or for room
+        if self._waiter is not None:
+            self._waiter.go ()
+
 
-        return ('{:<12s} Queue {: 8d} R:{:d} W:{:d}'.format (self._name, 
-                len (self._buffer), self._rd_idx, self._wr_idx))
+    @micropython.native
+    def get (self, in_ISR = False):
+        """ Read an item from the queue. If there isn't anything in there,
+        wait (blocking the calling process) until something becomes
+        available. 
+        @param in_ISR Set this to @c True if calling from within an ISR """
+
+        while self._rd_idx == self._wr_idx:
+            self._spins += 1
+
+        # Read the data, then free its slot by moving the read index
+        rd_idx = self._rd_idx
+        to_return = self._buffer[rd_idx]
+        rd_idx += 1
+        if rd_idx >= self._size:
+            rd_idx = 0
+        self._rd_idx = rd_idx
+        self._gets += 1
+
+        # If more data remains, have the consumer task run again
+        if self._consumer is not None and rd_idx != self._wr_idx:
+            self._consumer.go ()
+
+        # Wake the task, if any, which is waiting for data or for room
+        if self._waiter is not None:
+            self._waiter.go ()
+
+        return (to_return)
+
+
+    @micropython.native
+    def put_many (self, buf, in_ISR = False):
+        """ Put a block of items into the queue, copying as many as there is
+        room for in at most two slices. This method never blocks.
+        @param buf An @c array, @c bytearray, @c bytes or @c memoryview 
+            holding items of the same type as the queue's items
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return The number of items put into the queue """
+
+        src = memoryview (buf)
+        dst = self._view
+        size = self._size
+
+        wr_idx = self._wr_idx
+        count = self._rd_idx - wr_idx - 1
+        if count < 0:
+            count += size
+        if count > len (src):
+            count = len (src)
+        self._drops += len (src) - count
+
+        if count > 0:
+            first = size - wr_idx
+            if first > count:
+                first = count
+            dst[wr_idx:wr_idx + first] = src[:first]
+            if count > first:
+                dst[:count - first] = src[first:count]
+            wr_idx += count
+            if wr_idx >= size:
+                wr_idx -= size
+            self._wr_idx = wr_idx
+
+            self._puts += count
+            used = wr_idx - self._rd_idx
+            if used < 0:
+                used += size
+            if used > self._max_items:
+                self._max_items = used
+
+            if self._consumer is not None:
+                self._consumer.go ()
+            if self._waiter is not None:
+                self._waiter.go ()
+
+        return count
+
+
+    @micropython.native
+    def get_many (self, buf, max_items = None, in_ISR = False):
+        """ Take a block of items out of the queue, copying as many as are 
+        there, up to the size of the buffer or @c max_items, in at most two
+        slices. This method never blocks.
+        @param buf An @c array, @c bytearray or @c memoryview into which 
+            items are copied; its items must be of the queue's item type
+        @param max_items The largest number of items to copy, or @c None to
+            fill the buffer if there are enough items
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return The number of items taken out of the queue """
+
+        dst = memoryview (buf)
+        src = self._view
+        size = self._size
+        limit = len (dst)
+        if max_items is not None and max_items < limit:
+            limit = max_items
+
+        rd_idx = self._rd_idx
+        count = self._wr_idx - rd_idx
+        if count < 0:
+            count += size
+        if count > limit:
+            count = limit
+
+        if count > 0:
+            first = size - rd_idx
+            if first > count:
+                first = count
+            dst[:first] = src[rd_idx:rd_idx + first]
+            if count > first:
+                dst[first:count] = src[:count - first]
+            rd_idx += count
+            if rd_idx >= size:
+                rd_idx -= size
+            self._rd_idx = rd_idx
+            self._gets += count
+
+        # If more data remains, have the consumer task run again
+        if self._consumer is not None and rd_idx != self._wr_idx:
+            self._consumer.go ()
+
+        # Wake the task, if any, which is waiting for data or for room
+        if count > 0 and self._waiter is not None:
+            self._waiter.go ()
+
+        return count
+
+
+    @micropython.native
+    def any (self):
+        """ Returns @c True if there are any items in the queue and @c False
+        if the queue is empty.
+        @return @c True if items are in the queue, @c False if not """
+
+        return (self._rd_idx != self._wr_idx)
+
+
+    @micropython.native
+    def empty (self):
+        """ Returns @c True if there are no items in the queue and @c False if 
+        there are any items therein.
+        @return @c True if queue is empty, @c False if it's not empty """
+
+        return (self._rd_idx == self._wr_idx)
+
+
+    @micropython.native
+    def full (self):
+        """ This method returns @c True if the queue is already full and there
+        is no room for more data. 
+        @return @c True if the queue is full """
+
+        next_idx = self._wr_idx + 1
+        if next_idx >= self._size:
+            next_idx = 0
+        return (next_idx == self._rd_idx)
+
+
+    @micropython.native
+    def num_in (self):
+        """ This method returns the number of items which are currently in the 
+        queue.
+        @return The number of items in the queue """
+
+        count = self._wr_idx - self._rd_idx
+        if count < 0:
+            count += self._size
+        return (count)
+
+
+    @micropython.native
+    def room (self):
+        """ This method returns the number of items for which there is room
+        in the queue. 
+        @return The number of free places in the queue """
+
+        count = self._rd_idx - self._wr_idx - 1
+        if count < 0:
+            count += self._size
+        return (count)
 
 
 # ============================================================================
@@ -216,7 +759,8 @@ class Share:
     ## A counter used to give serial numbers to shares for diagnostic use.
     ser_num = 0
 
-    def __init__ (self, type_code, thread_protect = True, name = None):
+    def __init__ (self, type_code, thread_protect = True, name = None,
+                  consumer = None):
         """ Allocate memory in which the shared data will be buffered. The 
         data type code is given as for the Python 'array' type, which 
         can be any of
@@ -229,10 +773,19 @@ class Share:
         @param type_code The type of data items which the share can hold
         @param thread_protect True if mutual exclusion protection is used
         @param name A short name for the share, default @c ShareN where @c N
-            is a serial number for the share """
+            is a serial number for the share 
+        @param consumer A task which uses the shared data and should be run
+            whenever new data is put into the share, or @c None """
 
+        self._type_code = type_code
         self._buffer = array.array (type_code, [0])
         self._thread_protect = thread_protect
+        self._consumer = consumer
+        self.reset_stats ()
+
+        # The version of the data, which is changed each time a put changes
+        # the data, so that a task can tell whether the data has changed
+        self._version = 0
 
         self._name = str (name) if name != None \
             else 'Share' + str (Share.ser_num)
@@ -241,6 +794,15 @@ class Share:
         share_list.append (self)
 
 
+    def bind (self, task):
+        """ Bind a consumer task to this share. Each time data is put into 
+        the share, even from an ISR, the task's @c go() method is called so
+        that the task is run as soon as the scheduler can run it.
+        @param task The consumer task, or @c None to unbind the share """
+
+        self._consumer = task
+
+
     @micropython.native
     def put (self, data, in_ISR = False):
         """ Write an item of data into the share. Any old data is overwritten.
@@ -254,12 +816,20 @@ class Share:
         if self._thread_protect and not in_ISR:
             irq_state = pyb.disable_irq ()
 
+        old = self._buffer[0]
         self._buffer[0] = data
+        if self._buffer[0] != old:
+            self._version = (self._version + 1) & VERSION_MASK
+        self._puts += 1
 
         # Re-enable interrupts
         if self._thread_protect and not in_ISR:
             pyb.enable_irq (irq_state)
 
+        # Tell the consumer task, if any, that there's new data
+        if self._consumer is not None:
+            self._consumer.go ()
+
 
     @micropython.native
     def get (self, in_ISR = False):
@@ -273,6 +843,7 @@ class Share:
             irq_state = pyb.disable_irq ()
 
         to_return = self._buffer[0]
+        self._gets += 1
 
         # Re-enable interrupts
         if self._thread_protect and not in_ISR:
@@ -281,9 +852,489 @@ class Share:
         return (to_return)
 
 
+    @micropython.native
+    def version (self):
+        """ Get the version of the data in the share. The version changes 
+        each time @c put() writes data different from what was there, but
+        not when the same data is written again, so a task which keeps the
+        version it last acted upon can tell whether there's anything new.
+        @return The version, a small integer which wraps around """
+
+        return self._version
+
+
+    @micropython.native
+    def changed_since (self, version):
+        """ Check whether the data in the share has changed since it had 
+        the given version.
+        @param version A version from an earlier call to @c version()
+        @return @c True if the data has changed, @c False if not """
+
+        return self._version != version
+
+
+    def reset_stats (self):
+        """ This method resets the counts of puts and gets. It's also used
+        by @c __init__() to create them. """
+
+        self._puts = 0
+        self._gets = 0
+
+
     def __repr__ (self):
         """ This method puts diagnostic information about the share into a 
+        string, including the numbers of times it has been written and read.
+        """
+
+        return ('{:<12s} Share PUT:{:d} GET:{:d}'.format (self._name, 
+                self._puts, self._gets))
+
+
+
+# ============================================================================
+
+class Record:
+    """ This class implements a shared record, a set of named fields of the 
+    same type which are kept together in one buffer. A task which needs 
+    several values at once can copy all of them with @c snapshot(), which 
+    disables interrupts just once and so gets a consistent set of values, 
+    rather than reading a separate share for each value. Each field can be
+    written or read by itself with one disabling of interrupts, as a share's
+    data would be. Fields are found by index; @c field() gives the index of 
+    a field with a given name, so it can be looked up once and kept. 
+
+    Example:
+    @code
+    sensors = task_share.Record ('B', ('LINE_L', 'LINE_R'), name = 'Lines')
+    LINE_L = sensors.field ('LINE_L')
+
+    # In a task which writes a field:
+    sensors.put (LINE_L, True)
+
+    # In a task which uses all the fields, with a buffer made ahead of time
+    snap = sensors.make_buffer ()
+    while True:
+        sensors.snapshot (snap)
+        if snap[LINE_L]:
+            ...
+    @endcode """
+
+    ## A counter used to give serial numbers to records for diagnostic use.
+    ser_num = 0
+
+    def __init__ (self, type_code, fields, thread_protect = True, 
+                  name = None, consumer = None):
+        """ Allocate memory in which the record's fields will be kept. The 
+        data type code is given as for class @c Share.
+        @param type_code The type of data which each field holds
+        @param fields A sequence of names for the fields, in order
+        @param thread_protect True if mutual exclusion protection is used
+        @param name A short name for the record, default @c RecordN where 
+            @c N is a serial number for the record
+        @param consumer A task which uses the record and should be run 
+            whenever new data is put into it, or @c None """
+
+        self._fields = tuple (fields)
+        self._type_code = type_code
+        self._buffer = array.array (type_code, len (self._fields) * [0])
+        self._thread_protect = thread_protect
+        self._consumer = consumer
+        self.reset_stats ()
+
+        # The version of the data, which is changed each time a put changes
+        # any field, as a share's version is
+        self._version = 0
+        Record.ser_num += 1
+
+        self._name = str (name) if name != None \
+            else 'Record' + str (Record.ser_num)
+
+        # Add this record to the global share and queue list
+        share_list.append (self)
+
+
+    def field (self, name):
+        """ Find the index of a field from its name.
+        @param name The name of the field
+        @return The index of the field, used with @c put() and @c get() """
+
+        return self._fields.index (name)
+
+
+    def make_buffer (self):
+        """ Make an array into which the record can be copied by 
+        @c snapshot(). It's best to make the buffer once, before a task's
+        loop, so that taking snapshots doesn't allocate memory.
+        @return An array of the right type and size """
+
+        return array.array (self._type_code, len (self._buffer) * [0])
+
+
+    def bind (self, task):
+        """ Bind a consumer task to this record. Each time data is put into 
+        any field, the task's @c go() method is called.
+        @param task The consumer task, or @c None to unbind the record """
+
+        self._consumer = task
+
+
+    @micropython.native
+    def put (self, field, data, in_ISR = False):
+        """ Write data into one field of the record.
+        @param field The index of the field
+        @param data The data to be put into the field
+        @param in_ISR Set this to True if calling from within an ISR """
+
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        old = self._buffer[field]
+        self._buffer[field] = data
+        if self._buffer[field] != old:
+            self._version = (self._version + 1) & VERSION_MASK
+        self._puts += 1
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        # Tell the consumer task, if any, that there's new data
+        if self._consumer is not None:
+            self._consumer.go ()
+
+
+    @micropython.native
+    def get (self, field, in_ISR = False):
+        """ Read the data in one field of the record.
+        @param field The index of the field
+        @param in_ISR Set this to True if calling from within an ISR
+        @return The data in the field """
+
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        to_return = self._buffer[field]
+        self._gets += 1
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        return (to_return)
+
+
+    @micropython.native
+    def snapshot (self, buf, in_ISR = False):
+        """ Copy every field of the record into a buffer, with interrupts 
+        disabled once for the whole copy so that the values are consistent
+        with each other.
+        @param buf An array made by @c make_buffer()
+        @param in_ISR Set this to True if calling from within an ISR
+        @return The buffer, for convenience """
+
+        src = self._buffer
+
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        for idx in range (len (src)):
+            buf[idx] = src[idx]
+        self._gets += 1
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        return buf
+
+
+    @micropython.native
+    def version (self):
+        """ Get the version of the data in the record, which changes each 
+        time @c put() changes the data in any field.
+        @return The version, a small integer which wraps around """
+
+        return self._version
+
+
+    @micropython.native
+    def changed_since (self, version):
+        """ Check whether any field of the record has changed since the 
+        record had the given version.
+        @param version A version from an earlier call to @c version()
+        @return @c True if the data has changed, @c False if not """
+
+        return self._version != version
+
+
+    def reset_stats (self):
+        """ This method resets the counts of puts and gets; a snapshot 
+        counts as one get. It's also used by @c __init__() to create them. 
+        """
+
+        self._puts = 0
+        self._gets = 0
+
+
+    def __repr__ (self):
+        """ This method puts diagnostic information about the record into a 
         string. """
 
-        return ('{:<12s} Share'.format (self._name))
+        return ('{:<12s} Record {: 7d} fields PUT:{:d} GET:{:d}'.format (
+                self._name, len (self._buffer), self._puts, self._gets))
+
+
+# ============================================================================
+
+class Flags:
+    """ This class implements a flag register, a set of named boolean flags
+    which are packed into the bits of one word. It takes much less memory 
+    than a share for each flag, and several flags can be set, cleared or 
+    tested at once with a mask. Each operation is done with interrupts
+    disabled, so flags can be changed by ISR's and tasks without corrupting
+    one another's changes. There can be up to 30 flags, so that the word is
+    always one of MicroPython's small integers and using it never allocates
+    memory. 
+
+    Example:
+    @code
+    flags = task_share.Flags (('LTurn_Done', 'RTurn_Done'), name = 'Flags')
+    LTURN_DONE = flags.mask ('LTurn_Done')
+    RTURN_DONE = flags.mask ('RTurn_Done')
+
+    flags.set (LTURN_DONE | RTURN_DONE)
+    if flags.test (LTURN_DONE):
+        ...
+    if flags.read () & (LTURN_DONE | RTURN_DONE) == LTURN_DONE:
+        ...
+    @endcode """
+
+    ## A counter used to give serial numbers to flag registers for 
+    #  diagnostic use.
+    ser_num = 0
+
+    def __init__ (self, names, thread_protect = True, name = None,
+                  consumer = None):
+        """ Create a flag register with all its flags clear.
+        @param names A sequence of names for the flags, in order from the
+            least significant bit; there may be up to 30 of them
+        @param thread_protect True if mutual exclusion protection is used
+        @param name A short name for the register, default @c FlagsN where 
+            @c N is a serial number for the register
+        @param consumer A task which uses the flags and should be run 
+            whenever they are changed, or @c None
+        @raise ValueError if there are too many flags """
+
+        if len (names) > 30:
+            raise ValueError ('A flag register holds at most 30 flags')
+
+        self._fields = tuple (names)
+        self._type_code = 'I'
+        self._buffer = array.array ('I', [0])
+        self._thread_protect = thread_protect
+        self._consumer = consumer
+        self._version = 0
+        self.reset_stats ()
+        Flags.ser_num += 1
+
+        self._name = str (name) if name != None \
+            else 'Flags' + str (Flags.ser_num)
+
+        # Add this register to the global share and queue list
+        share_list.append (self)
+
+
+    def mask (self, name):
+        """ Find the mask for a flag from its name.
+        @param name The name of the flag
+        @return The mask, an integer with the flag's bit set """
+
+        return 1 << self._fields.index (name)
+
+
+    def bind (self, task):
+        """ Bind a consumer task to this register. Each time the flags are
+        changed, the task's @c go() method is called.
+        @param task The consumer task, or @c None to unbind the register """
+
+        self._consumer = task
+
+
+    @micropython.native
+    def change (self, set_mask, clear_mask, in_ISR = False):
+        """ Set some flags and clear others in one operation, so that no
+        task or ISR can see the register with only some of them changed.
+        @param set_mask The flags to be set, their masks or'ed together
+        @param clear_mask The flags to be cleared, their masks or'ed together
+        @param in_ISR Set this to True if calling from within an ISR """
+
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        old = self._buffer[0]
+        new = (old & ~clear_mask) | set_mask
+        self._buffer[0] = new
+        self._puts += 1
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        if new != old:
+            self._version = (self._version + 1) & VERSION_MASK
+            if self._consumer is not None:
+                self._consumer.go ()
+
+
+    def set (self, mask, in_ISR = False):
+        """ Set one or more flags.
+        @param mask The flags to be set, their masks or'ed together
+        @param in_ISR Set this to True if calling from within an ISR """
+
+        self.change (mask, 0, in_ISR)
+
+
+    def clear (self, mask, in_ISR = False):
+        """ Clear one or more flags.
+        @param mask The flags to be cleared, their masks or'ed together
+        @param in_ISR Set this to True if calling from within an ISR """
+
+        self.change (0, mask, in_ISR)
+
+
+    def put (self, word, in_ISR = False):
+        """ Write the whole register at once.
+        @param word The new value of every flag, one bit for each
+        @param in_ISR Set this to True if calling from within an ISR """
+
+        self.change (word, ~word, in_ISR)
+
+
+    @micropython.native
+    def read (self, in_ISR = False):
+        """ Read the whole register at once, so several flags can be tested
+        against a mask with one comparison.
+        @param in_ISR Set this to True if calling from within an ISR
+        @return The flags, one bit for each """
+
+        # Reading one word can't be corrupted by an interrupt
+        self._gets += 1
+        return self._buffer[0]
+
+
+    @micropython.native
+    def test (self, mask, in_ISR = False):
+        """ Check whether any of the given flags is set.
+        @param mask The flags to be tested, their masks or'ed together
+        @param in_ISR Set this to True if calling from within an ISR
+        @return @c True if any of the flags is set, @c False if none is """
+
+        self._gets += 1
+        return (self._buffer[0] & mask) != 0
+
+
+    @micropython.native
+    def version (self):
+        """ Get the version of the flags, which changes each time any flag
+        is changed.
+        @return The version, a small integer which wraps around """
+
+        return self._version
+
+
+    @micropython.native
+    def changed_since (self, version):
+        """ Check whether any flag has changed since the register had the 
+        given version.
+        @param version A version from an earlier call to @c version()
+        @return @c True if any flag has changed, @c False if not """
+
+        return self._version != version
+
+
+    def reset_stats (self):
+        """ This method resets the counts of changes and reads. It's also 
+        used by @c __init__() to create them. """
+
+        self._puts = 0
+        self._gets = 0
+
+
+    def __repr__ (self):
+        """ This method puts diagnostic information about the register, 
+        including the names of the flags which are set, into a string. """
+
+        word = self._buffer[0]
+        names = [self._fields[bit] for bit in range (len (self._fields))
+                 if word & (1 << bit)]
+        return ('{:<12s} Flags {: 8d} flags PUT:{:d} GET:{:d} SET:{:s}'.format (
+                self._name, len (self._fields), self._puts, self._gets,
+                ','.join (names) if names else '-'))
+
+
+# ============================================================================
+
+class Watch:
+    """ This class keeps track of the versions of a set of shares and records
+    which a task has last acted upon, so that the task can skip work, such 
+    as recomputing outputs and writing them to hardware, when none of its
+    inputs have changed. The numbers of times the inputs were found changed
+    and unchanged are counted so that the saving can be measured; they are
+    shown by @c show_all().
+
+    Example:
+    @code
+    inputs = task_share.Watch ((motor_state, setpoint), name = 'Motor_In')
+    while True:
+        if inputs.changed ():
+            ...compute and write the outputs...
+        yield (0)
+    @endcode """
+
+    def __init__ (self, items, name = None):
+        """ Create a watch over some shares and records. The first call to
+        @c changed() always finds them changed.
+        @param items A sequence of shares and records to watch
+        @param name A short name for the watch, used in diagnostic output """
+
+        self._items = tuple (items)
+
+        # The versions which were seen the last time; -1 is never a version
+        self._seen = array.array ('i', len (self._items) * [-1])
+
+        self._name = str (name) if name != None else 'Watch'
+
+        ## The number of calls to @c changed() which found a change
+        self.changes = 0
+
+        ## The number of calls to @c changed() which found no change, each
+        #  of which is a time that work could be skipped
+        self.skips = 0
+
+        share_list.append (self)
+
+
+    @micropython.native
+    def changed (self):
+        """ Check whether any of the watched shares or records has changed 
+        since the last call, and remember their current versions.
+        @return @c True if anything has changed, @c False if not """
+
+        items = self._items
+        seen = self._seen
+        changed = False
+        for idx in range (len (items)):
+            version = items[idx]._version
+            if version != seen[idx]:
+                seen[idx] = version
+                changed = True
+
+        if changed:
+            self.changes += 1
+        else:
+            self.skips += 1
+        return changed
+
+
+    def __repr__ (self):
+        """ This method puts diagnostic information about the watch into a 
+        string. """
 
+        return ('{:<12s} Watch {: 8d} items CHANGED:{:d} SKIPPED:{:d}'.format (
+                self._name, len (self._items), self.changes, self.skips))
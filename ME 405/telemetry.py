@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+## @file telemetry.py
+#  This file contains a class which sends the values held in shares and
+#  records out the serial port as compact binary frames, so that the robot's
+#  state can be logged at full rate without formatting text on the board.
+#  Frames are kept small so that logging on every run of a 50 Hz task costs a
+#  few hundred bytes per second: yes-or-no values are sent one bit each, and
+#  a share may be sent in fewer bytes than it holds, in which case its value 
+#  is sent modulo the smaller size, as the low bits of a tick count are. Each
+#  frame is packed into a buffer which is allocated ahead of time and is
+#  put into the print task's queue, so sending a frame never blocks; if there
+#  isn't room in the queue for the whole frame, the frame is dropped and
+#  counted rather than being sent in part.
+#
+#  A frame holds, in little-endian byte order:
+#  * the sync byte @c 0xAA
+#  * an 8-bit sequence number, so that the receiver can count lost frames
+#  * the low 16 bits of the time in milliseconds from @c utime.ticks_ms()
+#  * the value of each share and each field of each record, packed with the
+#    share's own type code or the one chosen for it; the fields of a record
+#    chosen to be sent as bits, and the flags of a flag register, are packed
+#    into one word with a bit for each
+#  * an 8-bit checksum, the sum of the bytes from the sequence number to the
+#    last value
+#
+#  Before the first frame a text header line is written, beginning with
+#  @c "#TLM ", which gives the @c struct format of the frames and the names of
+#  the values, with the names of the bits of a word of bits in brackets after
+#  its name, as in @c "Sensors[IR_ON_OFF|Left Front Sensor]"; 
+#  @c host/telemetry_decode.py uses it to turn a saved stream into columns.
+#
+#    Example code:
+#    @code
+#    telem = telemetry.Telemetry ((motor_state, sensors), 
+#                                 codes = {motor_state: 'B'}, 
+#                                 bits = (sensors, ))
+#    telem.start ()
+#
+#    # In a task's loop:
+#    telem.send ()
+#    @endcode
+#
+#  @copyright This program is released under the GNU Public License,
+#  version 3.0.
+
+import struct
+import utime
+import micropython
+import task_share
+import print_task
+
+
+## The byte at the start of each frame which marks where the frame begins
+SYNC = const (0xAA)
+
+## The format of the start of each frame: sync byte, sequence number and time
+HEAD_FORMAT = '<BBH'
+
+# The unsigned struct type codes of words of 1, 2 and 4 bytes, with which 
+# values of the integer type codes of those sizes are packed after masking
+_UNSIGNED = {1: 'B', 2: 'H', 4: 'I'}
+
+# The type codes of integers which are sent modulo their size; other codes,
+# those of floats and of 8-byte integers, are packed as they are
+_INTEGERS = 'bBhHiIlL'
+
+# The type codes of floating point numbers
+_FLOATS = 'fd'
+
+
+@micropython.native
+def checksum (frame):
+    """ Compute a frame's checksum, the low byte of the sum of the bytes after
+    the sync byte and before the checksum itself.
+    @param frame The packed frame
+    @return The checksum, from 0 to 255 """
+
+    total = 0
+    for idx in range (1, len (frame) - 1):
+        total += frame[idx]
+    return total & 0xFF
+
+
+class Telemetry:
+    """ This class packs the values held in a set of shares and records into
+    binary frames and sends them through the print task's queue. """
+
+    def __init__ (self, items = None, every = 1, codes = None, bits = ()):
+        """ Work out the layout of the frames and allocate a buffer for them.
+        @param items A sequence of @c task_share.Share, @c task_share.Record
+            and @c task_share.Flags objects whose values are sent, or @c None
+            to send every one of them in @c task_share.share_list; a flag 
+            register is sent as a word with a bit for each flag
+        @param every Send one frame for each this many calls to @c send(),
+            so that a task can log at a fraction of its own rate
+        @param codes A dictionary giving the struct type code with which some 
+            of the shares and records are sent, such as @c 'B' for a share 
+            of type @c 'I' whose values are always small; values which don't
+            fit are sent modulo the size of the code. Integer shares must be
+            given integer codes and floating point shares floating point ones
+        @param bits A sequence of records whose fields are all yes-or-no 
+            values, which are each sent as one bit of a word 
+        @raise ValueError if an integer share is given a floating point code
+            or a floating point share an integer one """
+
+        if items is None:
+            items = [item for item in task_share.share_list
+                     if isinstance (item, (task_share.Share, task_share.Record,
+                                           task_share.Flags))]
+        if codes is None:
+            codes = {}
+
+        # For each value, the array holding it, the index of the value or of
+        # the first of the fields sent as bits, the number of such fields
+        # (0 for a value), the struct format with which it's packed, its 
+        # place in the frame and the mask which keeps it within its size, or
+        # 0 if it isn't masked
+        layout = []
+        names = []
+        fmt = HEAD_FORMAT
+        offset = struct.calcsize (fmt)
+        for item in items:
+            if isinstance (item, task_share.Record):
+                labels = item._fields
+            else:
+                labels = (item._name, )
+
+            # A word of bits is just big enough to hold them all
+            if item in bits or isinstance (item, task_share.Flags):
+                fields = item._fields
+                type_code = 'B' if len (fields) <= 8 else (
+                    'H' if len (fields) <= 16 else 'I')
+                labels = ('{:s}[{:s}]'.format (item._name, '|'.join (fields)),)
+                count = len (fields) if item in bits else 0
+            else:
+                type_code = codes.get (item, item._type_code)
+                count = 0
+                if (type_code in _FLOATS) != (item._type_code in _FLOATS):
+                    raise ValueError ('{:s} of type {:s} can\'t be sent as {:s}'
+                                      .format (item._name, item._type_code,
+                                               type_code))
+
+            size = struct.calcsize ('<' + type_code)
+            if type_code in _INTEGERS:
+                code = '<' + _UNSIGNED[size]
+                mask = (1 << (8 * size)) - 1
+            else:
+                code = '<' + type_code
+                mask = 0
+            for idx in range (len (labels)):
+                layout.append ((item._buffer, idx, count, code, offset, mask))
+                names.append (labels[idx])
+                fmt += type_code
+                offset += size
+        fmt += 'B'
+
+        self._layout = tuple (layout)
+        self._frame = bytearray (struct.calcsize (fmt))
+        self._every = every
+        self._count = 0
+        self._seq = 0
+
+        # The header line which tells a receiver how to decode the frames
+        self._header = '#TLM {:s} {:s}\n'.format (fmt, ','.join (names))
+
+        ## The number of frames which didn't fit into the print queue
+        self.dropped = 0
+
+
+    def start (self):
+        """ Write the header line which describes the frames. The header is
+        written straight to the print task's output stream, as it's longer
+        than the print queue; this should be done once, before the tasks are
+        started. """
+
+        print_task.out_stream.write (self._header.encode ())
+
+
+    def send (self):
+        """ Pack the current values into a frame and put it into the print
+        queue, if this is a call on which a frame is to be sent. The values
+        are read one at a time without disabling interrupts, so a frame may
+        mix values from before and after an interrupt which changes them.
+        @return @c True if a frame was put into the queue, @c False if not """
+
+        self._count += 1
+        if self._count < self._every:
+            return False
+        self._count = 0
+
+        frame = self._frame
+        struct.pack_into (HEAD_FORMAT, frame, 0, SYNC, self._seq,
+                          utime.ticks_ms () & 0xFFFF)
+        for buf, idx, count, code, offset, mask in self._layout:
+            if count:
+                value = 0
+                for bit in range (count):
+                    if buf[idx + bit]:
+                        value |= 1 << bit
+            else:
+                value = buf[idx]
+            if mask:
+                value &= mask
+            struct.pack_into (code, frame, offset, value)
+        frame[-1] = checksum (frame)
+        self._seq = (self._seq + 1) & 0xFF
+
+        if print_task.print_queue.room () < len (frame):
+            self.dropped += 1
+            return False
+        print_task.put_bytes (frame)
+        return True
+
+
+    def __repr__ (self):
+        """ This method puts diagnostic information about the telemetry into
+        a string. """
+
+        return ('Telemetry {:d} bytes/frame, {:d} values, {:d} dropped'.format
+                (len (self._frame), len (self._layout), self.dropped))